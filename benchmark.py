@@ -0,0 +1,279 @@
+"""
+Benchmark every assignment strategy on synthetic fleets.
+
+    python benchmark.py --scale 100x10 --scale 1000x50 --output bench.json
+    python benchmark.py --baseline bench.json   # exit 1 on regressions
+
+Each scale is ORDERSxVEHICLES. Every (scale, strategy) run happens in a
+freshly spawned process, and peak_rss_mb is how far the run raised the
+peak RSS of that process or of any solver worker it forked (multi-start,
+decomposition, compare) above its footprint once imports are done; the
+report is JSON.
+"""
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import ortools
+
+from distance_matrix import build_distance_matrices, resolve_dtype
+from problem_model import Problem
+from planning import COMPARABLE_STRATEGIES, payload_metric, prepare_data, score_plan
+
+
+DEFAULT_SCALES = ["10x5", "100x10", "1000x50"]
+DEFAULT_TIME_LIMIT_SECONDS = 10
+# Relative slack before a metric counts as a regression against a baseline
+DEFAULT_TOLERANCE = 0.25
+# Metrics compared against a baseline (lower is better for all of them), each
+# with an absolute floor so tiny runs do not flag noise
+REGRESSION_METRICS = {"wall_seconds": 0.05, "peak_rss_mb": 10, "total_km": 1, "unassigned_count": 1}
+
+# Synthetic fleets are laid out around Dobrich, like the captured results.json
+CENTER = (43.5667, 27.8333)
+AREA_RADIUS_KM = 25
+KM_PER_DEGREE = 111.32
+
+
+# ---------------- Synthetic Fleet ----------------
+def _scatter(rng, centers: np.ndarray, count: int, spread_km: float) -> np.ndarray:
+    """count points around randomly picked centers, normally spread by spread_km"""
+    picked = centers[rng.integers(len(centers), size=count)]
+    offsets = rng.normal(0, spread_km / KM_PER_DEGREE, size=(count, 2))
+    offsets[:, 1] /= math.cos(math.radians(CENTER[0]))
+    return np.round(picked + offsets, 6)
+
+
+def generate_payload(num_orders: int, num_vehicles: int, seed: int = 0, num_products: int = 40) -> dict:
+    """
+    /ortools/optimize payload with one van per warehouse. Orders cluster
+    around a handful of towns; vans carry a partial random product mix so
+    inventory-aware strategies leave some orders unassigned, and total van
+    capacity roughly matches total demand.
+    """
+    rng = np.random.default_rng(seed)
+    num_towns = max(3, int(math.sqrt(num_orders) / 3))
+    towns = _scatter(rng, np.array([CENTER]), num_towns, AREA_RADIUS_KM / 2)
+    order_coords = _scatter(rng, towns, num_orders, 2.5)
+    warehouse_coords = _scatter(rng, towns, num_vehicles, 5)
+    product_ids = list(range(1, num_products + 1))
+    # A few best sellers make up most order lines
+    popularity = 1 / np.arange(1, num_products + 1)
+    popularity /= popularity.sum()
+
+    orders = []
+    total_demand = 0
+    for idx in range(num_orders):
+        lines = rng.choice(product_ids, size=int(rng.integers(1, 5)), replace=False, p=popularity)
+        items = [{'product_id': int(product_id), 'product_name': f"Product {product_id}",
+                  'quantity': int(rng.integers(1, 4))} for product_id in lines]
+        total_demand += sum(item['quantity'] for item in items)
+        order = {
+            'order_id': 100000 + idx,
+            'order_no': f"SO-{100000 + idx}",
+            'client_object_name': f"Client {idx}",
+            'client_object_address': f"Street {idx % 200 + 1}",
+            'client_phone': f"0888{idx:06d}",
+            'client_object_latitude': float(order_coords[idx, 0]),
+            'client_object_longitude': float(order_coords[idx, 1]),
+            'order_items': items,
+            'priority': int(rng.choice([1, 3, 5, 5, 5, 8])),
+        }
+        if rng.random() < 0.2:
+            start = int(rng.integers(0, 480))
+            order['time_window'] = [start, start + 120]
+        orders.append(order)
+
+    average_capacity = max(int(1.1 * total_demand / num_vehicles), 10)
+    warehouses = []
+    for idx in range(num_vehicles):
+        stocked = rng.choice(product_ids, size=max(num_products * 2 // 3, 1), replace=False, p=popularity)
+        capacity = int(average_capacity * rng.uniform(0.7, 1.3))
+        warehouses.append({
+            'id': idx + 1,
+            'name': f"Van {idx + 1}",
+            'vehicle_name': f"TX{1000 + idx}",
+            'driver_name': f"Driver {idx + 1}",
+            'latitude': float(warehouse_coords[idx, 0]),
+            'longitude': float(warehouse_coords[idx, 1]),
+            'capacity': capacity,
+            'pre_assigned_load': int(capacity * rng.uniform(0, 0.2)),
+            'products': [{'product_id': int(product_id), 'quantity': int(rng.integers(5, 60))}
+                         for product_id in sorted(stocked)],
+        })
+
+    return {'warehouses': warehouses, 'orders': orders}
+
+
+def parse_scale(scale: str) -> tuple:
+    """'1000x50' -> (1000 orders, 50 vehicles)"""
+    try:
+        num_orders, num_vehicles = (int(part) for part in scale.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid scale {scale!r}, expected ORDERSxVEHICLES")
+    if num_orders < 1 or num_vehicles < 1:
+        raise argparse.ArgumentTypeError(f"Invalid scale {scale!r}, both counts must be positive")
+    return num_orders, num_vehicles
+
+
+# ---------------- Runs ----------------
+def run_strategy(num_orders: int, num_vehicles: int, strategy: str, seed: int, solver_params: dict) -> dict:
+    """One benchmark run as a job would do it: parse, build matrices, assign, score"""
+    payload = generate_payload(num_orders, num_vehicles, seed)
+    started = time.perf_counter()
+    problem = Problem.from_payload(payload)
+    matrices = build_distance_matrices(problem.warehouse_coords, problem.order_coords,
+                                       resolve_dtype(problem.options.get('matrix_dtype')),
+                                       payload_metric(problem.options))
+    result = prepare_data(problem, strategy, matrices=matrices, solver_params=solver_params)
+    wall_seconds = time.perf_counter() - started
+    row = score_plan(problem, matrices, strategy, result, round(wall_seconds, 3))
+    row['wall_seconds'] = row.pop('runtime_seconds')
+    return row
+
+
+def peak_rss_mb() -> float:
+    """Largest peak RSS of this process and its finished worker processes"""
+    # ru_maxrss is in KiB on Linux; for RUSAGE_CHILDREN it is the largest single child
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def _run_child(conn, *args):
+    try:
+        baseline = peak_rss_mb()
+        # Strategy logging goes to stderr; stdout may be carrying the report
+        with contextlib.redirect_stdout(sys.stderr):
+            row = run_strategy(*args)
+        row['peak_rss_mb'] = round(peak_rss_mb() - baseline, 1)
+        row['baseline_rss_mb'] = round(baseline, 1)
+        conn.send(row)
+    except Exception as e:
+        conn.send({'error': str(e)})
+    finally:
+        conn.close()
+
+
+def run_isolated(num_orders: int, num_vehicles: int, strategy: str, seed: int, solver_params: dict,
+                 timeout: float) -> dict:
+    """run_strategy in a spawned process, so peak RSS holds none of the parent's pages"""
+    ctx = multiprocessing.get_context("spawn")
+    reader, writer = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_child,
+                          args=(writer, num_orders, num_vehicles, strategy, seed, solver_params))
+    process.start()
+    writer.close()
+    try:
+        row = reader.recv() if reader.poll(timeout) else {'error': f"timed out after {timeout:.0f}s"}
+    except EOFError:
+        row = None
+    if process.is_alive():
+        process.terminate()
+    process.join()
+    if row is None:
+        row = {'error': f"worker exited with code {process.exitcode}"}
+    return {'orders': num_orders, 'vehicles': num_vehicles, 'strategy': strategy, **row}
+
+
+def run_benchmark(scales: List[tuple], strategies: List[str], seed: int, solver_params: dict,
+                  timeout: float) -> dict:
+    runs = []
+    for num_orders, num_vehicles in scales:
+        for strategy in strategies:
+            row = run_isolated(num_orders, num_vehicles, strategy, seed, solver_params, timeout)
+            runs.append(row)
+            summary = row.get('error') or (f"{row['wall_seconds']:.3f}s, {row['peak_rss_mb']} MB, "
+                                           f"{row['total_km']} km, {row['unassigned_count']} unassigned")
+            print(f"{num_orders:>6} orders x {num_vehicles:>4} vans  {strategy:<24} {summary}", file=sys.stderr)
+
+    return {
+        'generated_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'seed': seed,
+        'solver_params': solver_params,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'ortools': ortools.__version__,
+            'cpu_count': os.cpu_count(),
+            'platform': platform.platform(),
+        },
+        'runs': runs,
+    }
+
+
+# ---------------- Regression Check ----------------
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """Runs whose metrics got worse than the baseline's by more than tolerance (relative)"""
+    previous: Dict[tuple, dict] = {
+        (row['orders'], row['vehicles'], row['strategy']): row for row in baseline.get('runs', [])
+    }
+    regressions = []
+    for row in report['runs']:
+        before = previous.get((row['orders'], row['vehicles'], row['strategy']))
+        if before is None or 'error' in before:
+            continue
+        run = {'orders': row['orders'], 'vehicles': row['vehicles'], 'strategy': row['strategy']}
+        if 'error' in row:
+            regressions.append({**run, 'metric': 'error', 'baseline': None, 'current': row['error']})
+            continue
+        for metric, floor in REGRESSION_METRICS.items():
+            old, new = before.get(metric), row.get(metric)
+            if old is not None and new is not None and new > old * (1 + tolerance) + floor:
+                regressions.append({**run, 'metric': metric, 'baseline': old, 'current': new})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark assignment strategies on synthetic fleets")
+    parser.add_argument("--scale", action="append", type=parse_scale,
+                        help=f"ORDERSxVEHICLES, repeatable (default: {' '.join(DEFAULT_SCALES)})")
+    parser.add_argument("--strategy", action="append", choices=COMPARABLE_STRATEGIES,
+                        help="strategy to run, repeatable (default: all)")
+    parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT_SECONDS,
+                        help="OR-Tools time_limit_seconds")
+    parser.add_argument("--solver-params", type=json.loads, default={},
+                        help="extra solver_params as JSON, e.g. '{\"decomposition\": \"warehouse\"}'")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds per run before it is killed (default: 3x time limit + 60)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous report to compare against; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    scales = args.scale or [parse_scale(scale) for scale in DEFAULT_SCALES]
+    strategies = args.strategy or COMPARABLE_STRATEGIES
+    solver_params = {**args.solver_params, 'time_limit_seconds': args.time_limit}
+    timeout = args.timeout or 3 * args.time_limit + 60
+
+    report = run_benchmark(scales, strategies, args.seed, solver_params, timeout)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = find_regressions(report, json.load(f), args.tolerance)
+        for regression in report['regressions']:
+            print(f"REGRESSION {regression['orders']}x{regression['vehicles']} {regression['strategy']} "
+                  f"{regression['metric']}: {regression['baseline']} -> {regression['current']}", file=sys.stderr)
+        exit_code = 1 if report['regressions'] else 0
+
+    encoded = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(encoded + "\n")
+    else:
+        print(encoded)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,415 @@
+import math
+import multiprocessing
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from job_runner import reset_sigterm
+from routing_solver import schedule_arrivals, solve_vrp, travel_minutes
+
+
+KMEANS_ITERATIONS = 25
+# Share of the time limit left for boundary repair after the cluster solves
+REPAIR_BUDGET_SHARE = 0.1
+REPAIR_PASSES = 2
+# Shortest search a cluster gets, however many waves share the time limit:
+# below it small clusters may not reach a first solution
+MIN_CLUSTER_SECONDS = 1.0
+# An order sits on a cluster boundary when a warehouse of another cluster is
+# at most this many times farther away than the nearest one of its own
+BOUNDARY_RATIO = 1.5
+# Vans of other clusters tried per boundary or dropped order
+REPAIR_NEIGHBORS = 3
+
+# Per-location fields of the routing data model, sliced for each cluster
+NODE_FIELDS = ('locations', 'demands', 'service_times', 'time_windows', 'priorities', 'allowed_vehicles',
+               'departures')
+
+# Inputs of running decomposed solves, inherited by the forked cluster workers
+_CLUSTER_INPUTS = {}
+
+
+# ---------------- Partitioning ----------------
+def _planar(coords: np.ndarray, reference_lat: float) -> np.ndarray:
+    """Equirectangular projection, good enough to cluster within a city"""
+    coords = np.asarray(coords, dtype=np.float64)
+    return np.column_stack([coords[:, 0], coords[:, 1] * math.cos(math.radians(reference_lat))])
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """Lloyd's k-means with k-means++ seeding; the seed is fixed so partitions repeat. Returns (labels, centers)"""
+    rng = np.random.default_rng(0)
+    centers = [points[rng.integers(len(points))]]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        idx = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers.append(points[idx])
+        closest = np.minimum(closest, ((points - points[idx]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+
+    for _ in range(iterations):
+        labels = np.argmin(((points[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2), axis=1)
+        moved = np.array([points[labels == c].mean(axis=0) if np.any(labels == c) else centers[c]
+                          for c in range(k)])
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+    labels = np.argmin(((points[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2), axis=1)
+    return labels, centers
+
+
+def partition_orders(matrices, params: dict, pinned: np.ndarray | None = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Split a problem into (warehouse indices, order indices) clusters of
+    about cluster_max_orders orders. 'warehouse' groups warehouses with
+    k-means and sends each order with its nearest warehouse, as the greedy
+    strategies do; 'kmeans' clusters the orders themselves and gives each
+    cluster the warehouses nearest its center. Orders pinned to a warehouse
+    (pinned >= 0) always go with it. A single cluster means the problem is
+    solved whole.
+    """
+    num_warehouses = len(matrices.warehouse_coords)
+    num_orders = len(matrices.order_coords)
+    k = min(math.ceil(num_orders / int(params['cluster_max_orders'])), num_warehouses)
+    if params['decomposition'] == 'off' or k <= 1:
+        return [(np.arange(num_warehouses), np.arange(num_orders))]
+
+    reference_lat = float(matrices.order_coords[:, 0].mean())
+    warehouse_points = _planar(matrices.warehouse_coords, reference_lat)
+    home = np.argmin(matrices.warehouse_to_order, axis=0)
+
+    if params['decomposition'] == 'kmeans':
+        order_labels, centers = kmeans(_planar(matrices.order_coords, reference_lat), k)
+        warehouse_labels = np.argmin(
+            ((warehouse_points[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2), axis=1)
+        # Orders of a cluster that got no van follow their nearest warehouse
+        order_labels = np.where(np.isin(order_labels, warehouse_labels), order_labels, warehouse_labels[home])
+    else:
+        warehouse_labels, _ = kmeans(warehouse_points, k)
+        order_labels = warehouse_labels[home]
+    if pinned is not None:
+        order_labels = np.where(pinned >= 0, warehouse_labels[np.maximum(pinned, 0)], order_labels)
+
+    return [(np.flatnonzero(warehouse_labels == c), np.flatnonzero(order_labels == c))
+            for c in range(k) if np.any(warehouse_labels == c)]
+
+
+# ---------------- Cluster Solves ----------------
+def cluster_routing_data(data: dict, matrices, params: dict, warehouses: np.ndarray,
+                         orders: np.ndarray) -> Tuple[dict, np.ndarray]:
+    """Routing data model of one cluster, and its locations as full-problem nodes"""
+    nodes = np.concatenate([warehouses, data['num_warehouses'] + orders])
+    distance_matrix = matrices.location_submatrix(nodes)
+    node_list = nodes.tolist()
+    cluster = {field: [data[field][node] for node in node_list] for field in NODE_FIELDS}
+    # Pinned orders share their van's cluster; renumber the van as a cluster vehicle
+    vehicle_of_warehouse = {wh_idx: vehicle for vehicle, wh_idx in enumerate(warehouses.tolist())}
+    cluster['allowed_vehicles'] = [vehicle_of_warehouse[vehicle] if vehicle >= 0 else -1
+                                   for vehicle in cluster['allowed_vehicles']]
+    cluster.update({
+        'distance_matrix': distance_matrix,
+        'time_matrix': travel_minutes(distance_matrix, params, data['traffic'], cluster['departures']),
+        'capacities': [data['capacities'][wh_idx] for wh_idx in warehouses.tolist()],
+        'num_vehicles': len(warehouses),
+        'depot_indices': list(range(len(warehouses))),
+        'num_warehouses': len(warehouses),
+        'horizon': data['horizon'],
+    })
+    return cluster, nodes
+
+
+def solve_cluster(inputs_id: str, cluster_idx: int) -> dict:
+    """Worker side of solve_decomposed: one sub-VRP, mapped back to full-problem nodes"""
+    data, matrices, params, clusters = _CLUSTER_INPUTS[inputs_id]
+    warehouses, orders = clusters[cluster_idx]
+    cluster, nodes = cluster_routing_data(data, matrices, params, warehouses, orders)
+    solution = solve_vrp(cluster, params)
+    return {
+        'routes': {int(warehouses[route['vehicle_id']]): [int(nodes[stop['node']]) for stop in route['stops'][1:-1]]
+                   for route in solution['routes']},
+        'dropped_nodes': [int(nodes[node]) for node in solution['dropped_nodes']],
+        'objective': solution['objective'],
+        'solutions_found': solution['solutions_found'],
+    }
+
+
+def solve_decomposed(data: dict, matrices, params: dict, clusters: List[Tuple[np.ndarray, np.ndarray]],
+                     report: Callable | None = None, should_stop: Callable | None = None) -> dict:
+    """
+    Solve every cluster as its own VRP in parallel forked workers, then
+    repair the cluster boundaries. The time limit covers the whole solve:
+    the cluster searches share all but REPAIR_BUDGET_SHARE of it, so
+    clusters that have to wait for a free worker get a proportionally
+    shorter search (at least MIN_CLUSTER_SECONDS), and repair stops at the
+    deadline. Orders of clusters that fail or are not solved in time are
+    dropped for the repair to re-insert. Returns the same shape as
+    solve_vrp, plus per-cluster stats.
+    """
+    should_stop = should_stop or (lambda: False)
+    started = time.monotonic()
+    time_limit = float(params['time_limit_seconds'])
+    deadline = started + time_limit
+    search_deadline = started + time_limit * (1 - REPAIR_BUDGET_SHARE)
+    busy = [idx for idx, (_, orders) in enumerate(clusters) if len(orders)]
+
+    # Daemonic pool workers (compare mode) cannot fork: solve clusters one by one
+    in_process = multiprocessing.current_process().daemon
+    workers = 1 if in_process else max(min(len(busy), os.cpu_count() or 1), 1)
+    waves = math.ceil(len(busy) / workers) if busy else 1
+    cluster_params = {**params, 'time_limit_seconds': max((search_deadline - started) / waves, MIN_CLUSTER_SECONDS)}
+
+    print(f"Decomposition: {len(clusters)} clusters, {workers} workers, {cluster_params['time_limit_seconds']:.1f}s each")
+
+    inputs_id = uuid.uuid4().hex
+    _CLUSTER_INPUTS[inputs_id] = (data, matrices, cluster_params, clusters)
+    solved = {}
+    failed = []
+    pool = None
+    try:
+        if in_process:
+            for cluster_idx in busy:
+                if should_stop():
+                    raise RuntimeError("Decomposed solve stopped")
+                if time.monotonic() >= search_deadline:
+                    break
+                try:
+                    solved[cluster_idx] = solve_cluster(inputs_id, cluster_idx)
+                except RuntimeError as e:
+                    print(f"ERROR solving cluster {cluster_idx}: {e}")
+                    failed.append(cluster_idx)
+                if report:
+                    report(progress=10 + 80 * (len(solved) + len(failed)) // len(busy))
+        else:
+            pool = multiprocessing.get_context("fork").Pool(workers, initializer=reset_sigterm)
+            pending = {cluster_idx: pool.apply_async(solve_cluster, (inputs_id, cluster_idx)) for cluster_idx in busy}
+            # Searches that overrun their limit may eat into the repair share, never past the deadline
+            while pending and time.monotonic() < deadline:
+                if should_stop():
+                    raise RuntimeError("Decomposed solve stopped")
+                for cluster_idx, async_result in list(pending.items()):
+                    if async_result.ready():
+                        del pending[cluster_idx]
+                        try:
+                            solved[cluster_idx] = async_result.get()
+                        except RuntimeError as e:
+                            print(f"ERROR solving cluster {cluster_idx}: {e}")
+                            failed.append(cluster_idx)
+                        if report:
+                            report(progress=10 + 80 * (len(solved) + len(failed)) // len(busy))
+                time.sleep(0.05)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        _CLUSTER_INPUTS.pop(inputs_id, None)
+
+    routes = {vehicle_id: [] for vehicle_id in range(data['num_vehicles'])}
+    dropped = []
+    for cluster in solved.values():
+        routes.update(cluster['routes'])
+        dropped.extend(cluster['dropped_nodes'])
+    unsolved = [idx for idx in busy if idx not in solved]
+    if len(unsolved) > len(failed):
+        print(f"Decomposition: {len(unsolved) - len(failed)} clusters not solved within the time limit, "
+              f"their orders are dropped")
+    for cluster_idx in unsolved:
+        dropped.extend((data['num_warehouses'] + clusters[cluster_idx][1]).tolist())
+
+    repair = BoundaryRepair(data, matrices, params, clusters, routes)
+    moves = repair.run(dropped, deadline, should_stop)
+    solution = repair.solution()
+    solution.update({
+        'solutions_found': sum(cluster['solutions_found'] for cluster in solved.values()),
+        'solve_seconds': round(time.monotonic() - started, 3),
+        'warm_started': False,
+        'clusters': [{
+            'warehouses': len(warehouses),
+            'orders': len(orders),
+            'objective': solved[idx]['objective'] if idx in solved else 0,
+        } for idx, (warehouses, orders) in enumerate(clusters)],
+        'repair_moves': moves,
+    })
+    return solution
+
+
+# ---------------- Boundary Repair ----------------
+class BoundaryRepair:
+    """
+    Relocates orders between vans of neighbouring clusters once each
+    cluster has been solved on its own, and re-inserts dropped orders.
+    A move is taken when it lowers the full model's objective (distance,
+    the balance term on the longest route, drop penalties) and keeps the
+    target route within capacity, time windows and the horizon.
+    """
+
+    def __init__(self, data: dict, matrices, params: dict, clusters, routes: Dict[int, List[int]]):
+        self.data = data
+        self.matrices = matrices
+        self.params = params
+        self.routes = routes
+        self.num_warehouses = data['num_warehouses']
+        self.balance = int(params['balance_coefficient'])
+        self.cluster_of_order = np.empty(len(matrices.order_coords), dtype=np.int64)
+        self.cluster_of_warehouse = np.empty(self.num_warehouses, dtype=np.int64)
+        for idx, (warehouses, orders) in enumerate(clusters):
+            self.cluster_of_warehouse[warehouses] = idx
+            self.cluster_of_order[orders] = idx
+        self.vehicle_of = {node: vehicle_id for vehicle_id, stops in routes.items() for node in stops}
+        self.loads = {vehicle_id: sum(data['demands'][node] for node in stops) for vehicle_id, stops in routes.items()}
+        self.lengths = {vehicle_id: self.route_length(vehicle_id, stops) for vehicle_id, stops in routes.items()}
+
+    def legs(self, from_nodes, to_nodes) -> np.ndarray:
+        return np.rint(self.matrices.leg_distances(from_nodes, to_nodes)).astype(np.int64)
+
+    def route_length(self, vehicle_id: int, stops: List[int]) -> int:
+        sequence = [vehicle_id] + stops + [vehicle_id]
+        return int(self.legs(sequence[:-1], sequence[1:]).sum())
+
+    def schedule(self, vehicle_id: int, stops: List[int], strict: bool = True) -> List[int] | None:
+        """Arrival minute at every node of depot -> stops -> depot; None if strict and a window or the horizon is missed"""
+        sequence = [vehicle_id] + stops + [vehicle_id]
+        return schedule_arrivals(self.data, self.params, sequence, self.legs(sequence[:-1], sequence[1:]).tolist(),
+                                 strict=strict)
+
+    def neighbor_vans(self, node: int) -> List[int]:
+        """Nearest warehouses of other clusters, by the warehouse -> order distances"""
+        order_idx = node - self.num_warehouses
+        distances = self.matrices.warehouse_to_order[:, order_idx]
+        others = np.flatnonzero(self.cluster_of_warehouse != self.cluster_of_order[order_idx])
+        return others[np.argsort(distances[others], kind='stable')[:REPAIR_NEIGHBORS]].tolist()
+
+    def boundary_orders(self) -> List[int]:
+        """Assigned orders with another cluster's warehouse within BOUNDARY_RATIO of their own nearest"""
+        distances = self.matrices.warehouse_to_order
+        same = self.cluster_of_warehouse[:, np.newaxis] == self.cluster_of_order[np.newaxis, :]
+        own = np.where(same, distances, np.inf).min(axis=0)
+        other = np.where(same, np.inf, distances).min(axis=0)
+        boundary = set((np.flatnonzero(other <= BOUNDARY_RATIO * own) + self.num_warehouses).tolist())
+        # Pinned split-delivery sub-orders stay with their van
+        return sorted(node for node in self.vehicle_of if node in boundary and self.data['allowed_vehicles'][node] < 0)
+
+    def max_length_with(self, changed: Dict[int, int]) -> int:
+        return max({**self.lengths, **changed}.values())
+
+    def best_insertion(self, node: int, vehicle_ids: List[int]) -> Tuple[int, int, int, int] | None:
+        """(objective increase without balance term, vehicle, position, new length) of the cheapest feasible insertion"""
+        demand = self.data['demands'][node]
+        best = None
+        for vehicle_id in vehicle_ids:
+            if self.loads[vehicle_id] + demand > self.data['capacities'][vehicle_id]:
+                continue
+            stops = self.routes[vehicle_id]
+            before = [vehicle_id] + stops
+            after = stops + [vehicle_id]
+            added = self.legs(before, [node] * len(before)) + self.legs([node] * len(after), after) - \
+                self.legs(before, after)
+            for position in np.argsort(added, kind='stable').tolist():
+                if best is not None and added[position] >= best[0]:
+                    break
+                if self.schedule(vehicle_id, stops[:position] + [node] + stops[position:]) is not None:
+                    best = (int(added[position]), vehicle_id, position, self.lengths[vehicle_id] + int(added[position]))
+                    break
+        return best
+
+    def insert(self, node: int, vehicle_id: int, position: int, length: int):
+        self.routes[vehicle_id].insert(position, node)
+        self.vehicle_of[node] = vehicle_id
+        self.loads[vehicle_id] += self.data['demands'][node]
+        self.lengths[vehicle_id] = length
+
+    def run(self, dropped: List[int], deadline: float = math.inf, should_stop: Callable | None = None) -> int:
+        """
+        Relocate boundary orders and re-insert dropped ones; returns the
+        number of moves made. Stops at deadline (time.monotonic()) or when
+        should_stop() says so: dropped orders not tried by then stay dropped.
+        """
+        def expired():
+            return time.monotonic() >= deadline or (should_stop is not None and should_stop())
+
+        moves = 0
+        old_max = max(self.lengths.values(), default=0)
+        for _ in range(REPAIR_PASSES):
+            moved = 0
+            for node in self.boundary_orders():
+                if expired():
+                    break
+                vehicle_id = self.vehicle_of[node]
+                stops = self.routes[vehicle_id]
+                position = stops.index(node)
+                remaining = stops[:position] + stops[position + 1:]
+                shortened = self.route_length(vehicle_id, remaining)
+
+                option = self.best_insertion(node, self.neighbor_vans(node))
+                if option is None:
+                    continue
+                added, target, target_position, target_length = option
+                new_max = self.max_length_with({vehicle_id: shortened, target: target_length})
+                change = added - (self.lengths[vehicle_id] - shortened) + self.balance * (new_max - old_max)
+                if change >= 0:
+                    continue
+
+                self.routes[vehicle_id] = remaining
+                self.loads[vehicle_id] -= self.data['demands'][node]
+                self.lengths[vehicle_id] = shortened
+                self.insert(node, target, target_position, target_length)
+                old_max = new_max
+                moved += 1
+            moves += moved
+            if not moved or expired():
+                break
+
+        # Dropped orders: try their own cluster's vans as well as the neighbours
+        self.dropped = []
+        for node in dropped:
+            if expired():
+                self.dropped.append(node)
+                continue
+            if self.data['allowed_vehicles'][node] >= 0:
+                vans = [self.data['allowed_vehicles'][node]]
+            else:
+                own = np.flatnonzero(self.cluster_of_warehouse == self.cluster_of_order[node - self.num_warehouses])
+                vans = own.tolist() + self.neighbor_vans(node)
+            option = self.best_insertion(node, vans)
+            penalty = int(self.params['drop_penalty']) * max(self.data['priorities'][node], 1)
+            if option is not None:
+                added, target, target_position, target_length = option
+                new_max = self.max_length_with({target: target_length})
+                if added + self.balance * (new_max - old_max) < penalty:
+                    self.insert(node, target, target_position, target_length)
+                    old_max = new_max
+                    moves += 1
+                    continue
+            self.dropped.append(node)
+        return moves
+
+    def solution(self) -> dict:
+        """Routes in solve_vrp's shape: per stop the load carried before it and the arrival minute"""
+        routes = []
+        total_distance = 0
+        for vehicle_id in range(self.data['num_vehicles']):
+            stops = self.routes[vehicle_id]
+            sequence = [vehicle_id] + stops + [vehicle_id]
+            # Not strict: cluster routes were checked by OR-Tools on a matrix that may round a meter differently
+            arrivals = self.schedule(vehicle_id, stops, strict=False)
+            loads = np.concatenate([[0], np.cumsum([self.data['demands'][node] for node in sequence[:-1]])]).tolist()
+            routes.append({
+                'vehicle_id': vehicle_id,
+                'stops': [{'node': node, 'load': int(load), 'arrival_minutes': arrival}
+                          for node, load, arrival in zip(sequence, loads, arrivals)],
+                'distance': self.lengths[vehicle_id],
+                'time_minutes': arrivals[-1] - arrivals[0],
+            })
+            total_distance += self.lengths[vehicle_id]
+
+        penalties = sum(int(self.params['drop_penalty']) * max(self.data['priorities'][node], 1)
+                        for node in self.dropped)
+        return {
+            'routes': routes,
+            'dropped_nodes': sorted(self.dropped),
+            # Same terms as the full model: arc costs, global span cost on distance, drop penalties
+            'objective': total_distance + self.balance * max(self.lengths.values(), default=0) + penalties,
+        }
@@ -0,0 +1,165 @@
+import copy
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from inventory_index import InventoryIndex
+from problem_model import Problem
+
+
+# Warehouse fields a delta may change; the warehouse list itself is fixed
+# because vehicle ids in the previous plan are warehouse indices.
+WAREHOUSE_UPDATE_FIELDS = ('products', 'capacity', 'pre_assigned_load', 'pre_assigned_count',
+                           'latitude', 'longitude')
+
+
+# ---------------- Applying a Delta ----------------
+def apply_order_delta(base_payload: dict, delta: dict) -> Tuple[dict, List[int]]:
+    """
+    Build the updated payload from a previous job's payload and a delta:
+      added_orders         new order dicts (same schema as /ortools/optimize)
+      removed_order_ids    cancelled orders
+      completed_order_ids  delivered orders
+      warehouse_updates    [{id, products?, capacity?, latitude?, longitude?, ...}]
+      solver_params        merged over the previous job's solver_params
+    Returns (payload, kept) where kept lists the previous order indices that
+    survive, in their new sequence; added orders follow them.
+    """
+    added = list(delta.get('added_orders', []))
+    dropped_ids = set(delta.get('removed_order_ids', [])) | set(delta.get('completed_order_ids', []))
+    # Re-sent orders replace their previous version
+    dropped_ids |= {order.get('order_id') for order in added}
+
+    base_orders = base_payload.get('orders', [])
+    kept = [idx for idx, order in enumerate(base_orders) if order.get('order_id') not in dropped_ids]
+
+    updates = {update.get('id'): update for update in delta.get('warehouse_updates', [])}
+    warehouses = []
+    for wh in base_payload.get('warehouses', []):
+        wh = copy.deepcopy(wh)
+        for key in WAREHOUSE_UPDATE_FIELDS:
+            if key in updates.get(wh.get('id'), {}):
+                wh[key] = updates[wh.get('id')][key]
+        warehouses.append(wh)
+
+    payload = {
+        **base_payload,
+        'warehouses': warehouses,
+        'orders': [base_orders[idx] for idx in kept] + added,
+    }
+    if delta.get('solver_params'):
+        payload['solver_params'] = {**(base_payload.get('solver_params') or {}), **delta['solver_params']}
+
+    return payload, kept
+
+
+def previous_routes(result: dict, num_warehouses: int) -> Dict[int, List[int]]:
+    """{vehicle_id: [order_index, ...]} in stop order from a finished job's result"""
+    routes = {}
+    for details in result.get('route_details', []):
+        routes[details['vehicle_id']] = [
+            stop['location_index'] - num_warehouses
+            for stop in details['route']
+            if stop.get('location_info', {}).get('type', 'order') == 'order'
+            and stop['location_index'] >= num_warehouses
+        ]
+    return routes
+
+
+def previous_unassigned(result: dict) -> List[int]:
+    """Unassigned order indices; greedy results list dicts, OR-Tools results plain indices"""
+    return [item['order_index'] if isinstance(item, dict) else item
+            for item in result.get('unassigned_orders', [])]
+
+
+# ---------------- Cheapest Insertion ----------------
+def _insertions(matrices, routes: List[Tuple[int, List[int]]], order_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cheapest position to insert an order into each depot -> stops -> depot
+    route of [(warehouse, order indices)], with legs read from the job's
+    matrix blocks (order -> order legs of a base job that never built its
+    order block go through the metric). Returns (added meters, position) arrays.
+    """
+    num_warehouses = len(matrices.warehouse_coords)
+    node = num_warehouses + order_idx
+    before, after = [], []
+    for wh_idx, stops in routes:
+        sequence = [wh_idx] + [num_warehouses + stop for stop in stops] + [wh_idx]
+        before.extend(sequence[:-1])
+        after.extend(sequence[1:])
+
+    # One batch of legs for every route: stop -> order -> next stop, minus the leg it replaces
+    added = matrices.leg_distances(before, [node] * len(before)) + \
+        matrices.leg_distances([node] * len(after), after) - matrices.leg_distances(before, after)
+    offsets = np.cumsum([0] + [len(stops) + 1 for _, stops in routes])
+    positions = np.array([int(np.argmin(added[offsets[i]:offsets[i + 1]])) for i in range(len(routes))],
+                         dtype=np.int64)
+    return added[offsets[:-1] + positions], positions
+
+
+def reinsert_orders(problem: Problem, matrices, inventory: InventoryIndex,
+                    routes: Dict[int, List[int]], pending: List[int], strategy: str,
+                    check_inventory: bool = True) -> dict:
+    """
+    Repair a greedy plan: keep the surviving routes and their stock/load,
+    then insert each pending order where it adds the least distance among
+    vans with room (and stock, unless check_inventory is False, in which
+    case short stops are flagged needs_restock as in closest_any).
+    Returns {'assignments', 'unassigned'} like the assign_* strategies.
+    """
+    loads = problem.pre_assigned_load.tolist()
+    capacity = problem.capacity.tolist()
+    demands = problem.demands.tolist()
+
+    assignments = {}
+    for wh_idx, order_indices in routes.items():
+        for order_idx in order_indices:
+            assignments.setdefault(wh_idx, []).append({
+                'order_index': order_idx,
+                'order_id': problem.order_ids[order_idx],
+                'distance': int(matrices.warehouse_to_order[wh_idx, order_idx]),
+                'needs_restock': not inventory.can_fulfill(wh_idx, order_idx),
+                'strategy': strategy
+            })
+            loads[wh_idx] += demands[order_idx]
+            inventory.consume(wh_idx, order_idx)
+
+    unassigned = []
+    for order_idx in pending:
+        if check_inventory:
+            feasible = inventory.feasible_warehouses(order_idx)
+        else:
+            feasible = np.ones(problem.num_warehouses, dtype=bool)
+        candidates = [
+            (wh_idx, [entry['order_index'] for entry in assignments.get(wh_idx, [])])
+            for wh_idx in range(problem.num_warehouses)
+            if feasible[wh_idx] and loads[wh_idx] + demands[order_idx] <= capacity[wh_idx]
+        ]
+
+        best = None
+        if candidates:
+            costs, positions = _insertions(matrices, candidates, order_idx)
+            choice = int(np.argmin(costs))
+            best = (float(costs[choice]), candidates[choice][0], int(positions[choice]))
+
+        if best is None:
+            unassigned.append({
+                'order_index': order_idx,
+                'order_id': problem.order_ids[order_idx],
+                'reason': 'no_feasible_insertion'
+            })
+            continue
+
+        _, wh_idx, position = best
+        assignments.setdefault(wh_idx, []).insert(position, {
+            'order_index': order_idx,
+            'order_id': problem.order_ids[order_idx],
+            'distance': int(matrices.warehouse_to_order[wh_idx, order_idx]),
+            'needs_restock': not inventory.can_fulfill(wh_idx, order_idx),
+            'inserted': True,
+            'strategy': strategy
+        })
+        loads[wh_idx] += demands[order_idx]
+        inventory.consume(wh_idx, order_idx)
+
+    return {'assignments': assignments, 'unassigned': unassigned}
@@ -0,0 +1,244 @@
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+EARTH_RADIUS_M = 6371000  # Earth radius in meters
+
+MATRIX_DTYPES = {
+    "float64": np.float64,
+    "float32": np.float32,
+}
+
+
+# ---------------- Haversine ----------------
+def haversine_matrix(origins: np.ndarray, destinations: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """
+    Great-circle distance in meters between every origin and destination.
+    origins is (N, 2), destinations is (M, 2), both (lat, lng) in degrees.
+    Returns an (N, M) array in the requested dtype.
+    """
+    origins = np.radians(np.asarray(origins, dtype=dtype))
+    destinations = np.radians(np.asarray(destinations, dtype=dtype))
+
+    lat1 = origins[:, 0][:, np.newaxis]
+    lng1 = origins[:, 1][:, np.newaxis]
+    lat2 = destinations[:, 0][np.newaxis, :]
+    lng2 = destinations[:, 1][np.newaxis, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    # arcsin(sqrt(a)) == atan2(sqrt(a), sqrt(1 - a)); clip guards rounding above 1
+    c = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    return (dtype(EARTH_RADIUS_M) * c).astype(dtype, copy=False)
+
+
+def haversine_pairs(origins: np.ndarray, destinations: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """Element-wise distances in meters between origins[i] and destinations[i]"""
+    origins = np.radians(np.asarray(origins, dtype=dtype))
+    destinations = np.radians(np.asarray(destinations, dtype=dtype))
+    lat1, lng1 = origins[:, 0], origins[:, 1]
+    lat2, lng2 = destinations[:, 0], destinations[:, 1]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    return (dtype(EARTH_RADIUS_M) * c).astype(dtype, copy=False)
+
+
+def haversine_row(lat: float, lng: float, destinations: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """Distances in meters from a single point to every destination"""
+    return haversine_matrix(np.array([[lat, lng]], dtype=dtype), destinations, dtype)[0]
+
+
+# ---------------- Problem Matrices ----------------
+@dataclass
+class DistanceMatrices:
+    """Batched distances for one job, in meters"""
+    warehouse_coords: np.ndarray  # (W, 2)
+    order_coords: np.ndarray      # (O, 2)
+    warehouse_to_order: np.ndarray  # (W, O)
+    warehouse_to_warehouse: np.ndarray  # (W, W)
+    dtype: type = np.float64
+    # metric(origins, destinations, dtype) -> (N, M) meters; haversine or a road network
+    metric: Callable = field(default=haversine_matrix, repr=False)
+    _order_to_order: np.ndarray | None = field(default=None, repr=False)
+    _order_to_warehouse: np.ndarray | None = field(default=None, repr=False)
+
+    @property
+    def order_to_order(self) -> np.ndarray:
+        """(O, O) matrix, built on first use: greedy strategies never need it"""
+        if self._order_to_order is None:
+            self._order_to_order = self.metric(self.order_coords, self.order_coords, self.dtype)
+        return self._order_to_order
+
+    @property
+    def order_to_warehouse(self) -> np.ndarray:
+        """(O, W) return legs; the transpose for haversine, computed for one-way road networks"""
+        if self.metric is haversine_matrix:
+            return self.warehouse_to_order.T
+        if self._order_to_warehouse is None:
+            self._order_to_warehouse = self.metric(self.order_coords, self.warehouse_coords, self.dtype)
+        return self._order_to_warehouse
+
+    @property
+    def num_locations(self) -> int:
+        return len(self.warehouse_coords) + len(self.order_coords)
+
+    def location_coords(self) -> np.ndarray:
+        """Coordinates in routing order: warehouses first, then orders"""
+        return np.vstack([self.warehouse_coords, self.order_coords])
+
+    @property
+    def has_order_block(self) -> bool:
+        """Whether the (O, O) order block has been built (or loaded)"""
+        return self._order_to_order is not None
+
+    def leg_distances(self, from_locations, to_locations) -> np.ndarray:
+        """
+        Meters for individual (from, to) pairs of routing location indices,
+        looked up in the blocks already held; only legs whose block was never
+        built (order -> order, or return legs on a road network) go through
+        the metric, pair by pair.
+        """
+        from_locations = np.asarray(from_locations, dtype=np.int64)
+        to_locations = np.asarray(to_locations, dtype=np.int64)
+        num_warehouses = len(self.warehouse_coords)
+        from_warehouse = from_locations < num_warehouses
+        to_warehouse = to_locations < num_warehouses
+        legs = np.empty(len(from_locations), dtype=self.dtype)
+
+        rows = from_warehouse & to_warehouse
+        legs[rows] = self.warehouse_to_warehouse[from_locations[rows], to_locations[rows]]
+        rows = from_warehouse & ~to_warehouse
+        legs[rows] = self.warehouse_to_order[from_locations[rows], to_locations[rows] - num_warehouses]
+        rows = ~from_warehouse & to_warehouse
+        if self.metric is haversine_matrix or self._order_to_warehouse is not None:
+            legs[rows] = self.order_to_warehouse[from_locations[rows] - num_warehouses, to_locations[rows]]
+        elif rows.any():
+            legs[rows] = self._pair_distances(from_locations[rows], to_locations[rows])
+        rows = ~from_warehouse & ~to_warehouse
+        if self._order_to_order is not None:
+            legs[rows] = self._order_to_order[from_locations[rows] - num_warehouses,
+                                              to_locations[rows] - num_warehouses]
+        elif rows.any():
+            legs[rows] = self._pair_distances(from_locations[rows], to_locations[rows])
+        return legs
+
+    def _pair_distances(self, from_locations: np.ndarray, to_locations: np.ndarray) -> np.ndarray:
+        coords = self.location_coords()
+        if self.metric is haversine_matrix:
+            return haversine_pairs(coords[from_locations], coords[to_locations], self.dtype)
+        return self.metric.pairs(coords[from_locations], coords[to_locations], self.dtype)
+
+    def location_matrix(self) -> np.ndarray:
+        """Full (W+O) x (W+O) integer matrix in meters for OR-Tools transit callbacks"""
+        top = np.hstack([self.warehouse_to_warehouse, self.warehouse_to_order])
+        bottom = np.hstack([self.order_to_warehouse, self.order_to_order])
+        return np.rint(np.vstack([top, bottom])).astype(np.int64)
+
+    def location_submatrix(self, locations) -> np.ndarray:
+        """location_matrix() restricted to some routing location indices, without building the full one"""
+        coords = self.location_coords()[np.asarray(locations, dtype=np.int64)]
+        return np.rint(self.metric(coords, coords, self.dtype)).astype(np.int64)
+
+    def derive(self, warehouse_coords: np.ndarray, kept_orders, added_order_coords: np.ndarray) -> 'DistanceMatrices':
+        """
+        Matrices for an edited order list: the kept orders (indices into this
+        job's orders, in their new sequence) followed by added orders.
+        Warehouse rows are cheap and recomputed, since vans move; the O(O^2)
+        order block is reused and only rows/columns of added orders computed.
+        """
+        kept_orders = np.asarray(kept_orders, dtype=np.int64)
+        added_order_coords = np.asarray(added_order_coords, dtype=self.dtype).reshape(-1, 2)
+        warehouse_coords = np.asarray(warehouse_coords, dtype=self.dtype)
+        order_coords = np.vstack([self.order_coords[kept_orders], added_order_coords])
+
+        derived = DistanceMatrices(
+            warehouse_coords=warehouse_coords,
+            order_coords=order_coords,
+            warehouse_to_order=self.metric(warehouse_coords, order_coords, self.dtype),
+            warehouse_to_warehouse=self.metric(warehouse_coords, warehouse_coords, self.dtype),
+            dtype=self.dtype,
+            metric=self.metric,
+        )
+        if self._order_to_order is not None:
+            kept_block = self._order_to_order[np.ix_(kept_orders, kept_orders)]
+            kept_coords = self.order_coords[kept_orders]
+            # Road distances are not symmetric, so both directions are computed
+            derived._order_to_order = np.block([
+                [kept_block, self.metric(kept_coords, added_order_coords, self.dtype)],
+                [self.metric(added_order_coords, kept_coords, self.dtype),
+                 self.metric(added_order_coords, added_order_coords, self.dtype)],
+            ])
+        return derived
+
+    def select_orders(self, order_indices) -> 'DistanceMatrices':
+        """Matrices for a subset of this job's orders (repeats allowed), sliced without computing anything"""
+        order_indices = np.asarray(order_indices, dtype=np.int64)
+        selected = DistanceMatrices(
+            warehouse_coords=self.warehouse_coords,
+            order_coords=self.order_coords[order_indices],
+            warehouse_to_order=self.warehouse_to_order[:, order_indices],
+            warehouse_to_warehouse=self.warehouse_to_warehouse,
+            dtype=self.dtype,
+            metric=self.metric,
+        )
+        if self._order_to_order is not None:
+            selected._order_to_order = self._order_to_order[np.ix_(order_indices, order_indices)]
+        if self._order_to_warehouse is not None:
+            selected._order_to_warehouse = self._order_to_warehouse[order_indices]
+        return selected
+
+    def save(self, path: str):
+        """Write to an .npz file; the order block only if it was built"""
+        arrays = {
+            'warehouse_coords': self.warehouse_coords,
+            'order_coords': self.order_coords,
+            'warehouse_to_order': self.warehouse_to_order,
+            'warehouse_to_warehouse': self.warehouse_to_warehouse,
+        }
+        if self._order_to_order is not None:
+            arrays['order_to_order'] = self._order_to_order
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str, metric: Callable = haversine_matrix) -> 'DistanceMatrices':
+        """Read matrices written by save(); metric must be the one they were built with"""
+        with np.load(path) as data:
+            return cls(
+                warehouse_coords=data['warehouse_coords'],
+                order_coords=data['order_coords'],
+                warehouse_to_order=data['warehouse_to_order'],
+                warehouse_to_warehouse=data['warehouse_to_warehouse'],
+                dtype=data['warehouse_to_order'].dtype.type,
+                metric=metric,
+                _order_to_order=data['order_to_order'] if 'order_to_order' in data.files else None,
+            )
+
+
+def build_distance_matrices(warehouse_coords: np.ndarray, order_coords: np.ndarray, dtype=np.float64,
+                            metric: Callable = haversine_matrix) -> DistanceMatrices:
+    """Compute every warehouse/order distance for a job in one batched pass"""
+    warehouse_coords = np.asarray(warehouse_coords, dtype=dtype)
+    order_coords = np.asarray(order_coords, dtype=dtype)
+
+    return DistanceMatrices(
+        warehouse_coords=warehouse_coords,
+        order_coords=order_coords,
+        warehouse_to_order=metric(warehouse_coords, order_coords, dtype),
+        warehouse_to_warehouse=metric(warehouse_coords, warehouse_coords, dtype),
+        dtype=dtype,
+        metric=metric,
+    )
+
+
+def resolve_dtype(name: str | None):
+    """Map a payload 'matrix_dtype' value to a NumPy dtype"""
+    if not name:
+        return np.float64
+    if name not in MATRIX_DTYPES:
+        raise ValueError(f"Invalid matrix_dtype. Must be one of: {list(MATRIX_DTYPES)}")
+    return MATRIX_DTYPES[name]
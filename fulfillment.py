@@ -0,0 +1,242 @@
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from ortools.graph.python import min_cost_flow
+
+from inventory_index import InventoryIndex
+from problem_model import Problem
+
+
+# 'whole' ships every order from one van; 'split' lets orders no single van
+# can fill ship from several, as sub-orders pinned to their vans
+FULFILLMENT_MODES = ("whole", "split")
+# Nearest stocked warehouses offered to each order line, so the flow network
+# stays at lines x SPLIT_CANDIDATES arcs however large the fleet
+SPLIT_CANDIDATES = 5
+# Orders the flow covers only in part give their stock back and the flow is
+# solved again without them, at most this many times
+SPLIT_ROUNDS = 3
+# Lines whose candidate warehouses are looked up at once (bounds the (lines, W) scratch arrays)
+CANDIDATE_CHUNK = 4096
+
+SOURCE, SINK = 0, 1
+
+
+# ---------------- Allocation ----------------
+def order_lines(inventory: InventoryIndex, orders: List[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(order, product column, quantity) of every line of the given orders"""
+    if not orders:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    line_orders = np.concatenate([np.full(len(inventory.order_columns[idx]), idx) for idx in orders])
+    line_columns = np.concatenate([inventory.order_columns[idx] for idx in orders])
+    line_quantities = np.concatenate([inventory.order_quantities[idx] for idx in orders])
+    return line_orders.astype(np.int64), line_columns.astype(np.int64), line_quantities.astype(np.int64)
+
+
+def candidate_warehouses(stock: np.ndarray, warehouse_to_order: np.ndarray, line_orders: np.ndarray,
+                         line_columns: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(line, warehouse, meters) arcs: the SPLIT_CANDIDATES nearest warehouses holding each line's product"""
+    k = min(SPLIT_CANDIDATES, stock.shape[0])
+    lines, warehouses, meters = [], [], []
+    for start in range(0, len(line_orders), CANDIDATE_CHUNK):
+        chunk = slice(start, start + CANDIDATE_CHUNK)
+        distances = np.where(stock[:, line_columns[chunk]].T > 0,
+                             warehouse_to_order[:, line_orders[chunk]].T.astype(np.float64), np.inf)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < stock.shape[0] else \
+            np.tile(np.arange(stock.shape[0]), (len(distances), 1))
+        picked = np.take_along_axis(distances, nearest, axis=1)
+        held = np.isfinite(picked)
+        rows = np.broadcast_to(np.arange(start, start + len(distances))[:, np.newaxis], nearest.shape)
+        lines.append(rows[held])
+        warehouses.append(nearest[held])
+        meters.append(picked[held])
+    if not lines:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    return np.concatenate(lines), np.concatenate(warehouses), np.concatenate(meters)
+
+
+def allocate_items(problem: Problem, matrices, inventory: InventoryIndex,
+                   orders: List[int]) -> Tuple[Dict[int, Dict[int, Dict[int, int]]], List[int]]:
+    """
+    Allocate the lines of orders to warehouse stock as a min-cost max-flow:
+    source -> warehouse (free capacity) -> warehouse stock of a product
+    (quantity held) -> order line (quantity wanted, costed by the warehouse
+    -> order meters) -> sink. Orders are all or nothing: those left short
+    are taken out and the rest solved again. Returns
+    ({order: {warehouse: {product column: quantity}}}, short orders).
+    """
+    stock = inventory.stock
+    free_capacity = np.maximum(problem.capacity - problem.pre_assigned_load, 0)
+    active = list(orders)
+    short = []
+    allocations = {}
+
+    for round_idx in range(SPLIT_ROUNDS):
+        line_orders, line_columns, line_quantities = order_lines(inventory, active)
+        if not len(line_orders):
+            break
+        arc_lines, arc_warehouses, arc_meters = candidate_warehouses(
+            stock, matrices.warehouse_to_order, line_orders, line_columns)
+
+        # Node ids: source, sink, warehouses, (warehouse, product) stock nodes, lines
+        num_warehouses = stock.shape[0]
+        stock_keys, arc_stock = np.unique(arc_warehouses * stock.shape[1] + line_columns[arc_lines],
+                                          return_inverse=True)
+        stock_warehouses, stock_columns = np.divmod(stock_keys, stock.shape[1])
+        warehouse_node = 2 + np.arange(num_warehouses)
+        stock_node = 2 + num_warehouses + np.arange(len(stock_keys))
+        line_node = 2 + num_warehouses + len(stock_keys) + np.arange(len(line_orders))
+
+        flow = min_cost_flow.SimpleMinCostFlow()
+        flow.add_arcs_with_capacity_and_unit_cost(
+            np.full(num_warehouses, SOURCE), warehouse_node, free_capacity, np.zeros(num_warehouses, dtype=np.int64))
+        flow.add_arcs_with_capacity_and_unit_cost(
+            warehouse_node[stock_warehouses], stock_node, stock[stock_warehouses, stock_columns],
+            np.zeros(len(stock_keys), dtype=np.int64))
+        first_allocation_arc = flow.num_arcs()
+        flow.add_arcs_with_capacity_and_unit_cost(
+            stock_node[arc_stock], line_node[arc_lines], line_quantities[arc_lines],
+            np.rint(arc_meters).astype(np.int64))
+        flow.add_arcs_with_capacity_and_unit_cost(
+            line_node, np.full(len(line_orders), SINK), line_quantities, np.zeros(len(line_orders), dtype=np.int64))
+        total = int(line_quantities.sum())
+        flow.set_node_supply(SOURCE, total)
+        flow.set_node_supply(SINK, -total)
+
+        if flow.solve_max_flow_with_min_cost() != flow.OPTIMAL:
+            print("Split delivery: allocation flow could not be solved")
+            short.extend(active)
+            break
+
+        arc_flows = flow.flows(np.arange(first_allocation_arc, first_allocation_arc + len(arc_lines)))
+        delivered = np.bincount(arc_lines, weights=arc_flows, minlength=len(line_orders))
+        incomplete = set(line_orders[delivered < line_quantities].tolist())
+        short.extend(sorted(incomplete))
+        active = [idx for idx in active if idx not in incomplete]
+        if incomplete and round_idx < SPLIT_ROUNDS - 1:
+            continue
+
+        # Dropping the short orders' flow only frees stock and capacity, so the rest stands
+        used = (arc_flows > 0) & ~np.isin(line_orders[arc_lines], list(incomplete))
+        for line, wh_idx, quantity in zip(arc_lines[used].tolist(), arc_warehouses[used].tolist(),
+                                          arc_flows[used].tolist()):
+            parts = allocations.setdefault(int(line_orders[line]), {}).setdefault(wh_idx, {})
+            col = int(line_columns[line])
+            parts[col] = parts.get(col, 0) + int(quantity)
+        break
+
+    return allocations, sorted(short)
+
+
+# ---------------- Split Problem ----------------
+def split_orders(problem: Problem, matrices) -> Tuple[Problem, np.ndarray, dict]:
+    """
+    Split every order that no single van can fill from its own stock into
+    per-van sub-orders, allocated across the fleet by allocate_items().
+    Sub-orders keep the order's id, location and time window and are
+    pinned to their van. Returns (problem, parent order of every new order,
+    summary); orders that cannot be covered even split stay whole.
+    """
+    started = time.monotonic()
+    inventory = InventoryIndex(problem)
+    unfillable = [
+        order_idx for order_idx in range(problem.num_orders)
+        if len(inventory.order_columns[order_idx]) and not inventory.feasible_warehouses(order_idx).any()
+    ]
+    allocations, short = allocate_items(problem, matrices, inventory, unfillable)
+
+    parents, pins, demands = [], [], []
+    item_indptr, item_columns, item_quantities = [0], [], []
+    for order_idx in range(problem.num_orders):
+        parts = allocations.get(order_idx)
+        if parts is None:
+            start, end = problem.item_indptr[order_idx], problem.item_indptr[order_idx + 1]
+            parents.append(order_idx)
+            pins.append(-1)
+            demands.append(int(problem.demands[order_idx]))
+            item_columns.extend(problem.item_columns[start:end].tolist())
+            item_quantities.extend(problem.item_quantities[start:end].tolist())
+            item_indptr.append(len(item_columns))
+            continue
+        for wh_idx, items in sorted(parts.items()):
+            parents.append(order_idx)
+            pins.append(wh_idx)
+            demands.append(sum(items.values()))
+            item_columns.extend(items)
+            item_quantities.extend(items.values())
+            item_indptr.append(len(item_columns))
+
+    summary = {
+        'mode': 'split',
+        'split_orders': len(allocations),
+        'sub_orders': sum(len(parts) for parts in allocations.values()),
+        'unfillable_orders': len(short),
+        'allocation_seconds': round(time.monotonic() - started, 3),
+    }
+    print(f"Split delivery: {summary['split_orders']} orders split into {summary['sub_orders']} sub-orders, "
+          f"{summary['unfillable_orders']} unfillable, in {summary['allocation_seconds']}s")
+
+    parents = np.array(parents, dtype=np.int64)
+    if not allocations:
+        return problem, parents, summary
+    split = problem.select_orders(
+        parents,
+        demands=np.array(demands, dtype=np.int64),
+        item_indptr=np.array(item_indptr, dtype=np.int64),
+        item_columns=np.array(item_columns, dtype=np.int64),
+        item_quantities=np.array(item_quantities, dtype=np.int64),
+        pinned_warehouses=np.array(pins, dtype=np.int64),
+    )
+    return split, parents, summary
+
+
+def parent_order_status(parents: np.ndarray, num_orders: int,
+                        unassigned: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Submitted orders, by index, that a split plan leaves unassigned (none
+    of their sub-orders routed) and partially assigned (only some routed),
+    given the parent of every sub-order and the unassigned sub-orders.
+    """
+    total = np.bincount(parents, minlength=num_orders)
+    missed = np.bincount(parents[unassigned], minlength=num_orders)
+    return np.flatnonzero(missed == total), np.flatnonzero((missed > 0) & (missed < total))
+
+
+def assign_with_pinned(problem: Problem, matrices, assign: Callable, strategy: str) -> dict:
+    """
+    Run a greedy strategy, assign(problem, matrices), around pinned
+    sub-orders: it sees only the free orders, with the sub-orders' load
+    and stock already taken from their vans, and the sub-orders are then
+    added to their vans. Returns {'assignments', 'unassigned'} in the
+    numbering of problem.
+    """
+    pinned = problem.pinned_warehouses
+    held = np.flatnonzero(pinned >= 0)
+    free = np.flatnonzero(pinned < 0)
+
+    loads = problem.pre_assigned_load + np.bincount(
+        pinned[held], weights=problem.demands[held], minlength=problem.num_warehouses).astype(np.int64)
+    stock = problem.stock.copy()
+    for order_idx in held.tolist():
+        start, end = problem.item_indptr[order_idx], problem.item_indptr[order_idx + 1]
+        np.subtract.at(stock[pinned[order_idx]], problem.item_columns[start:end], problem.item_quantities[start:end])
+    np.maximum(stock, 0, out=stock)
+
+    result = assign(problem.select_orders(free, pre_assigned_load=loads, stock=stock), matrices.select_orders(free))
+    for entries in list(result['assignments'].values()) + [result['unassigned']]:
+        for entry in entries:
+            entry['order_index'] = int(free[entry['order_index']])
+
+    for order_idx in held.tolist():
+        wh_idx = int(pinned[order_idx])
+        result['assignments'].setdefault(wh_idx, []).append({
+            'order_index': order_idx,
+            'order_id': problem.order_ids[order_idx],
+            'distance': int(matrices.warehouse_to_order[wh_idx, order_idx]),
+            'split_delivery': True,
+            'strategy': strategy
+        })
+    return result
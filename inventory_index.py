@@ -0,0 +1,46 @@
+import numpy as np
+
+from problem_model import Problem
+
+
+class InventoryIndex:
+    """
+    Product x warehouse stock matrix plus per-order demand vectors for one strategy run.
+
+    stock[w, p] is the quantity of product column p held by warehouse w.
+    Each order keeps the columns and quantities of the products it needs, so
+    feasibility against every warehouse is one vectorized comparison and
+    decrementing stock after an assignment touches only the order's items.
+    The problem's stock is copied, so each run starts from the submitted stock.
+    """
+
+    def __init__(self, problem: Problem):
+        self.product_ids = problem.product_ids
+        self.stock = problem.stock.copy()
+
+        # Sum repeated products within an order in one pass over all items
+        item_orders = np.repeat(np.arange(problem.num_orders), np.diff(problem.item_indptr))
+        num_products = max(len(self.product_ids), 1)
+        keys = item_orders * num_products + problem.item_columns
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        quantities = np.bincount(inverse, weights=problem.item_quantities, minlength=len(unique_keys))
+        bounds = np.searchsorted(unique_keys // num_products, np.arange(problem.num_orders + 1))
+
+        self.order_columns = np.split(unique_keys % num_products, bounds[1:-1])
+        self.order_quantities = np.split(quantities.astype(np.int64), bounds[1:-1])
+
+    def feasible_warehouses(self, order_idx: int) -> np.ndarray:
+        """Boolean mask over warehouses that hold every item of the order"""
+        cols = self.order_columns[order_idx]
+        if not len(cols):
+            return np.ones(self.stock.shape[0], dtype=bool)
+        return np.all(self.stock[:, cols] >= self.order_quantities[order_idx], axis=1)
+
+    def can_fulfill(self, wh_idx: int, order_idx: int) -> bool:
+        cols = self.order_columns[order_idx]
+        return bool(np.all(self.stock[wh_idx, cols] >= self.order_quantities[order_idx]))
+
+    def consume(self, wh_idx: int, order_idx: int):
+        """Take the order's items out of the warehouse stock (never below zero)"""
+        cols = self.order_columns[order_idx]
+        self.stock[wh_idx, cols] = np.maximum(self.stock[wh_idx, cols] - self.order_quantities[order_idx], 0)
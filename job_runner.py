@@ -0,0 +1,204 @@
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+# Set inside a worker process: job updates are sent back to the parent over it
+_worker_updates = None
+
+
+def forward_update(job_id: str, fields: dict) -> bool:
+    """Send a job update to the parent process. False when not running in a worker."""
+    if _worker_updates is None:
+        return False
+    _worker_updates.send((job_id, fields))
+    return True
+
+
+def _never_stop() -> bool:
+    return False
+
+
+def reset_sigterm():
+    """For helper processes forked inside a job worker: die on terminate() instead of unwinding"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when queued + running jobs reach max_queue"""
+
+
+class ThreadJobRunner:
+    """
+    Runs jobs on a thread pool inside the Flask process.
+    Cancellation and the wall-clock budget are cooperative: the job's
+    should_stop() flips to True and the solver ends the search at its next
+    solution callback. A cancelled job counts as active until its thread
+    actually returns.
+    """
+
+    backend = "thread"
+
+    def __init__(self, on_timeout: Callable, max_workers: int, max_queue: int, timeout: float):
+        self._on_timeout = on_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+    def submit(self, job_id: str, target: Callable, *args):
+        """Queue target(job_id, *args, should_stop=...)"""
+        with self._lock:
+            if len(self._jobs) >= self.max_queue:
+                raise QueueFullError(f"{len(self._jobs)} jobs already queued or running")
+            stop = threading.Event()
+            future = self._executor.submit(self._run, job_id, target, stop, args)
+            self._jobs[job_id] = {'stop': stop, 'future': future}
+        # Outside the lock: a future that is already done runs the callback right here
+        future.add_done_callback(lambda _: self._forget(job_id))
+
+    def _run(self, job_id: str, target: Callable, stop: threading.Event, args: tuple):
+        timer = threading.Timer(self.timeout, self._expire, (job_id,))
+        timer.daemon = True
+        try:
+            if stop.is_set():
+                return
+            timer.start()
+            target(job_id, *args, should_stop=stop.is_set)
+        finally:
+            timer.cancel()
+
+    def _forget(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _expire(self, job_id: str):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        if entry:
+            entry['stop'].set()
+            self._on_timeout(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask the job to stop; it leaves active_count() once its future is done (or never started)"""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        if not entry:
+            return False
+        entry['stop'].set()
+        entry['future'].cancel()
+        return True
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+
+class ProcessJobRunner:
+    """
+    Runs each job in its own forked worker process, at most max_workers at a time.
+    Workers are forked from the service after ortools is imported, so they
+    start warm and the search runs outside the Flask process's GIL.
+    Cancelling or exceeding the wall-clock budget terminates the process.
+    """
+
+    backend = "process"
+
+    def __init__(self, on_update: Callable, on_timeout: Callable, on_crash: Callable,
+                 max_workers: int, max_queue: int, timeout: float):
+        self._on_update = on_update
+        self._on_timeout = on_timeout
+        self._on_crash = on_crash
+        self._ctx = multiprocessing.get_context("fork")
+        self._slots = threading.Semaphore(max_workers)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+    def submit(self, job_id: str, target: Callable, *args):
+        """Queue target(job_id, *args, should_stop=...) in a worker process"""
+        with self._lock:
+            if len(self._jobs) >= self.max_queue:
+                raise QueueFullError(f"{len(self._jobs)} jobs already queued or running")
+            self._jobs[job_id] = {'process': None, 'cancelled': False}
+        threading.Thread(target=self._run, args=(job_id, target, args), daemon=True,
+                         name=f"ortools-job-{job_id}").start()
+
+    def _run(self, job_id: str, target: Callable, args: tuple):
+        with self._slots:
+            with self._lock:
+                entry = self._jobs.get(job_id)
+                if entry is None or entry['cancelled']:
+                    self._jobs.pop(job_id, None)
+                    return
+                # One pipe per job: killing a worker can only break its own channel. The pipe
+                # is opened, handed to the worker and its write end closed here under the
+                # lock, so no sibling worker forked meanwhile inherits it and holds off EOF.
+                reader, writer = self._ctx.Pipe(duplex=False)
+                process = self._ctx.Process(
+                    target=_process_main, args=(writer, target, job_id, args),
+                    name=f"ortools-job-{job_id}"
+                )
+                entry['process'] = process
+                process.start()
+                writer.close()
+
+            timed_out = False
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if reader.poll(0.2):
+                    try:
+                        update_job_id, fields = reader.recv()
+                    except (EOFError, OSError):
+                        break
+                    self._on_update(update_job_id, fields)
+                    continue
+                if time.monotonic() > deadline:
+                    timed_out = True
+                    process.terminate()
+                    break
+            reader.close()
+            process.join()
+
+            with self._lock:
+                cancelled = self._jobs.pop(job_id, {}).get('cancelled', False)
+            if cancelled:
+                return
+            if timed_out:
+                self._on_timeout(job_id)
+            elif process.exitcode != 0:
+                self._on_crash(job_id, process.exitcode)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if not entry:
+                return False
+            entry['cancelled'] = True
+            process = entry['process']
+        if process is not None and process.is_alive():
+            process.terminate()
+        return True
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+
+def _process_main(writer, target: Callable, job_id: str, args: tuple):
+    global _worker_updates
+    _worker_updates = writer
+    # terminate() unwinds through finally blocks, so helper processes a job started get cleaned up
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    try:
+        target(job_id, *args, should_stop=_never_stop)
+    finally:
+        writer.close()
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    strategy TEXT,
+    error TEXT,
+    best_objective INTEGER,
+    solutions_found INTEGER,
+    best_routes TEXT,
+    extra TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at);
+CREATE TABLE IF NOT EXISTS job_payloads (
+    job_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT PRIMARY KEY,
+    result TEXT,
+    prepared TEXT
+);
+"""
+
+# Plain columns on the jobs table, updated in place on every progress tick
+META_COLUMNS = ("status", "progress", "strategy", "error", "best_objective", "solutions_found")
+# Large blobs kept out of the jobs table so progress updates stay small
+RESULT_COLUMNS = ("result", "prepared")
+FINISHED_STATUSES = ("done", "error", "cancelled")
+# jobs columns get_meta() reads when the caller does not need best_routes
+META_ROW_COLUMNS = META_COLUMNS + ("extra", "created_at", "updated_at", "finished_at")
+
+
+class JobStore:
+    """
+    SQLite job store in WAL mode.
+    Job metadata, the submitted payload and the result live in separate
+    tables: progress ticks rewrite one small row, the payload is written
+    once, and the status index keeps /health independent of job history.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, and a fresh one after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, job_id: str, payload: dict | None = None, **fields):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, progress, strategy, error, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, fields.get("status", "running"), fields.get("progress", 0),
+                 fields.get("strategy"), fields.get("error"), now, now)
+            )
+            if payload is not None:
+                conn.execute("INSERT OR REPLACE INTO job_payloads (job_id, payload) VALUES (?, ?)",
+                             (job_id, json.dumps(payload)))
+        rest = {k: v for k, v in fields.items() if k not in ("status", "progress", "strategy", "error")}
+        if rest:
+            self.update(job_id, **rest)
+
+    def update(self, job_id: str, **fields):
+        now = time.time()
+        meta = {k: fields.pop(k) for k in META_COLUMNS if k in fields}
+        results = {k: fields.pop(k) for k in RESULT_COLUMNS if k in fields}
+        best_routes = fields.pop("best_routes", False)
+        fields.pop("payload", None)
+
+        assignments = [f"{column} = ?" for column in meta]
+        values = list(meta.values())
+        if best_routes is not False:
+            assignments.append("best_routes = ?")
+            values.append(None if best_routes is None else json.dumps(best_routes))
+        if fields:
+            # Anything else is rare: merge into the extra JSON column
+            assignments.append("extra = json_patch(COALESCE(extra, '{}'), ?)")
+            values.append(json.dumps(fields))
+        if meta.get("status") in FINISHED_STATUSES:
+            assignments.append("finished_at = ?")
+            values.append(now)
+        assignments.append("updated_at = ?")
+        values.append(now)
+
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            cursor = conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE job_id = ?",
+                                  values + [job_id])
+            if cursor.rowcount == 0:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, status, progress, created_at, updated_at) VALUES (?, ?, 0, ?, ?)",
+                    (job_id, meta.get("status", "unknown"), now, now)
+                )
+                conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE job_id = ?", values + [job_id])
+            if results:
+                conn.execute("INSERT OR IGNORE INTO job_results (job_id) VALUES (?)", (job_id,))
+                conn.execute(
+                    f"UPDATE job_results SET {', '.join(f'{k} = ?' for k in results)} WHERE job_id = ?",
+                    [None if v is None else json.dumps(v) for v in results.values()] + [job_id]
+                )
+
+    def get_meta(self, job_id: str, best_routes: bool = True) -> dict | None:
+        """Job metadata; best_routes=False skips reading and decoding the incumbent routes"""
+        columns = "*" if best_routes else ", ".join(META_ROW_COLUMNS)
+        row = self._conn().execute(f"SELECT {columns} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._meta_from_row(row) if row else None
+
+    def get(self, job_id: str) -> dict | None:
+        """Metadata plus result and prepared data (no payload)"""
+        row = self._conn().execute(
+            "SELECT jobs.*, job_results.result, job_results.prepared FROM jobs "
+            "LEFT JOIN job_results USING (job_id) WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if not row:
+            return None
+        job = self._meta_from_row(row)
+        job["result"] = json.loads(row["result"]) if row["result"] else None
+        job["prepared"] = json.loads(row["prepared"]) if row["prepared"] else None
+        return job
+
+    def get_payload(self, job_id: str) -> dict | None:
+        row = self._conn().execute("SELECT payload FROM job_payloads WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row["payload"]) if row else None
+
+    def delete(self, job_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            for table in ("jobs", "job_payloads", "job_results"):
+                conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+
+    def count_by_status(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def evict_finished(self, finished_before: float) -> int:
+        """Delete jobs that finished before the given timestamp; returns how many"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            expired = "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?"
+            conn.execute(f"DELETE FROM job_payloads WHERE job_id IN ({expired})", (finished_before,))
+            conn.execute(f"DELETE FROM job_results WHERE job_id IN ({expired})", (finished_before,))
+            cursor = conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                                  (finished_before,))
+        return cursor.rowcount
+
+    @staticmethod
+    def _meta_from_row(row) -> dict:
+        job = {column: row[column] for column in META_COLUMNS}
+        if "best_routes" in row.keys():
+            job["best_routes"] = json.loads(row["best_routes"]) if row["best_routes"] else None
+        job["created_at"] = row["created_at"]
+        job["updated_at"] = row["updated_at"]
+        job["finished_at"] = row["finished_at"]
+        if row["extra"]:
+            job.update(json.loads(row["extra"]))
+        return job
@@ -133,8 +133,10 @@ document.addEventListener('DOMContentLoaded', function() {
         // Show unassigned orders
         const unassigned = result.unassigned_orders || [];
         if (unassigned.length > 0) {
+            // Split-delivery plans route sub-orders; order_parents maps their locations back to orders
+            const parents = prepared.order_parents;
             unassigned.forEach(orderIdx => {
-                const locIdx = whCount + orderIdx;
+                const locIdx = whCount + (parents ? parents.indexOf(orderIdx) : orderIdx);
                 if (locIdx < locations.length) {
                     const loc = locations[locIdx];
                     const li = document.createElement('li');
@@ -0,0 +1,165 @@
+import bisect
+import contextlib
+import cProfile
+import io
+import pstats
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+# Upper bounds in seconds: phases range from sub-millisecond greedy passes to full searches
+PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PROFILE_TOP_FUNCTIONS = 40
+
+
+# ---------------- Prometheus Registry ----------------
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format, one series per label set"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = PHASE_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            counts, total = self._series.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[label_values] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {cumulative}")
+        return lines
+
+
+def render_values(name: str, kind: str, help_text: str, values: Dict[Tuple[str, ...], float],
+                  label_names: Tuple[str, ...] = ()) -> List[str]:
+    """Gauge or counter lines for values read at scrape time: {label values: value}"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label_values, value in sorted(values.items()):
+        lines.append(f"{name}{_labels(label_names, label_values)} {value}")
+    return lines
+
+
+JOB_PHASE_SECONDS = Histogram(
+    "ortools_job_phase_seconds", "Time spent per job phase", ("phase", "strategy"))
+JOB_DURATION_SECONDS = Histogram(
+    "ortools_job_duration_seconds", "Wall time of finished jobs", ("strategy", "status"))
+
+
+def observe_job_timings(timings: dict):
+    """Fold a job's timings record (see JobTimer.record) into the histograms"""
+    strategy = timings.get("strategy") or "unknown"
+    for name, seconds in timings.get("phases", {}).items():
+        JOB_PHASE_SECONDS.observe(seconds, name, strategy)
+    JOB_DURATION_SECONDS.observe(timings.get("total_seconds", 0.0), strategy, timings.get("status") or "unknown")
+
+
+# ---------------- Job Phases ----------------
+_current = threading.local()
+
+
+class JobTimer:
+    """
+    Seconds per named phase of one job. Repeated phases add up; time
+    outside any phase only counts in the total. status follows the job's
+    own update_job() calls through note_status().
+    """
+
+    def __init__(self, strategy: str):
+        self.strategy = strategy
+        self.status = None
+        self.phases = {}
+        self.started = time.perf_counter()
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def record(self, status: str) -> dict:
+        return {
+            "strategy": self.strategy,
+            "status": status,
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "total_seconds": round(time.perf_counter() - self.started, 6),
+        }
+
+
+def current_timer() -> JobTimer | None:
+    return getattr(_current, "timer", None)
+
+
+@contextlib.contextmanager
+def job_timer(strategy: str):
+    """Make a JobTimer current for this thread, so phase() calls anywhere below record into it"""
+    timer = JobTimer(strategy)
+    previous = current_timer()
+    _current.timer = timer
+    try:
+        yield timer
+    finally:
+        _current.timer = previous
+
+
+def note_status(status: str):
+    timer = current_timer()
+    if timer is not None:
+        timer.status = status
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Time a block into the current job's timer; a no-op outside a job"""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+
+# ---------------- Profiling ----------------
+@contextlib.contextmanager
+def profile_to(path: str | None):
+    """cProfile the block (this thread only) and dump pstats to path; a no-op without a path"""
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def profile_summary(path: str, sort: str = "cumulative", limit: int = PROFILE_TOP_FUNCTIONS) -> str:
+    """Text report of a pstats dump, top functions by sort key"""
+    output = io.StringIO()
+    pstats.Stats(path, stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
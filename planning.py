@@ -0,0 +1,928 @@
+import heapq
+import multiprocessing
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from decomposition import partition_orders, solve_decomposed
+from distance_matrix import build_distance_matrices, resolve_dtype
+from fulfillment import assign_with_pinned, parent_order_status, split_orders
+from inventory_index import InventoryIndex
+from job_runner import reset_sigterm
+from metrics import phase
+from problem_model import Problem
+from response_format import encode_polyline
+from restock import DONOR_POLICY_NOTE, plan_restock_trips
+from road_network import resolve_provider
+from routing_solver import (build_routing_data, refine_departures, resolve_solver_params, retime_routes,
+                            solve_vrp_multi_start)
+from spatial_index import WarehouseGrid, DEFAULT_CELL_KM
+from traffic_profile import resolve_traffic_profile
+
+
+# Worker processes for strategy: "compare"; each strategy gets one
+COMPARE_WORKERS = int(os.environ.get("ORTOOLS_COMPARE_WORKERS", os.cpu_count() or 1))
+# Distances come from straight-line haversine unless a road graph directory is configured
+ROAD_GRAPH_PATH = os.environ.get("ORTOOLS_ROAD_GRAPH")
+MATRIX_PROVIDER = os.environ.get("ORTOOLS_MATRIX_PROVIDER", "haversine")
+# Directory of <name>.json speed profiles for solver_params.traffic_profile
+TRAFFIC_PROFILES_DIR = os.environ.get("ORTOOLS_TRAFFIC_PROFILES")
+
+
+@dataclass
+class AssignmentStrategy:
+    """Available assignment strategies"""
+    ORTOOLS_BALANCED = "ortools_balanced"
+    CLOSEST_WITH_INVENTORY = "closest_with_inventory"
+    CLOSEST_ANY = "closest_any"
+    LEAST_ASSIGNED = "least_assigned_orders"
+    LEAST_TOTAL_LOAD = "least_total_load"
+    ZONE_BASED = "zone_based"
+    COMPARE = "compare"
+
+
+# Strategies "compare" runs when the payload does not list compare_strategies
+COMPARABLE_STRATEGIES = [
+    AssignmentStrategy.ORTOOLS_BALANCED,
+    AssignmentStrategy.CLOSEST_WITH_INVENTORY,
+    AssignmentStrategy.CLOSEST_ANY,
+    AssignmentStrategy.LEAST_ASSIGNED,
+    AssignmentStrategy.LEAST_TOTAL_LOAD,
+    AssignmentStrategy.ZONE_BASED
+]
+
+
+# ---------------- Distance Calculation ----------------
+def payload_metric(payload: dict):
+    """Distance function for the payload's matrix_provider (haversine or road)"""
+    return resolve_provider(payload.get('matrix_provider'), ROAD_GRAPH_PATH, MATRIX_PROVIDER)
+
+
+def solver_traffic_profile(params: dict):
+    """TrafficProfile for resolved solver_params (None: static average_speed_kmh)"""
+    return resolve_traffic_profile(params['traffic_profile'], TRAFFIC_PROFILES_DIR, int(params['day_start_minute']))
+
+
+# ---------------- Assignment Strategies ----------------
+def assign_closest_with_inventory(problem: Problem, matrices, inventory: InventoryIndex,
+                                  grid: WarehouseGrid) -> dict:
+    """Assign orders to closest warehouse that has inventory"""
+    assignments = {}
+    unassigned = []
+    loads = problem.pre_assigned_load.tolist()
+    capacity = problem.capacity.tolist()
+    demands = problem.demands.tolist()
+    
+    for order_idx, order_id in enumerate(problem.order_ids):
+        best_warehouse = None
+        best_distance = float('inf')
+        feasible = inventory.feasible_warehouses(order_idx)
+        order_lat, order_lng = matrices.order_coords[order_idx]
+        
+        # Candidates come nearest first, so the first one that passes wins
+        for wh_idx, distance in grid.nearest(order_lat, order_lng, matrices.warehouse_to_order[:, order_idx]):
+            # Check inventory first
+            if not feasible[wh_idx]:
+                continue
+            
+            # Check current load vs capacity
+            if loads[wh_idx] >= capacity[wh_idx]:
+                continue
+            
+            best_distance = int(distance)
+            best_warehouse = wh_idx
+            break
+        
+        if best_warehouse is not None:
+            if best_warehouse not in assignments:
+                assignments[best_warehouse] = []
+            
+            assignments[best_warehouse].append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'distance': best_distance,
+                'strategy': 'closest_with_inventory'
+            })
+            
+            # Update warehouse load and stock
+            loads[best_warehouse] += demands[order_idx]
+            inventory.consume(best_warehouse, order_idx)
+        else:
+            unassigned.append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'reason': 'no_warehouse_with_inventory'
+            })
+    
+    return {'assignments': assignments, 'unassigned': unassigned}
+
+
+def assign_closest_any(problem: Problem, matrices, inventory: InventoryIndex, grid: WarehouseGrid) -> dict:
+    """Assign orders to closest warehouse regardless of inventory"""
+    assignments = {}
+    unassigned = []
+    loads = problem.pre_assigned_load.tolist()
+    capacity = problem.capacity.tolist()
+    demands = problem.demands.tolist()
+    
+    for order_idx, order_id in enumerate(problem.order_ids):
+        best_warehouse = None
+        best_distance = float('inf')
+        needs_restock = False
+        order_lat, order_lng = matrices.order_coords[order_idx]
+        
+        for wh_idx, distance in grid.nearest(order_lat, order_lng, matrices.warehouse_to_order[:, order_idx]):
+            # Check current load vs capacity
+            if loads[wh_idx] >= capacity[wh_idx]:
+                continue
+            
+            best_distance = int(distance)
+            best_warehouse = wh_idx
+            break
+        
+        if best_warehouse is not None:
+            needs_restock = not inventory.can_fulfill(best_warehouse, order_idx)
+
+            if best_warehouse not in assignments:
+                assignments[best_warehouse] = []
+            
+            assignments[best_warehouse].append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'distance': best_distance,
+                'needs_restock': needs_restock,
+                'strategy': 'closest_any'
+            })
+            
+            loads[best_warehouse] += demands[order_idx]
+            inventory.consume(best_warehouse, order_idx)
+        else:
+            unassigned.append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'reason': 'all_warehouses_at_capacity'
+            })
+    
+    return {'assignments': assignments, 'unassigned': unassigned}
+
+
+def pop_first_eligible(heap: list, is_full, is_eligible):
+    """
+    Pop the smallest heap entry whose warehouse is eligible for the current order.
+    Full warehouses are dropped from the heap for good (lazy invalidation);
+    ineligible ones are set aside and pushed back, so the heap stays intact.
+    """
+    skipped = []
+    chosen = None
+    while heap:
+        key, wh_idx = heapq.heappop(heap)
+        if is_full(wh_idx):
+            continue
+        if not is_eligible(wh_idx):
+            skipped.append((key, wh_idx))
+            continue
+        chosen = wh_idx
+        break
+    for entry in skipped:
+        heapq.heappush(heap, entry)
+    return chosen
+
+
+def assign_least_assigned(problem: Problem, inventory: InventoryIndex) -> dict:
+    """Assign orders to warehouse with fewest assigned orders"""
+    assignments = {}
+    unassigned = []
+    loads = problem.pre_assigned_load.tolist()
+    capacity = problem.capacity.tolist()
+    demands = problem.demands.tolist()
+    
+    # Heap of (assigned count including pre-assigned, warehouse index)
+    counts = problem.pre_assigned_count.tolist()
+    heap = [(count, wh_idx) for wh_idx, count in enumerate(counts)]
+    heapq.heapify(heap)
+    
+    def is_full(wh_idx):
+        return loads[wh_idx] >= capacity[wh_idx]
+    
+    for order_idx, order_id in enumerate(problem.order_ids):
+        feasible = inventory.feasible_warehouses(order_idx)
+        
+        best_warehouse = None
+        if feasible.any():
+            best_warehouse = pop_first_eligible(heap, is_full, lambda wh_idx: feasible[wh_idx])
+        
+        if best_warehouse is not None:
+            if best_warehouse not in assignments:
+                assignments[best_warehouse] = []
+            
+            assignments[best_warehouse].append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'strategy': 'least_assigned'
+            })
+            
+            loads[best_warehouse] += demands[order_idx]
+            inventory.consume(best_warehouse, order_idx)
+            
+            counts[best_warehouse] += 1
+            heapq.heappush(heap, (counts[best_warehouse], best_warehouse))
+        else:
+            unassigned.append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'reason': 'no_warehouse_available'
+            })
+    
+    return {'assignments': assignments, 'unassigned': unassigned}
+
+
+def assign_least_total_load(problem: Problem, inventory: InventoryIndex) -> dict:
+    """Assign orders to warehouse with lowest total load"""
+    assignments = {}
+    unassigned = []
+    loads = problem.pre_assigned_load.tolist()
+    capacity = problem.capacity.tolist()
+    demands = problem.demands.tolist()
+    
+    # Heap of (current load, warehouse index)
+    heap = [(load, wh_idx) for wh_idx, load in enumerate(loads)]
+    heapq.heapify(heap)
+    
+    def is_full(wh_idx):
+        return loads[wh_idx] >= capacity[wh_idx]
+    
+    for order_idx, order_id in enumerate(problem.order_ids):
+        order_demand = demands[order_idx]
+        feasible = inventory.feasible_warehouses(order_idx)
+        
+        def is_eligible(wh_idx):
+            # Check inventory and whether adding this order would exceed capacity
+            return feasible[wh_idx] and loads[wh_idx] + order_demand <= capacity[wh_idx]
+        
+        best_warehouse = None
+        if feasible.any():
+            best_warehouse = pop_first_eligible(heap, is_full, is_eligible)
+        
+        if best_warehouse is not None:
+            if best_warehouse not in assignments:
+                assignments[best_warehouse] = []
+            
+            assignments[best_warehouse].append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'strategy': 'least_total_load'
+            })
+            
+            loads[best_warehouse] += order_demand
+            inventory.consume(best_warehouse, order_idx)
+            
+            heapq.heappush(heap, (loads[best_warehouse], best_warehouse))
+        else:
+            unassigned.append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'reason': 'insufficient_capacity_or_inventory'
+            })
+    
+    return {'assignments': assignments, 'unassigned': unassigned}
+
+
+def assign_zone_based(problem: Problem, matrices, inventory: InventoryIndex, grid: WarehouseGrid) -> dict:
+    """
+    Assign orders to the least loaded warehouse in the order's grid zone.
+    Orders whose zone has no warehouse able to serve them go to the nearest
+    feasible warehouse outside the zone.
+    """
+    assignments = {}
+    unassigned = []
+    loads = problem.pre_assigned_load.tolist()
+    capacity = problem.capacity.tolist()
+    demands = problem.demands.tolist()
+    
+    for order_idx, order_id in enumerate(problem.order_ids):
+        order_demand = demands[order_idx]
+        order_lat, order_lng = matrices.order_coords[order_idx]
+        feasible = inventory.feasible_warehouses(order_idx)
+        
+        def fits(wh_idx):
+            return feasible[wh_idx] and loads[wh_idx] + order_demand <= capacity[wh_idx]
+        
+        best_warehouse = None
+        out_of_zone = False
+        min_load = float('inf')
+        
+        for wh_idx in grid.warehouses_in_cell(order_lat, order_lng):
+            if loads[wh_idx] < min_load and fits(wh_idx):
+                min_load = loads[wh_idx]
+                best_warehouse = wh_idx
+        
+        if best_warehouse is None:
+            for wh_idx, _ in grid.nearest(order_lat, order_lng, matrices.warehouse_to_order[:, order_idx]):
+                if fits(wh_idx):
+                    best_warehouse = wh_idx
+                    out_of_zone = True
+                    break
+        
+        if best_warehouse is not None:
+            if best_warehouse not in assignments:
+                assignments[best_warehouse] = []
+            
+            assignments[best_warehouse].append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'distance': int(matrices.warehouse_to_order[best_warehouse, order_idx]),
+                'zone': grid.zone_key(order_lat, order_lng),
+                'out_of_zone': out_of_zone,
+                'strategy': 'zone_based'
+            })
+            
+            loads[best_warehouse] += order_demand
+            inventory.consume(best_warehouse, order_idx)
+        else:
+            unassigned.append({
+                'order_index': order_idx,
+                'order_id': order_id,
+                'reason': 'insufficient_capacity_or_inventory'
+            })
+    
+    return {'assignments': assignments, 'unassigned': unassigned}
+
+
+def assign_greedy(problem: Problem, matrices, strategy: str) -> dict:
+    """Run one greedy strategy; returns {'assignments', 'unassigned'}"""
+    with phase("inventory"):
+        inventory = InventoryIndex(problem)
+        grid = WarehouseGrid(matrices.warehouse_coords, float(problem.options.get('zone_size_km', DEFAULT_CELL_KM)))
+    
+    with phase("strategy"):
+        if strategy == AssignmentStrategy.CLOSEST_WITH_INVENTORY:
+            return assign_closest_with_inventory(problem, matrices, inventory, grid)
+        if strategy == AssignmentStrategy.CLOSEST_ANY:
+            return assign_closest_any(problem, matrices, inventory, grid)
+        if strategy == AssignmentStrategy.LEAST_ASSIGNED:
+            return assign_least_assigned(problem, inventory)
+        if strategy == AssignmentStrategy.LEAST_TOTAL_LOAD:
+            return assign_least_total_load(problem, inventory)
+        if strategy == AssignmentStrategy.ZONE_BASED:
+            return assign_zone_based(problem, matrices, inventory, grid)
+    raise ValueError(f"Unknown strategy: {strategy}")
+
+
+# ---------------- Data Preparation ----------------
+def prepare_data(problem: Problem, strategy: str = AssignmentStrategy.ORTOOLS_BALANCED,
+                 progress_callback=None, should_stop=None, matrices=None, solver_params=None):
+    """
+    Run the requested strategy on a problem and format its routes.
+    Returns None once should_stop() is true: greedy strategies check it
+    between phases, the solvers during their search.
+    """
+    options = problem.options
+    should_stop = should_stop or (lambda: False)
+    
+    if not problem.num_warehouses:
+        raise ValueError("No warehouses provided")
+    if not problem.num_orders:
+        raise ValueError("No orders provided")
+    
+    print(f"Processing {problem.num_warehouses} warehouses and {problem.num_orders} orders")
+    print(f"Using strategy: {strategy}")
+    
+    # All distances for the job in one batched pass
+    if matrices is None:
+        with phase("matrix"):
+            matrices = build_distance_matrices(
+                problem.warehouse_coords, problem.order_coords,
+                resolve_dtype(options.get('matrix_dtype')), payload_metric(options)
+            )
+    
+    # Orders no single van can fill become sub-orders pinned to the vans that hold their items
+    fulfillment = None
+    num_orders = problem.num_orders
+    if options.get('fulfillment') == 'split' and not problem.has_pinned_orders:
+        with phase("fulfillment"):
+            problem, parents, fulfillment = split_orders(problem, matrices)
+            matrices = matrices.select_orders(parents)
+        if should_stop():
+            return None
+    
+    if strategy == AssignmentStrategy.COMPARE:
+        with phase("strategy"):
+            result = compare_strategies(
+                problem, matrices,
+                options.get('compare_strategies', COMPARABLE_STRATEGIES),
+                solver_params or options.get('solver_params'),
+                progress_callback,
+                should_stop
+            )
+    elif strategy != AssignmentStrategy.ORTOOLS_BALANCED:
+        # Apply greedy strategy
+        if should_stop():
+            return None
+        if problem.has_pinned_orders:
+            result = assign_with_pinned(
+                problem, matrices, lambda free, free_matrices: assign_greedy(free, free_matrices, strategy), strategy)
+        else:
+            result = assign_greedy(problem, matrices, strategy)
+        
+        restock = None
+        if options.get('plan_restock'):
+            if should_stop():
+                return None
+            with phase("restock"):
+                restock = plan_restock_trips(problem, matrices, result, strategy)
+        
+        with phase("format"):
+            result = format_greedy_result(problem, result, strategy)
+        if restock:
+            result['restock'] = restock
+            result['meta']['restock_note'] = DONOR_POLICY_NOTE
+    else:
+        # OR-Tools for balanced strategy
+        result = prepare_ortools_data(
+            problem, matrices,
+            solver_params or options.get('solver_params'),
+            progress_callback,
+            options.get('return_distance_matrix', False),
+            should_stop
+        )
+    
+    if fulfillment and result is not None:
+        result['fulfillment'] = fulfillment
+        report_split_counts(result, parents, num_orders)
+    return result
+
+
+def report_split_counts(result: dict, parents: np.ndarray, num_orders: int):
+    """
+    Restate a split-delivery plan in submitted orders: unassigned_orders and
+    the counts refer to parent orders (an order is partially assigned when
+    only some of its sub-orders are routed), and the sub-order figures get
+    their own sub_order names. prepared['order_parents'] maps the sub-order
+    locations that routes index back to their orders.
+    """
+    num_sub_orders = len(parents)
+    prepared = result.get('prepared')
+    if prepared:
+        prepared['meta']['orders_count'] = num_orders
+        prepared['meta']['sub_orders_count'] = num_sub_orders
+        prepared['order_parents'] = parents.tolist()
+    
+    plans = {result.get('strategy'): result, **(result.get('plans') or {})}
+    scorecard = {row['strategy']: row for row in result.get('scorecard') or []}
+    for strategy, plan in plans.items():
+        if 'unassigned_orders' not in plan:
+            continue
+        # Greedy plans list {'order_index', ...} entries, OR-Tools plans bare indices
+        unassigned_sub = plan['unassigned_orders']
+        sub_indices = np.array([item['order_index'] if isinstance(item, dict) else item for item in unassigned_sub],
+                               dtype=np.int64)
+        missing, partial = parent_order_status(parents, num_orders, sub_indices)
+        missing_set = set(missing.tolist())
+        
+        unassigned = {}
+        for sub_idx, item in zip(sub_indices.tolist(), unassigned_sub):
+            parent = int(parents[sub_idx])
+            if parent in missing_set and parent not in unassigned:
+                unassigned[parent] = {**item, 'order_index': parent} if isinstance(item, dict) else parent
+        plan['unassigned_orders'] = list(unassigned.values())
+        plan['unassigned_sub_orders'] = unassigned_sub
+        plan['partially_assigned_orders'] = partial.tolist()
+        
+        counts = {
+            'assigned': num_orders - len(missing) - len(partial),
+            'partially_assigned': len(partial),
+            'unassigned': len(missing),
+            'assigned_sub': num_sub_orders - len(sub_indices),
+            'unassigned_sub': len(sub_indices),
+        }
+        if 'meta' in plan:
+            plan['meta'].update({
+                'orders_count': num_orders,
+                'assigned_count': counts['assigned'],
+                'partially_assigned_count': counts['partially_assigned'],
+                'unassigned_count': counts['unassigned'],
+                'sub_orders_count': num_sub_orders,
+                'assigned_sub_orders_count': counts['assigned_sub'],
+                'unassigned_sub_orders_count': counts['unassigned_sub'],
+            })
+        if 'optimization_summary' in plan:
+            plan['optimization_summary'].update({
+                'total_orders': num_orders,
+                'assigned_orders': counts['assigned'],
+                'partially_assigned_orders': counts['partially_assigned'],
+                'unassigned_orders': counts['unassigned'],
+                'total_sub_orders': num_sub_orders,
+                'assigned_sub_orders': counts['assigned_sub'],
+                'unassigned_sub_orders': counts['unassigned_sub'],
+            })
+        if strategy in scorecard:
+            scorecard[strategy].update({
+                'assigned_count': counts['assigned'],
+                'partially_assigned_count': counts['partially_assigned'],
+                'unassigned_count': counts['unassigned'],
+            })
+
+
+def warehouse_location_info(problem: Problem, wh_idx: int) -> dict:
+    return {'type': 'warehouse', 'id': problem.warehouse_ids[wh_idx], **problem.warehouse_info[wh_idx]}
+
+
+def order_location_info(problem: Problem, order_idx: int) -> dict:
+    info = problem.order_info[order_idx]
+    return {
+        'type': 'order',
+        'order_id': problem.order_ids[order_idx],
+        'order_no': info.get('order_no'),
+        'client_name': info.get('client_object_name'),
+        'client_address': info.get('client_object_address'),
+        'client_phone': info.get('client_phone'),
+        **split_delivery_info(problem, order_idx)
+    }
+
+
+def split_delivery_info(problem: Problem, order_idx: int) -> dict:
+    """What a split-delivery sub-order carries, so the driver knows their part of the order"""
+    if problem.pinned_warehouses[order_idx] < 0:
+        return {}
+    return {'split_delivery': True, 'items': problem.order_items(order_idx)}
+
+
+def format_greedy_result(problem: Problem, result, strategy):
+    """Format greedy assignment results"""
+    route_details = []
+    num_warehouses = problem.num_warehouses
+    demands = problem.demands.tolist()
+    
+    for wh_idx in range(num_warehouses):
+        assigned_orders = result['assignments'].get(wh_idx, [])
+        
+        if not assigned_orders:
+            continue
+        
+        route = []
+        total_load = 0
+        total_distance = 0
+        warehouse_info = warehouse_location_info(problem, wh_idx)
+        
+        # Add warehouse start
+        route.append({
+            'location_index': wh_idx,
+            'load': 0,
+            'demand': 0,
+            'location_info': warehouse_info
+        })
+        
+        # Add assigned orders
+        stops_count = 0
+        for assignment in assigned_orders:
+            if 'restock_from' in assignment:
+                total_distance += assignment.get('distance', 0)
+                route.append(restock_stop(problem, assignment, total_load))
+                continue
+            
+            stops_count += 1
+            order_idx = assignment['order_index']
+            order_demand = demands[order_idx]
+            total_load += order_demand
+            total_distance += assignment.get('distance', 0)
+            
+            route.append({
+                'location_index': num_warehouses + order_idx,
+                'load': total_load,
+                'demand': order_demand,
+                'needs_restock': assignment.get('needs_restock', False),
+                'restock_planned': assignment.get('restock_planned', False),
+                'location_info': order_location_info(problem, order_idx)
+            })
+        
+        # Add warehouse end
+        route.append({
+            'location_index': wh_idx,
+            'load': total_load,
+            'demand': 0,
+            'location_info': {
+                'type': 'warehouse',
+                'id': warehouse_info['id'],
+                'name': warehouse_info['name']
+            }
+        })
+        
+        route_details.append({
+            'vehicle_id': wh_idx,
+            'route': route,
+            'total_distance': total_distance,
+            'total_distance_km': round(total_distance / 1000, 2),
+            'total_load': total_load,
+            'stops_count': stops_count,
+            'warehouse_info': {k: v for k, v in warehouse_info.items() if k != 'type'},
+            'polyline': route_polyline(problem, route),
+            'strategy_used': strategy
+        })
+        if 'depot_loads' in result:
+            # Restock planned: the rest of the warehouse's stock stays at the depot for other vans
+            route_details[-1]['depot_load'] = result['depot_loads'].get(wh_idx, [])
+    
+    return {
+        'route_details': route_details,
+        'unassigned_orders': result['unassigned'],
+        'strategy': strategy,
+        'meta': {
+            'warehouses_count': num_warehouses,
+            'orders_count': problem.num_orders,
+            'assigned_count': sum(r['stops_count'] for r in route_details),
+            'unassigned_count': len(result['unassigned'])
+        }
+    }
+
+
+def route_polyline(problem: Problem, route: List[dict]) -> str:
+    """Encoded polyline through a route's stops in visit order (straight legs, not road geometry)"""
+    num_warehouses = problem.num_warehouses
+    return encode_polyline([
+        problem.warehouse_coords[stop['location_index']] if stop['location_index'] < num_warehouses
+        else problem.order_coords[stop['location_index'] - num_warehouses]
+        for stop in route
+    ])
+
+
+def restock_stop(problem: Problem, assignment: dict, load: int) -> dict:
+    """Route stop of a restock visit: the van picks up items at another warehouse"""
+    wh_idx = assignment['restock_from']
+    return {
+        'location_index': wh_idx,
+        'load': load,
+        'demand': 0,
+        'location_info': {
+            'type': 'restock',
+            'id': problem.warehouse_ids[wh_idx],
+            'name': problem.warehouse_info[wh_idx].get('name'),
+            'items': assignment['items']
+        }
+    }
+
+
+def location_details(problem: Problem):
+    """location_info entries for every routing location (warehouses first)"""
+    details = []
+    for wh_idx in range(problem.num_warehouses):
+        details.append({**warehouse_location_info(problem, wh_idx), 'location_index': wh_idx})
+    for order_idx, priority in enumerate(problem.priorities.tolist()):
+        details.append({
+            **order_location_info(problem, order_idx),
+            'location_index': problem.num_warehouses + order_idx,
+            'priority': priority
+        })
+    return details
+
+
+def prepare_ortools_data(problem: Problem, matrices, solver_params=None, progress_callback=None,
+                         return_distance_matrix=False, should_stop=None, initial_routes=None):
+    """
+    Build the CVRPTW model, solve it with OR-Tools and format the routes.
+    With a traffic profile the time limit is shared by traffic_rounds
+    searches, each timing legs at the departures of the previous one's
+    routes (and warm-started from them unless decomposed); the best plan
+    is then re-timed leg by leg.
+    """
+    params = resolve_solver_params(solver_params)
+    traffic = solver_traffic_profile(params)
+    rounds = int(params['traffic_rounds']) if traffic else 1
+    with phase("model"):
+        # Warm starts cover the whole fleet, so re-optimizations are never decomposed
+        clusters = partition_orders(matrices, params, problem.pinned_warehouses) if initial_routes is None else []
+        decomposed = len(clusters) > 1
+        data = build_routing_data(problem, matrices, params, include_matrices=not decomposed or return_distance_matrix,
+                                  traffic=traffic)
+        details = location_details(problem)
+
+    print(f"OR-Tools: {data['num_vehicles']} vehicles, {len(details)} locations, "
+          f"time limit {params['time_limit_seconds']}s, {params['parallel_starts']} parallel starts"
+          + (f", traffic profile {traffic.name or 'inline'} over {rounds} rounds" if traffic else ""))
+
+    round_params = {**params, 'time_limit_seconds': float(params['time_limit_seconds']) / rounds}
+    solution = None
+    with phase("search"):
+        for round_idx in range(rounds):
+            if round_idx:
+                if should_stop and should_stop():
+                    break
+                refine_departures(data, params, latest)
+                initial_routes = [[stop['node'] for stop in route['stops'][1:-1]] for route in latest['routes']]
+            if decomposed:
+                latest = solve_decomposed(data, matrices, round_params, clusters, progress_callback, should_stop)
+            else:
+                latest = solve_vrp_multi_start(data, round_params, progress_callback, should_stop, initial_routes)
+            if solution is None or latest['objective'] < solution['objective']:
+                solution = latest
+
+    if traffic:
+        with phase("traffic"):
+            late = retime_routes(data, params, matrices, solution)
+        solution['traffic'] = {**traffic.describe(), 'rounds': rounds, 'late_stops': late}
+
+    print(f"OR-Tools: objective {solution['objective']} after {solution['solutions_found']} "
+          f"solutions in {solution['solve_seconds']}s"
+          + (f" over {len(clusters)} clusters, {solution['repair_moves']} repair moves" if decomposed else
+             f" with {solution['search']['first_solution_strategy']}/{solution['search']['local_search_metaheuristic']}"))
+
+    with phase("format"):
+        return format_ortools_result(problem, data, details, solution, return_distance_matrix)
+
+
+def format_ortools_result(problem: Problem, data, details, solution, return_distance_matrix=False):
+    """Format OR-Tools routes in the same shape as the greedy results"""
+    num_warehouses = problem.num_warehouses
+    route_details = []
+    routes = []
+    total_distance = 0
+    total_stops = 0
+
+    for vehicle in solution['routes']:
+        vehicle_id = vehicle['vehicle_id']
+        route = []
+        for stop in vehicle['stops']:
+            node = stop['node']
+            route.append({
+                'location_index': node,
+                'load': stop['load'],
+                'demand': data['demands'][node],
+                'arrival_minutes': stop['arrival_minutes'],
+                'location_info': details[node]
+            })
+
+        stops_count = len(route) - 2
+        total_distance += vehicle['distance']
+        total_stops += stops_count
+
+        routes.append(route)
+        route_details.append({
+            'vehicle_id': vehicle_id,
+            'route': route,
+            'total_distance': vehicle['distance'],
+            'total_distance_km': round(vehicle['distance'] / 1000, 2),
+            'total_load': route[-1]['load'],
+            'total_time_minutes': vehicle['time_minutes'],
+            'stops_count': stops_count,
+            'warehouse_info': details[vehicle_id],
+            'polyline': route_polyline(problem, route)
+        })
+
+    unassigned = [node - num_warehouses for node in solution['dropped_nodes']]
+    vehicles_used = sum(1 for r in route_details if r['stops_count'] > 0)
+
+    prepared = {
+        'capacities': data['capacities'],
+        'demands': data['demands'],
+        'depot_indices': data['depot_indices'],
+        'locations': data['locations'],
+        'num_vehicles': data['num_vehicles'],
+        'warehouse_details': details[:num_warehouses],
+        'order_details': details[num_warehouses:],
+        'meta': {
+            'warehouses_count': num_warehouses,
+            'orders_count': problem.num_orders,
+            'total_locations': len(details)
+        }
+    }
+    if return_distance_matrix:
+        prepared['distance_matrix'] = data['distance_matrix'].tolist()
+
+    return {
+        'route_details': route_details,
+        'routes': routes,
+        'total_distance': total_distance,
+        'total_distance_km': round(total_distance / 1000, 2),
+        'unassigned_orders': unassigned,
+        'strategy': AssignmentStrategy.ORTOOLS_BALANCED,
+        'optimization_summary': {
+            'total_orders': problem.num_orders,
+            'assigned_orders': problem.num_orders - len(unassigned),
+            'unassigned_orders': len(unassigned),
+            'total_stops': total_stops,
+            'total_vehicles_used': vehicles_used,
+            'average_stops_per_vehicle': round(total_stops / max(data['num_vehicles'], 1), 2),
+            'objective': solution['objective'],
+            'solutions_found': solution['solutions_found'],
+            'solve_seconds': solution['solve_seconds'],
+            'warm_started': solution['warm_started'],
+            'search': solution.get('search'),
+            'search_starts': solution.get('starts'),
+            'clusters': solution.get('clusters'),
+            'repair_moves': solution.get('repair_moves'),
+            'traffic': solution.get('traffic')
+        },
+        'prepared': prepared
+    }
+
+
+# ---------------- Strategy Comparison ----------------
+# Inputs of running comparisons, inherited by the forked strategy workers
+_COMPARE_INPUTS = {}
+
+
+def run_compared_strategy(compare_id: str, strategy: str):
+    """Worker side of compare_strategies: one strategy on the shared problem and matrices"""
+    problem, matrices, solver_params = _COMPARE_INPUTS[compare_id]
+    started = time.monotonic()
+    result = prepare_data(problem, strategy, matrices=matrices, solver_params=solver_params)
+    return result, round(time.monotonic() - started, 3)
+
+
+def score_plan(problem: Problem, matrices, strategy: str, result: dict, runtime_seconds: float) -> dict:
+    """
+    Scorecard row for one plan. Distances follow every route depot -> stops
+    -> depot through the job's matrices, so greedy plans (visited in
+    assignment order) and OR-Tools routes are measured the same way.
+    """
+    from_locations, to_locations = [], []
+    loads = problem.pre_assigned_load.astype(np.float64)
+    restock_stops = 0
+    for details in result['route_details']:
+        sequence = [stop['location_index'] for stop in details['route']]
+        from_locations.extend(sequence[:-1])
+        to_locations.extend(sequence[1:])
+        loads[details['vehicle_id']] += details['total_load']
+        restock_stops += sum(1 for stop in details['route'] if stop.get('needs_restock'))
+    
+    total_meters = float(matrices.leg_distances(from_locations, to_locations).sum()) if from_locations else 0.0
+    unassigned = len(result['unassigned_orders'])
+    mean_load = float(loads.mean())
+    
+    return {
+        'strategy': strategy,
+        'total_km': round(total_meters / 1000, 2),
+        'assigned_count': problem.num_orders - unassigned,
+        'unassigned_count': unassigned,
+        'vehicles_used': sum(1 for details in result['route_details'] if details['stops_count'] > 0),
+        'max_load': int(loads.max()),
+        'min_load': int(loads.min()),
+        # Coefficient of variation of van loads: 0 means perfectly even
+        'load_imbalance': round(float(loads.std()) / mean_load, 3) if mean_load else 0.0,
+        'restock_stops': restock_stops,
+        'runtime_seconds': runtime_seconds
+    }
+
+
+def compare_strategies(problem: Problem, matrices, strategies: List[str], solver_params=None,
+                       progress_callback=None, should_stop=None) -> dict:
+    """
+    Run several strategies on one parsed problem and one set of matrices,
+    each in its own forked worker, and return every plan with a scorecard.
+    The recommended plan assigns the most orders, then drives the fewest km.
+    """
+    should_stop = should_stop or (lambda: False)
+    if AssignmentStrategy.ORTOOLS_BALANCED in strategies:
+        # Build the order block before forking so workers share it
+        matrices.order_to_order
+    
+    compare_id = uuid.uuid4().hex
+    _COMPARE_INPUTS[compare_id] = (problem, matrices, solver_params)
+    pool = multiprocessing.get_context("fork").Pool(max(min(len(strategies), COMPARE_WORKERS), 1),
+                                                    initializer=reset_sigterm)
+    try:
+        pending = {
+            strategy: pool.apply_async(run_compared_strategy, (compare_id, strategy))
+            for strategy in strategies
+        }
+        plans = {}
+        scorecard = []
+        while pending:
+            if should_stop():
+                # Cancelled or timed out: the caller discards the result
+                return None
+            for strategy, async_result in list(pending.items()):
+                if not async_result.ready():
+                    continue
+                del pending[strategy]
+                try:
+                    plan, runtime = async_result.get()
+                    plans[strategy] = plan
+                    scorecard.append(score_plan(problem, matrices, strategy, plan, runtime))
+                except Exception as e:
+                    print(f"ERROR comparing strategy {strategy}: {e}")
+                    scorecard.append({'strategy': strategy, 'error': str(e)})
+                if progress_callback:
+                    progress_callback(progress=10 + 85 * (len(strategies) - len(pending)) // len(strategies))
+            time.sleep(0.05)
+    finally:
+        pool.terminate()
+        pool.join()
+        _COMPARE_INPUTS.pop(compare_id, None)
+    
+    scored = [row for row in scorecard if 'error' not in row]
+    recommended = min(scored, key=lambda row: (row['unassigned_count'], row['total_km']))['strategy'] \
+        if scored else None
+    scorecard.sort(key=lambda row: strategies.index(row['strategy']))
+    
+    ortools_plan = plans.get(AssignmentStrategy.ORTOOLS_BALANCED) or {}
+    return {
+        'strategy': AssignmentStrategy.COMPARE,
+        'recommended': recommended,
+        'scorecard': scorecard,
+        'plans': {strategy: {k: v for k, v in plan.items() if k != 'prepared'} for strategy, plan in plans.items()},
+        'prepared': ortools_plan.get('prepared')
+    }
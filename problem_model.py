@@ -0,0 +1,350 @@
+import json
+from array import array
+from typing import Iterable, List
+
+import numpy as np
+
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson")
+
+# Per-record fields kept verbatim for location_info; everything else is columnar
+WAREHOUSE_INFO_FIELDS = ("name", "vehicle_name", "driver_name")
+ORDER_INFO_FIELDS = ("order_no", "client_object_name", "client_object_address", "client_phone")
+
+
+class Problem:
+    """
+    Columnar warehouses, stock and orders for one job, built once and
+    shared read-only by every strategy, the solver and the formatters.
+    Coordinates, capacities, demands and order items live in flat NumPy
+    arrays; order items are CSR (item_indptr / item_columns / item_quantities
+    over product columns), stock is a dense (W, P) matrix. Anything a
+    strategy changes (loads, remaining stock) is its own copy.
+    pinned_warehouses holds, per order, the warehouse a split-delivery
+    sub-order must ship from (see fulfillment.py), -1 for free orders.
+    """
+
+    def __init__(self, options: dict, warehouse_ids: list, warehouse_info: List[dict],
+                 warehouse_coords: np.ndarray, capacity: np.ndarray, pre_assigned_load: np.ndarray,
+                 pre_assigned_count: np.ndarray, product_ids: list, stock: np.ndarray,
+                 order_ids: list, order_info: List[dict], order_coords: np.ndarray, demands: np.ndarray,
+                 priorities: np.ndarray, service_times: np.ndarray, time_windows: list,
+                 item_indptr: np.ndarray, item_columns: np.ndarray, item_quantities: np.ndarray,
+                 pinned_warehouses: np.ndarray | None = None):
+        self.options = options
+        self.warehouse_ids = warehouse_ids
+        self.warehouse_info = warehouse_info
+        self.warehouse_coords = warehouse_coords
+        self.capacity = capacity
+        self.pre_assigned_load = pre_assigned_load
+        self.pre_assigned_count = pre_assigned_count
+        self.product_ids = product_ids
+        self.stock = stock
+        self.order_ids = order_ids
+        self.order_info = order_info
+        self.order_coords = order_coords
+        self.demands = demands
+        self.priorities = priorities
+        self.service_times = service_times  # -1 where the order uses the solver default
+        self.time_windows = time_windows
+        self.item_indptr = item_indptr
+        self.item_columns = item_columns
+        self.item_quantities = item_quantities
+        if pinned_warehouses is None:
+            pinned_warehouses = np.full(len(order_ids), -1, dtype=np.int64)
+        self.pinned_warehouses = pinned_warehouses
+        for values in (warehouse_coords, capacity, pre_assigned_load, pre_assigned_count, stock,
+                       order_coords, demands, priorities, service_times,
+                       item_indptr, item_columns, item_quantities, pinned_warehouses):
+            values.setflags(write=False)
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> 'Problem':
+        """Build from an /ortools/optimize JSON payload"""
+        builder = ProblemBuilder()
+        builder.options = {k: v for k, v in payload.items() if k not in ('warehouses', 'orders')}
+        for wh in payload.get('warehouses', []):
+            builder.add_warehouse(wh)
+        for order in payload.get('orders', []):
+            builder.add_order(order)
+        return builder.build()
+
+    @property
+    def num_warehouses(self) -> int:
+        return len(self.warehouse_ids)
+
+    @property
+    def num_orders(self) -> int:
+        return len(self.order_ids)
+
+    @property
+    def has_pinned_orders(self) -> bool:
+        return bool(np.any(self.pinned_warehouses >= 0))
+
+    def order_items(self, order_idx: int) -> List[dict]:
+        start, end = self.item_indptr[order_idx], self.item_indptr[order_idx + 1]
+        return [
+            {'product_id': self.product_ids[col], 'quantity': int(qty)}
+            for col, qty in zip(self.item_columns[start:end].tolist(), self.item_quantities[start:end].tolist())
+        ]
+
+    def select_orders(self, order_indices, **overrides) -> 'Problem':
+        """
+        The same fleet with only some orders (indices, in the new sequence);
+        warehouse fields can be replaced through overrides, e.g. stock=...
+        """
+        order_indices = np.asarray(order_indices, dtype=np.int64)
+        counts = np.diff(self.item_indptr)[order_indices]
+        item_positions = np.concatenate(
+            [np.arange(self.item_indptr[idx], self.item_indptr[idx + 1]) for idx in order_indices.tolist()]
+        ) if len(order_indices) else np.empty(0, dtype=np.int64)
+        fields = {
+            'options': self.options,
+            'warehouse_ids': self.warehouse_ids,
+            'warehouse_info': self.warehouse_info,
+            'warehouse_coords': self.warehouse_coords,
+            'capacity': self.capacity,
+            'pre_assigned_load': self.pre_assigned_load,
+            'pre_assigned_count': self.pre_assigned_count,
+            'product_ids': self.product_ids,
+            'stock': self.stock,
+            'order_ids': [self.order_ids[idx] for idx in order_indices.tolist()],
+            'order_info': [self.order_info[idx] for idx in order_indices.tolist()],
+            'order_coords': self.order_coords[order_indices],
+            'demands': self.demands[order_indices],
+            'priorities': self.priorities[order_indices],
+            'service_times': self.service_times[order_indices],
+            'time_windows': [self.time_windows[idx] for idx in order_indices.tolist()],
+            'item_indptr': np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            'item_columns': self.item_columns[item_positions],
+            'item_quantities': self.item_quantities[item_positions],
+            'pinned_warehouses': self.pinned_warehouses[order_indices],
+        }
+        fields.update(overrides)
+        return Problem(**fields)
+
+    def to_payload(self) -> dict:
+        """Expand into the /ortools/optimize JSON payload shape"""
+        warehouses = []
+        for wh_idx, wh_id in enumerate(self.warehouse_ids):
+            held = np.flatnonzero(self.stock[wh_idx])
+            warehouses.append({
+                'id': wh_id,
+                **self.warehouse_info[wh_idx],
+                'latitude': float(self.warehouse_coords[wh_idx, 0]),
+                'longitude': float(self.warehouse_coords[wh_idx, 1]),
+                'capacity': int(self.capacity[wh_idx]),
+                'pre_assigned_load': int(self.pre_assigned_load[wh_idx]),
+                'pre_assigned_count': int(self.pre_assigned_count[wh_idx]),
+                'products': [
+                    {'product_id': self.product_ids[col], 'quantity': int(self.stock[wh_idx, col])}
+                    for col in held.tolist()
+                ]
+            })
+
+        orders = []
+        for order_idx, order_id in enumerate(self.order_ids):
+            order = {
+                'order_id': order_id,
+                **self.order_info[order_idx],
+                'client_object_latitude': float(self.order_coords[order_idx, 0]),
+                'client_object_longitude': float(self.order_coords[order_idx, 1]),
+                'priority': int(self.priorities[order_idx]),
+                'order_items': self.order_items(order_idx)
+            }
+            if self.service_times[order_idx] >= 0:
+                order['service_time_minutes'] = int(self.service_times[order_idx])
+            if self.time_windows[order_idx] is not None:
+                order['time_window'] = list(self.time_windows[order_idx])
+            orders.append(order)
+
+        return {**self.options, 'warehouses': warehouses, 'orders': orders}
+
+    def save(self, path: str):
+        """Write to an .npz file: arrays as-is, ids and display fields as one JSON string"""
+        meta = {
+            'options': self.options,
+            'warehouse_ids': self.warehouse_ids,
+            'warehouse_info': self.warehouse_info,
+            'product_ids': self.product_ids,
+            'order_ids': self.order_ids,
+            'order_info': self.order_info,
+            'time_windows': self.time_windows,
+        }
+        np.savez(
+            path,
+            meta=np.array(json.dumps(meta)),
+            warehouse_coords=self.warehouse_coords,
+            capacity=self.capacity,
+            pre_assigned_load=self.pre_assigned_load,
+            pre_assigned_count=self.pre_assigned_count,
+            stock=self.stock,
+            order_coords=self.order_coords,
+            demands=self.demands,
+            priorities=self.priorities,
+            service_times=self.service_times,
+            item_indptr=self.item_indptr,
+            item_columns=self.item_columns,
+            item_quantities=self.item_quantities,
+            pinned_warehouses=self.pinned_warehouses,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'Problem':
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {key: data[key] for key in data.files if key != 'meta'}
+        return cls(**meta, **arrays)
+
+
+# ---------------- NDJSON Ingestion ----------------
+class ProblemBuilder:
+    """
+    Accumulates records one at a time into growable typed arrays, so a
+    streamed payload is never materialized as nested dicts.
+    """
+
+    def __init__(self):
+        self.options = {}
+        self.product_columns = {}
+
+        self.warehouse_positions = {}
+        self.warehouse_ids = []
+        self.warehouse_info = []
+        self.warehouse_coords = array('d')
+        self.capacity = array('q')
+        self.pre_assigned_load = array('q')
+        self.pre_assigned_count = array('q')
+        # Stock as (warehouse row, product column, quantity); inventory records name
+        # their warehouse by id, which may come later, so those rows are resolved in build()
+        self.stock_rows = array('q')
+        self.stock_row_ids = {}
+        self.stock_columns = array('q')
+        self.stock_quantities = array('q')
+
+        self.order_ids = []
+        self.order_info = []
+        self.order_coords = array('d')
+        self.demands = array('q')
+        self.priorities = array('q')
+        self.service_times = array('q')
+        self.time_windows = []
+        self.item_indptr = array('q', [0])
+        self.item_columns = array('q')
+        self.item_quantities = array('q')
+
+    def _column(self, product_id) -> int:
+        if product_id not in self.product_columns:
+            self.product_columns[product_id] = len(self.product_columns)
+        return self.product_columns[product_id]
+
+    def add(self, record: dict):
+        kind = record.get('type')
+        if kind == 'options':
+            self.options.update({k: v for k, v in record.items() if k != 'type'})
+        elif kind == 'warehouse':
+            self.add_warehouse(record)
+        elif kind == 'inventory':
+            self.add_stock(record.get('warehouse_id'), record.get('product_id'), record.get('quantity', 0))
+        elif kind == 'order':
+            self.add_order(record)
+        else:
+            raise ValueError(f"Unknown record type: {kind!r}")
+
+    def add_warehouse(self, record: dict):
+        wh_id = record.get('id')
+        wh_idx = len(self.warehouse_ids)
+        self.warehouse_positions.setdefault(wh_id, wh_idx)
+        self.warehouse_ids.append(wh_id)
+        self.warehouse_info.append({key: record.get(key) for key in WAREHOUSE_INFO_FIELDS})
+        self.warehouse_coords.extend((float(record['latitude']), float(record['longitude'])))
+        self.capacity.append(int(record.get('capacity', 100)))
+        self.pre_assigned_load.append(int(record.get('pre_assigned_load', 0)))
+        self.pre_assigned_count.append(int(record.get('pre_assigned_count', 0)))
+        for item in record.get('products', []):
+            self.stock_rows.append(wh_idx)
+            self.stock_columns.append(self._column(item['product_id']))
+            self.stock_quantities.append(int(item['quantity']))
+
+    def add_stock(self, wh_id, product_id, quantity):
+        self.stock_row_ids[len(self.stock_rows)] = wh_id
+        self.stock_rows.append(-1)
+        self.stock_columns.append(self._column(product_id))
+        self.stock_quantities.append(int(quantity))
+
+    def add_order(self, record: dict):
+        self.order_ids.append(record.get('order_id'))
+        self.order_info.append({key: record.get(key) for key in ORDER_INFO_FIELDS})
+        self.order_coords.extend((float(record['client_object_latitude']),
+                                  float(record['client_object_longitude'])))
+        demand = 0
+        for item in record.get('order_items', []):
+            quantity = int(item.get('quantity', 0))
+            self.item_columns.append(self._column(item.get('product_id')))
+            self.item_quantities.append(quantity)
+            demand += quantity
+        self.item_indptr.append(len(self.item_columns))
+        self.demands.append(demand)
+        self.priorities.append(int(record.get('priority', 5)))
+        self.service_times.append(int(record.get('service_time_minutes', -1)))
+        window = record.get('time_window')
+        self.time_windows.append([int(window[0]), int(window[1])] if window else None)
+
+    def build(self) -> Problem:
+        num_warehouses = len(self.warehouse_ids)
+        stock = np.zeros((num_warehouses, len(self.product_columns)), dtype=np.int64)
+        if self.stock_rows:
+            unknown = {wh_id for wh_id in self.stock_row_ids.values() if wh_id not in self.warehouse_positions}
+            if unknown:
+                raise ValueError(f"Inventory for unknown warehouses: {sorted(map(str, unknown))}")
+            rows = np.array(self.stock_rows, dtype=np.int64)
+            for entry, wh_id in self.stock_row_ids.items():
+                rows[entry] = self.warehouse_positions[wh_id]
+            columns = np.frombuffer(self.stock_columns, dtype=np.int64)
+            quantities = np.frombuffer(self.stock_quantities, dtype=np.int64)
+            # Repeated (warehouse, product) rows: the last one wins, as in InventoryIndex
+            keys = rows * len(self.product_columns) + columns
+            _, reversed_first = np.unique(keys[::-1], return_index=True)
+            last = len(keys) - 1 - reversed_first
+            stock[rows[last], columns[last]] = quantities[last]
+
+        return Problem(
+            options=self.options,
+            warehouse_ids=self.warehouse_ids,
+            warehouse_info=self.warehouse_info,
+            warehouse_coords=np.frombuffer(self.warehouse_coords, dtype=np.float64).reshape(-1, 2),
+            capacity=np.frombuffer(self.capacity, dtype=np.int64),
+            pre_assigned_load=np.frombuffer(self.pre_assigned_load, dtype=np.int64),
+            pre_assigned_count=np.frombuffer(self.pre_assigned_count, dtype=np.int64),
+            product_ids=list(self.product_columns),
+            stock=stock,
+            order_ids=self.order_ids,
+            order_info=self.order_info,
+            order_coords=np.frombuffer(self.order_coords, dtype=np.float64).reshape(-1, 2),
+            demands=np.frombuffer(self.demands, dtype=np.int64),
+            priorities=np.frombuffer(self.priorities, dtype=np.int64),
+            service_times=np.frombuffer(self.service_times, dtype=np.int64),
+            time_windows=self.time_windows,
+            item_indptr=np.frombuffer(self.item_indptr, dtype=np.int64),
+            item_columns=np.frombuffer(self.item_columns, dtype=np.int64),
+            item_quantities=np.frombuffer(self.item_quantities, dtype=np.int64),
+        )
+
+
+def parse_ndjson(lines: Iterable[bytes]) -> Problem:
+    """
+    Build a Problem from newline-delimited JSON records, one line at a time:
+      {"type": "options", "strategy": ..., "solver_params": {...}, ...}
+      {"type": "warehouse", "id", "latitude", "longitude", "capacity", ..., "products"?: [...]}
+      {"type": "inventory", "warehouse_id", "product_id", "quantity"}
+      {"type": "order", "order_id", "client_object_latitude", ..., "order_items": [...]}
+    """
+    builder = ProblemBuilder()
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            builder.add(json.loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid NDJSON record on line {line_no}: {e}") from e
+    return builder.build()
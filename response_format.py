@@ -0,0 +1,109 @@
+import json
+from typing import Dict, List
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for format=msgpack
+    msgpack = None
+
+
+# 'json' is the full result; 'compact' keeps each location once in a columnar
+# lookup table that routes index into; 'msgpack' is the compact body in msgpack
+RESPONSE_FORMATS = ("json", "compact", "msgpack")
+MSGPACK_MIMETYPE = "application/msgpack"
+POLYLINE_PRECISION = 1e5
+
+# Route keys the compact form replaces: stops become table rows, and the
+# warehouse is the row of the first stop
+COMPACT_DROPPED_ROUTE_KEYS = ("route", "warehouse_info")
+
+
+# ---------------- Polylines ----------------
+def encode_polyline(coords) -> str:
+    """Google encoded polyline of (lat, lng) points, at 5 decimal places"""
+    points = np.rint(np.asarray(coords, dtype=np.float64).reshape(-1, 2) * POLYLINE_PRECISION).astype(np.int64)
+    if not len(points):
+        return ""
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zigzag: sign goes to the lowest bit
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+    chars = []
+    for value in values:
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+# ---------------- Compact Results ----------------
+def location_key(stop: dict) -> tuple:
+    """
+    Lookup-table identity of a stop: its location and kind. A van's start
+    and end share their warehouse's row; restock visits and split sub-orders
+    differ by the items they carry.
+    """
+    info = stop.get('location_info') or {}
+    items = info.get('items')
+    return stop['location_index'], info.get('type'), json.dumps(items, sort_keys=True) if items else None
+
+
+def compact_result(result: dict) -> dict:
+    """
+    Re-encode a plan (greedy or OR-Tools shape): every location's info
+    appears once, as a column in result['locations'], and each route
+    lists its stops as row numbers into it, with per-stop values (load,
+    demand, arrival...) as parallel arrays in 'stop_values'. The OR-Tools 'routes' copy
+    of route_details is dropped; everything else is kept as is.
+    """
+    if 'route_details' not in result:
+        return result
+    rows: Dict[tuple, int] = {}
+    infos: List[dict] = []
+    route_details = []
+    for details in result.get('route_details') or []:
+        stops = details.get('route') or []
+        row_ids = []
+        columns: Dict[str, list] = {}
+        for position, stop in enumerate(stops):
+            key = location_key(stop)
+            if key not in rows:
+                rows[key] = len(infos)
+                infos.append({**(stop.get('location_info') or {}), 'location_index': stop['location_index']})
+            row_ids.append(rows[key])
+            for name, value in stop.items():
+                if name in ('location_index', 'location_info'):
+                    continue
+                # Keys only some stops have (needs_restock...) are None elsewhere
+                columns.setdefault(name, [None] * position).append(value)
+            for values in columns.values():
+                if len(values) < position + 1:
+                    values.append(None)
+
+        compact = {k: v for k, v in details.items() if k not in COMPACT_DROPPED_ROUTE_KEYS}
+        compact['warehouse'] = row_ids[0] if row_ids else None
+        compact['stops'] = row_ids
+        compact['stop_values'] = columns
+        route_details.append(compact)
+
+    names = dict.fromkeys(name for info in infos for name in info)
+    locations = {name: [info.get(name) for info in infos] for name in names}
+
+    return {
+        **{k: v for k, v in result.items() if k not in ('route_details', 'routes')},
+        'format': 'compact',
+        'locations': locations,
+        'route_details': route_details,
+    }
+
+
+def available_formats() -> tuple:
+    return RESPONSE_FORMATS if msgpack is not None else tuple(f for f in RESPONSE_FORMATS if f != "msgpack")
+
+
+def pack_msgpack(body) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed on this server; use format=compact")
+    return msgpack.packb(body, use_bin_type=True)
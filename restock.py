@@ -0,0 +1,155 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from inventory_index import InventoryIndex
+from problem_model import Problem
+
+
+# Every van loads only what its own stops take (route 'depot_load'), so a
+# warehouse's leftover stock stays at the depot for other vans to collect at
+# any time, without meeting its van on the road
+DONOR_POLICY = "depot_reload"
+DONOR_POLICY_NOTE = ("Vans load only their route's depot_load; restock pickups collect "
+                     "the remaining stock from the depot")
+
+
+# ---------------- Shortfalls ----------------
+def route_shortfalls(inventory: InventoryIndex,
+                     assignments: Dict[int, List[dict]]) -> Dict[int, List[Tuple[dict, np.ndarray, np.ndarray]]]:
+    """
+    Walk every van's stops in order, delivering from its own stock.
+    Returns {van: [(stop entry, product columns, missing quantities)]};
+    inventory.stock is left holding what each van has over afterwards.
+    """
+    stock = inventory.stock
+    shortfalls = {}
+    for wh_idx, entries in assignments.items():
+        for entry in entries:
+            order_idx = entry['order_index']
+            cols = inventory.order_columns[order_idx]
+            required = inventory.order_quantities[order_idx]
+            held = stock[wh_idx, cols]
+            missing = np.maximum(required - held, 0)
+            stock[wh_idx, cols] = np.maximum(held - required, 0)
+            if missing.any():
+                shortfalls.setdefault(wh_idx, []).append((entry, cols[missing > 0], missing[missing > 0]))
+    return shortfalls
+
+
+def pick_donors(stock: np.ndarray, distances: np.ndarray, wh_idx: int,
+                need: Dict[int, int]) -> List[Tuple[int, Dict[int, int]]]:
+    """
+    Warehouses to collect a van's missing products from, as [(warehouse,
+    {product column: quantity})]: the nearest one that has everything
+    left at its depot, else the one covering the most units (nearest on
+    ties), until nothing more can be found. Takes the picked quantities
+    out of stock.
+    """
+    need = dict(need)
+    donors = []
+    while need:
+        cols = np.array(list(need), dtype=np.int64)
+        wanted = np.array(list(need.values()), dtype=np.int64)
+        covered = np.minimum(stock[:, cols], wanted).sum(axis=1)
+        covered[wh_idx] = 0
+        if not covered.any():
+            break
+        best = int(covered.max())
+        candidates = np.flatnonzero(covered == best)
+        donor = int(candidates[np.argmin(distances[candidates])])
+
+        taken = np.minimum(stock[donor, cols], wanted)
+        stock[donor, cols] -= taken
+        items = {}
+        for col, quantity in zip(cols.tolist(), taken.tolist()):
+            if quantity:
+                items[col] = quantity
+                need[col] -= quantity
+                if not need[col]:
+                    del need[col]
+        donors.append((donor, items))
+    return donors
+
+
+# ---------------- Restock Visits ----------------
+def entry_location(num_warehouses: int, entry: dict) -> int:
+    """Routing location index of a plan entry: its order, or the warehouse of a restock visit"""
+    if 'restock_from' in entry:
+        return entry['restock_from']
+    return num_warehouses + entry['order_index']
+
+
+def cheapest_position(matrices, num_warehouses: int, wh_idx: int, entries: List[dict],
+                      donor: int, deadline: int) -> int:
+    """Position at or before deadline where a detour to donor adds the least distance"""
+    sequence = [wh_idx] + [entry_location(num_warehouses, entry) for entry in entries[:deadline + 1]]
+    previous = sequence[:-1]
+    following = sequence[1:]
+    added = matrices.leg_distances(previous, [donor] * len(previous)) + \
+        matrices.leg_distances([donor] * len(following), following) - \
+        matrices.leg_distances(previous, following)
+    return int(np.argmin(added))
+
+
+def plan_restock_trips(problem: Problem, matrices, result: dict, strategy: str) -> dict:
+    """
+    Make a greedy plan executable where vans are short of stock: each van
+    collects what its stops lack from the stock other warehouses keep at
+    their depot once their own vans are loaded (see DONOR_POLICY and
+    pick_donors), as a restock visit inserted at the cheapest point before
+    the first stop needing it.
+    Restock entries go into result['assignments'] in stop order; stops
+    that are fully covered get restock_planned, and result['depot_loads']
+    holds what each van loads at its own depot. Returns a summary.
+    """
+    inventory = InventoryIndex(problem)
+    num_warehouses = problem.num_warehouses
+    assignments = result['assignments']
+    loaded = inventory.stock.copy()
+    shortfalls = route_shortfalls(inventory, assignments)
+    loaded -= inventory.stock
+    result['depot_loads'] = {
+        wh_idx: [{'product_id': problem.product_ids[col], 'quantity': int(loaded[wh_idx, col])}
+                 for col in np.flatnonzero(loaded[wh_idx]).tolist()]
+        for wh_idx, entries in assignments.items() if entries
+    }
+
+    visits = 0
+    uncovered = 0
+    for wh_idx in sorted(shortfalls):
+        entries = assignments[wh_idx]
+        need = {}
+        for _, cols, missing in shortfalls[wh_idx]:
+            for col, quantity in zip(cols.tolist(), missing.tolist()):
+                need[col] = need.get(col, 0) + quantity
+
+        collected = {}
+        for donor, items in pick_donors(inventory.stock, matrices.warehouse_to_warehouse[wh_idx], wh_idx, need):
+            # Collected before the first stop that is short of any of these products
+            first_short = next(entry for entry, cols, _ in shortfalls[wh_idx] if np.isin(cols, list(items)).any())
+            deadline = next(position for position, entry in enumerate(entries) if entry is first_short)
+            position = cheapest_position(matrices, num_warehouses, wh_idx, entries, donor, deadline)
+            entries.insert(position, {
+                'restock_from': donor,
+                'warehouse_id': problem.warehouse_ids[donor],
+                'items': [{'product_id': problem.product_ids[col], 'quantity': int(quantity)}
+                          for col, quantity in items.items()],
+                'distance': int(matrices.warehouse_to_warehouse[wh_idx, donor]),
+                'strategy': strategy
+            })
+            visits += 1
+            for col, quantity in items.items():
+                collected[col] = collected.get(col, 0) + quantity
+
+        # Collected stock goes to the short stops in route order
+        for entry, cols, missing in shortfalls[wh_idx]:
+            if all(collected.get(col, 0) >= quantity for col, quantity in zip(cols.tolist(), missing.tolist())):
+                for col, quantity in zip(cols.tolist(), missing.tolist()):
+                    collected[col] -= quantity
+                entry['restock_planned'] = True
+            else:
+                uncovered += 1
+
+    return {'restock_visits': visits, 'restocked_stops': sum(len(short) for short in shortfalls.values()) - uncovered,
+            'uncovered_stops': uncovered, 'donor_policy': DONOR_POLICY}
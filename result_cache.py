@@ -0,0 +1,156 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Coordinates rounded to ~1 m so float noise from the DB layer doesn't miss the cache
+COORDINATE_DECIMALS = 5
+
+# Payload keys that change the answer; anything else (e.g. 'inventories',
+# 'matched_orders' sent by RoutePlannerService) is ignored.
+FINGERPRINT_KEYS = ("strategy", "solver_params", "matrix_dtype", "matrix_provider", "zone_size_km",
+                    "return_distance_matrix", "compare_strategies", "fulfillment", "plan_restock")
+
+
+def _round(value):
+    return round(float(value), COORDINATE_DECIMALS)
+
+
+def _normalize_warehouse(wh: dict) -> dict:
+    return {
+        'id': wh.get('id'),
+        'latitude': _round(wh['latitude']),
+        'longitude': _round(wh['longitude']),
+        'capacity': wh.get('capacity', 100),
+        'pre_assigned_load': wh.get('pre_assigned_load', 0),
+        'pre_assigned_count': wh.get('pre_assigned_count', 0),
+        'products': sorted(
+            (item['product_id'], int(item['quantity'])) for item in wh.get('products', [])
+        ),
+        # Returned verbatim in location_info
+        'name': wh.get('name'),
+        'vehicle_name': wh.get('vehicle_name'),
+        'driver_name': wh.get('driver_name'),
+    }
+
+
+def _normalize_order(order: dict) -> dict:
+    return {
+        'order_id': order.get('order_id'),
+        'latitude': _round(order['client_object_latitude']),
+        'longitude': _round(order['client_object_longitude']),
+        'items': sorted(
+            (item.get('product_id'), int(item.get('quantity', 0))) for item in order.get('order_items', [])
+        ),
+        'priority': order.get('priority', 5),
+        'time_window': order.get('time_window'),
+        'service_time_minutes': order.get('service_time_minutes'),
+        'order_no': order.get('order_no'),
+        'client_object_name': order.get('client_object_name'),
+        'client_object_address': order.get('client_object_address'),
+        'client_phone': order.get('client_phone'),
+    }
+
+
+def payload_fingerprint(payload: dict) -> str:
+    """
+    Canonical SHA-256 of everything in the payload that affects the result.
+    Inventory and order items are sorted, coordinates rounded and unused keys
+    dropped. Warehouse and order sequence is kept: vehicle ids and
+    location indices in the cached result refer to it.
+    """
+    canonical = {
+        'warehouses': [_normalize_warehouse(wh) for wh in payload.get('warehouses', [])],
+        'orders': [_normalize_order(order) for order in payload.get('orders', [])],
+    }
+    for key in FINGERPRINT_KEYS:
+        if key in payload:
+            canonical[key] = payload[key]
+
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def problem_fingerprint(problem) -> str:
+    """payload_fingerprint for a columnar Problem (NDJSON submissions), hashed array by array"""
+    digest = hashlib.sha256()
+    header = {
+        'warehouse_ids': problem.warehouse_ids,
+        'warehouse_info': problem.warehouse_info,
+        'product_ids': problem.product_ids,
+        'order_ids': problem.order_ids,
+        'order_info': problem.order_info,
+        'time_windows': problem.time_windows,
+        'options': {key: problem.options[key] for key in FINGERPRINT_KEYS if key in problem.options},
+    }
+    digest.update(json.dumps(header, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8'))
+    for values in (np.round(problem.warehouse_coords, COORDINATE_DECIMALS), problem.capacity,
+                   problem.pre_assigned_load, problem.pre_assigned_count, problem.stock,
+                   np.round(problem.order_coords, COORDINATE_DECIMALS), problem.priorities,
+                   problem.service_times, problem.item_indptr, problem.item_columns, problem.item_quantities):
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU map of payload fingerprint -> job id, bounded by entry count.
+    Running jobs are tracked too, so identical concurrent submissions
+    coalesce onto the job already in flight.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def claim(self, fingerprint: str, job_id: str, job_status) -> tuple:
+        """
+        Return (job_id, status) of a reusable job for this fingerprint, or
+        register job_id as the new owner and return (None, None).
+        job_status(job_id) gives a job's current status, or None if it is gone.
+        Lookup and registration happen under one lock, so concurrent identical
+        submissions cannot both miss.
+        """
+        with self._lock:
+            existing = self._entries.get(fingerprint)
+            if existing is not None:
+                status = job_status(existing)
+                if status == 'done':
+                    self._entries.move_to_end(fingerprint)
+                    self.hits += 1
+                    return existing, status
+                if status in ('running', 'processing'):
+                    self.coalesced += 1
+                    return existing, status
+                # Failed, cancelled or evicted: solve again
+
+            self.misses += 1
+            self._entries[fingerprint] = job_id
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return None, None
+
+    def discard(self, fingerprint: str, job_id: str | None = None):
+        with self._lock:
+            if job_id is None or self._entries.get(fingerprint) == job_id:
+                self._entries.pop(fingerprint, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
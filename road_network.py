@@ -0,0 +1,235 @@
+import heapq
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from distance_matrix import haversine_matrix, haversine_pairs
+from spatial_index import WarehouseGrid
+
+
+# Graph files in a road graph directory, all plain .npy so they can be memory-mapped
+GRAPH_FILES = ("indptr", "indices", "weights", "node_coords")
+SNAP_CELL_KM = 0.5
+# Pairs the graph cannot connect fall back to straight-line distance times this
+UNREACHABLE_DETOUR_FACTOR = 1.4
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS road_distances (
+    origin_node INTEGER NOT NULL,
+    dest_node INTEGER NOT NULL,
+    meters REAL NOT NULL,
+    PRIMARY KEY (origin_node, dest_node)
+) WITHOUT ROWID;
+"""
+
+
+def save_road_graph(path: str, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray,
+                    node_coords: np.ndarray):
+    """
+    Write a directed road graph in CSR form: the edges leaving node u are
+    indices[indptr[u]:indptr[u + 1]] with lengths in meters in weights,
+    node_coords is (N, 2) lat/lng. Meant for an offline OSM extraction step.
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "indptr.npy"), np.asarray(indptr, dtype=np.int64))
+    np.save(os.path.join(path, "indices.npy"), np.asarray(indices, dtype=np.int32))
+    np.save(os.path.join(path, "weights.npy"), np.asarray(weights, dtype=np.float32))
+    np.save(os.path.join(path, "node_coords.npy"), np.asarray(node_coords, dtype=np.float64))
+
+
+class RoadDistanceCache:
+    """
+    Persistent origin node -> destination node road distances (SQLite, WAL).
+    Keys are snapped graph nodes, so every client object on the same node
+    shares entries across jobs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(CACHE_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, and a fresh one after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_row(self, origin_node: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(dest_nodes, meters) cached for origin_node; inf marks unreachable"""
+        rows = self._conn().execute(
+            "SELECT dest_node, meters FROM road_distances WHERE origin_node = ?", (origin_node,)
+        ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        nodes, meters = zip(*rows)
+        return np.array(nodes, dtype=np.int64), np.array(meters, dtype=np.float64)
+
+    def put_row(self, origin_node: int, distances: Dict[int, float]):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO road_distances (origin_node, dest_node, meters) VALUES (?, ?, ?)",
+                [(origin_node, dest, meters) for dest, meters in distances.items()]
+            )
+
+
+class RoadNetwork:
+    """
+    Road distances over a local CSR graph, usable wherever haversine_matrix is:
+    network(origins, destinations, dtype) -> (N, M) meters.
+    Points snap to their nearest graph node; the off-road legs to and from
+    the snapped nodes are added as straight lines.
+    """
+
+    def __init__(self, path: str, cache_path: str | None = None):
+        self.path = path
+        # Plain ndarray views of the memory maps: same pages, no memmap overhead per slice
+        graph = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+                 for name in GRAPH_FILES}
+        self.indptr = graph["indptr"]
+        self.indices = graph["indices"]
+        self.weights = graph["weights"]
+        self.node_coords = graph["node_coords"]
+        self.grid = WarehouseGrid(self.node_coords, SNAP_CELL_KM)
+        self.cache = RoadDistanceCache(cache_path or os.path.join(path, "distance_cache.sqlite3"))
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    def snap(self, coords: np.ndarray) -> np.ndarray:
+        """Nearest graph node of every (lat, lng)"""
+        return np.array([next(self.grid.nearest(lat, lng))[0] for lat, lng in coords], dtype=np.int64)
+
+    def shortest_paths(self, origin_node: int, targets: set) -> Dict[int, float]:
+        """Dijkstra from origin_node, stopping once every target is settled; inf if unreachable"""
+        remaining = set(targets)
+        settled = {}
+        heap = [(0.0, origin_node)]
+        best = {origin_node: 0.0}
+        while heap and remaining:
+            distance, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = distance
+            remaining.discard(node)
+            start, end = int(self.indptr[node]), int(self.indptr[node + 1])
+            for neighbor, weight in zip(self.indices[start:end].tolist(), self.weights[start:end].tolist()):
+                candidate = distance + weight
+                if candidate < best.get(neighbor, float("inf")):
+                    best[neighbor] = candidate
+                    heapq.heappush(heap, (candidate, neighbor))
+        return {node: settled.get(node, float("inf")) for node in targets}
+
+    def node_distances(self, origin_nodes: np.ndarray, dest_nodes: np.ndarray) -> np.ndarray:
+        """
+        (N, M) road meters between snapped nodes, inf where unreachable.
+        Cached rows are read first; Dijkstra runs only for missing pairs and
+        its results are written back.
+        """
+        unique_origins, origin_rows = np.unique(origin_nodes, return_inverse=True)
+        unique_dests, dest_columns = np.unique(dest_nodes, return_inverse=True)
+        matrix = np.full((len(unique_origins), len(unique_dests)), np.nan)
+
+        for row, origin in enumerate(unique_origins.tolist()):
+            cached_nodes, cached_meters = self.cache.get_row(origin)
+            positions = np.searchsorted(unique_dests, cached_nodes)
+            wanted = (positions < len(unique_dests)) & \
+                (unique_dests[np.minimum(positions, len(unique_dests) - 1)] == cached_nodes)
+            matrix[row, positions[wanted]] = cached_meters[wanted]
+
+            missing = np.flatnonzero(np.isnan(matrix[row]))
+            if len(missing):
+                found = self.shortest_paths(origin, set(unique_dests[missing].tolist()))
+                self.cache.put_row(origin, found)
+                matrix[row, missing] = [found[node] for node in unique_dests[missing].tolist()]
+
+        return matrix[np.ix_(origin_rows, dest_columns)]
+
+    def pairs(self, origins: np.ndarray, destinations: np.ndarray, dtype=np.float64) -> np.ndarray:
+        """Element-wise road meters from origins[i] to destinations[i]"""
+        origins = np.asarray(origins, dtype=np.float64)
+        destinations = np.asarray(destinations, dtype=np.float64)
+        origin_nodes = self.snap(origins)
+        dest_nodes = self.snap(destinations)
+
+        road = np.empty(len(origins))
+        for origin in np.unique(origin_nodes).tolist():
+            legs = np.flatnonzero(origin_nodes == origin)
+            cached_nodes, cached_meters = self.cache.get_row(origin)
+            known = dict(zip(cached_nodes.tolist(), cached_meters.tolist()))
+            missing = {int(node) for node in dest_nodes[legs].tolist() if node not in known}
+            if missing:
+                found = self.shortest_paths(origin, missing)
+                self.cache.put_row(origin, found)
+                known.update(found)
+            road[legs] = [known[node] for node in dest_nodes[legs].tolist()]
+
+        distances = haversine_pairs(origins, self.node_coords[origin_nodes]) + road + \
+            haversine_pairs(self.node_coords[dest_nodes], destinations)
+        unreachable = np.isinf(road)
+        distances[unreachable] = UNREACHABLE_DETOUR_FACTOR * haversine_pairs(origins, destinations)[unreachable]
+        distances[np.all(origins == destinations, axis=1)] = 0
+        return distances.astype(dtype, copy=False)
+
+    def __call__(self, origins: np.ndarray, destinations: np.ndarray, dtype=np.float64) -> np.ndarray:
+        origins = np.asarray(origins, dtype=np.float64)
+        destinations = np.asarray(destinations, dtype=np.float64)
+        if not len(origins) or not len(destinations):
+            return np.zeros((len(origins), len(destinations)), dtype=dtype)
+        origin_nodes = self.snap(origins)
+        dest_nodes = self.snap(destinations)
+
+        origin_legs = haversine_pairs(origins, self.node_coords[origin_nodes])
+        dest_legs = haversine_pairs(self.node_coords[dest_nodes], destinations)
+        road = self.node_distances(origin_nodes, dest_nodes)
+
+        distances = origin_legs[:, np.newaxis] + road + dest_legs[np.newaxis, :]
+        unreachable = np.isinf(road)
+        if unreachable.any():
+            print(f"Road network: {int(unreachable.sum())} unreachable pairs, using straight-line distance")
+            distances[unreachable] = UNREACHABLE_DETOUR_FACTOR * haversine_matrix(origins, destinations)[unreachable]
+
+        if origins.shape == destinations.shape and np.array_equal(origins, destinations):
+            np.fill_diagonal(distances, 0)
+        return distances.astype(dtype, copy=False)
+
+
+# ---------------- Providers ----------------
+_road_networks = {}
+_road_networks_lock = threading.Lock()
+
+
+def load_road_network(path: str) -> RoadNetwork:
+    """One RoadNetwork per graph directory for the life of the process"""
+    with _road_networks_lock:
+        if path not in _road_networks:
+            _road_networks[path] = RoadNetwork(path)
+        return _road_networks[path]
+
+
+def available_providers(road_graph_path: str | None) -> List[str]:
+    return ["haversine", "road"] if road_graph_path else ["haversine"]
+
+
+def resolve_provider(name: str | None, road_graph_path: str | None, default: str = "haversine"):
+    """Map a payload 'matrix_provider' value to a distance function"""
+    name = name or default
+    if name == "haversine":
+        return haversine_matrix
+    if name == "road":
+        if not road_graph_path:
+            raise ValueError("matrix_provider 'road' needs ORTOOLS_ROAD_GRAPH to point at a road graph")
+        return load_road_network(road_graph_path)
+    raise ValueError(f"Invalid matrix_provider. Must be one of: {available_providers(road_graph_path)}")
@@ -0,0 +1,520 @@
+import multiprocessing
+import os
+import queue
+import time
+import weakref
+from typing import Callable, List
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+from job_runner import reset_sigterm
+
+
+DEFAULT_SOLVER_PARAMS = {
+    "time_limit_seconds": 30,
+    "first_solution_strategy": "PATH_CHEAPEST_ARC",
+    "local_search_metaheuristic": "GUIDED_LOCAL_SEARCH",
+    "average_speed_kmh": 40,
+    "service_time_minutes": 5,
+    "horizon_minutes": 720,
+    "drop_penalty": 100000,
+    "balance_coefficient": 100,
+    "progress_interval_seconds": 1.0,
+    "guided_local_search_lambda_coefficient": 0.1,
+    "parallel_starts": None,
+    "decomposition": "off",
+    "cluster_max_orders": 400,
+    "traffic_profile": None,
+    "day_start_minute": 480,
+    "traffic_rounds": 2,
+}
+
+# How ortools_balanced splits a large problem before solving, see decomposition.py
+DECOMPOSITION_METHODS = ("off", "warehouse", "kmeans")
+
+# Searches tried by solve_vrp_multi_start after the request's own settings.
+# OR-Tools routing has no random seed, so repeated pairs differ in GLS penalty weight.
+MULTI_START_CONFIGS = [
+    ("PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH", 0.1),
+    ("SAVINGS", "GUIDED_LOCAL_SEARCH", 0.1),
+    ("PARALLEL_CHEAPEST_INSERTION", "GUIDED_LOCAL_SEARCH", 0.1),
+    ("PATH_CHEAPEST_ARC", "SIMULATED_ANNEALING", 0.1),
+    ("SAVINGS", "TABU_SEARCH", 0.1),
+    ("PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH", 0.3),
+    ("PARALLEL_CHEAPEST_INSERTION", "TABU_SEARCH", 0.1),
+    ("SAVINGS", "GUIDED_LOCAL_SEARCH", 0.3),
+]
+SEARCH_KEYS = ("first_solution_strategy", "local_search_metaheuristic", "guided_local_search_lambda_coefficient")
+
+
+def resolve_solver_params(params: dict | None) -> dict:
+    """Merge request solver_params over the defaults and validate enum names"""
+    resolved = dict(DEFAULT_SOLVER_PARAMS)
+    resolved.update(params or {})
+
+    first_solution = resolved["first_solution_strategy"]
+    if not hasattr(routing_enums_pb2.FirstSolutionStrategy, first_solution):
+        raise ValueError(f"Invalid first_solution_strategy: {first_solution}")
+
+    metaheuristic = resolved["local_search_metaheuristic"]
+    if not hasattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic):
+        raise ValueError(f"Invalid local_search_metaheuristic: {metaheuristic}")
+
+    if float(resolved["time_limit_seconds"]) <= 0:
+        raise ValueError("time_limit_seconds must be positive")
+
+    # One search per idle core by default
+    if resolved["parallel_starts"] is None:
+        resolved["parallel_starts"] = min(os.cpu_count() or 1, len(MULTI_START_CONFIGS))
+    if not isinstance(resolved["parallel_starts"], int) or resolved["parallel_starts"] < 1:
+        raise ValueError("parallel_starts must be a positive integer")
+
+    if resolved["decomposition"] not in DECOMPOSITION_METHODS:
+        raise ValueError(f"Invalid decomposition. Must be one of: {list(DECOMPOSITION_METHODS)}")
+    if int(resolved["cluster_max_orders"]) < 1:
+        raise ValueError("cluster_max_orders must be positive")
+    if not 0 <= int(resolved["day_start_minute"]) < 1440:
+        raise ValueError("day_start_minute must be a minute of the day (0-1439)")
+    if int(resolved["traffic_rounds"]) < 1:
+        raise ValueError("traffic_rounds must be positive")
+
+    return resolved
+
+
+# ---------------- Data Model ----------------
+def travel_minutes(distances: np.ndarray, params: dict, traffic=None, departures=None) -> np.ndarray:
+    """
+    Travel minutes at average speed, rounded up so short hops are never
+    free. With a TrafficProfile, at its speeds when leaving at departures:
+    one per leg, or one per row of a matrix.
+    """
+    if traffic is not None:
+        departures = np.asarray(departures)
+        if np.ndim(distances) == 2:
+            departures = departures[:, np.newaxis]
+        return traffic.travel_minutes(departures, distances)
+    meters_per_minute = float(params["average_speed_kmh"]) * 1000 / 60
+    return np.ceil(distances / meters_per_minute).astype(np.int64)
+
+
+def departure_estimates(data: dict) -> List[int]:
+    """
+    First guess at when each location is left, before any route exists:
+    vans at the start of the shift, orders at their service time past the
+    middle of their time window (of the whole horizon without one)
+    """
+    num_warehouses = data['num_warehouses']
+    return [0] * num_warehouses + [
+        (start + end) // 2 + service
+        for (start, end), service in zip(data['time_windows'][num_warehouses:], data['service_times'][num_warehouses:])
+    ]
+
+
+def schedule_arrivals(data: dict, params: dict, sequence: List[int], leg_meters, start: int = 0,
+                      strict: bool = False) -> List[int] | None:
+    """
+    Arrival minute at every node of sequence, leaving the first at start and
+    waiting for time windows to open; None if strict and a window or the
+    horizon is missed. With data['traffic'] every leg is timed from the
+    minute it actually starts.
+    """
+    traffic = data.get('traffic')
+    if traffic is None:
+        minutes = travel_minutes(np.asarray(leg_meters), params).tolist()
+    arrivals = [start]
+    for leg, node in enumerate(sequence[1:]):
+        departure = arrivals[-1] + data['service_times'][sequence[leg]]
+        if traffic is None:
+            arrival = departure + minutes[leg]
+        else:
+            arrival = departure + int(traffic.travel_minutes(departure, leg_meters[leg]))
+        window_start, window_end = data['time_windows'][node]
+        arrival = max(arrival, window_start)
+        if strict and arrival > window_end:
+            return None
+        arrivals.append(arrival)
+    return arrivals
+
+
+def build_routing_data(problem, matrices, params: dict, include_matrices: bool = True, traffic=None) -> dict:
+    """
+    Build the integer data model for the CVRPTW.
+    Locations are warehouses first (one vehicle per warehouse, starting and
+    ending at its own location), then orders.
+    include_matrices=False leaves out the (W+O)^2 distance and time
+    matrices, for decomposed solves that only need per-location data.
+    With a TrafficProfile, time matrix rows are timed from each location's
+    entry in 'departures' (see refine_departures).
+    """
+    num_warehouses = problem.num_warehouses
+    distance_matrix = matrices.location_matrix() if include_matrices else None
+
+    service_time = int(params["service_time_minutes"])
+    horizon = int(params["horizon_minutes"])
+
+    demands = [0] * num_warehouses + problem.demands.tolist()
+    service_times = [0] * num_warehouses + np.where(
+        problem.service_times >= 0, problem.service_times, service_time).tolist()
+    time_windows = [(0, horizon)] * num_warehouses + [
+        (window[0], min(window[1], horizon)) if window else (0, horizon)
+        for window in problem.time_windows
+    ]
+    priorities = [0] * num_warehouses + problem.priorities.tolist()
+    # Split-delivery sub-orders can only ride with the van their items come from
+    allowed_vehicles = [-1] * num_warehouses + problem.pinned_warehouses.tolist()
+
+    capacities = np.maximum(problem.capacity - problem.pre_assigned_load, 0).tolist()
+
+    data = {
+        'distance_matrix': distance_matrix,
+        'time_matrix': None,
+        'locations': matrices.location_coords().tolist(),
+        'demands': demands,
+        'service_times': service_times,
+        'time_windows': time_windows,
+        'priorities': priorities,
+        'allowed_vehicles': allowed_vehicles,
+        'capacities': capacities,
+        'num_vehicles': num_warehouses,
+        'depot_indices': list(range(num_warehouses)),
+        'num_warehouses': num_warehouses,
+        'horizon': horizon,
+        'traffic': traffic,
+    }
+    data['departures'] = departure_estimates(data)
+    if include_matrices:
+        data['time_matrix'] = travel_minutes(distance_matrix, params, traffic, data['departures'])
+    return data
+
+
+# ---------------- Traffic ----------------
+def refine_departures(data: dict, params: dict, solution: dict):
+    """
+    Re-time the time matrix from a solution: every visited location is
+    now left when that solution leaves it, so the next search sees the
+    traffic of the hour each leg is actually driven in.
+    """
+    departures = list(data['departures'])
+    for route in solution['routes']:
+        for stop in route['stops'][:-1]:
+            departures[stop['node']] = stop['arrival_minutes'] + data['service_times'][stop['node']]
+    data['departures'] = departures
+    if data['distance_matrix'] is not None:
+        data['time_matrix'] = travel_minutes(data['distance_matrix'], params, data['traffic'], departures)
+
+
+def retime_routes(data: dict, params: dict, matrices, solution: dict) -> int:
+    """
+    Replace a solution's arrival minutes, which the search took from
+    estimated departures, with each leg timed at its real departure.
+    Returns how many stops then miss their time window.
+    """
+    late = 0
+    for route in solution['routes']:
+        sequence = [stop['node'] for stop in route['stops']]
+        leg_meters = np.rint(matrices.leg_distances(sequence[:-1], sequence[1:])).tolist()
+        arrivals = schedule_arrivals(data, params, sequence, leg_meters, route['stops'][0]['arrival_minutes'])
+        for stop, arrival in zip(route['stops'], arrivals):
+            stop['arrival_minutes'] = arrival
+            late += arrival > data['time_windows'][stop['node']][1]
+        route['time_minutes'] = arrivals[-1] - arrivals[0]
+    return late
+
+
+# ---------------- Progress Reporting ----------------
+class SolutionProgressCallback:
+    """
+    Called by the routing search on every accepted solution.
+    Tracks the best objective and pushes it, the best-so-far routes and the
+    elapsed share of the time limit into report() at most once per interval.
+    """
+
+    def __init__(self, manager, routing, time_limit: float, report: Callable | None,
+                 interval: float, should_stop: Callable | None = None):
+        # weakrefs avoid a manager <-> callback reference cycle inside SWIG
+        self._manager_ref = weakref.ref(manager)
+        self._routing_ref = weakref.ref(routing)
+        self._time_limit = time_limit
+        self._report = report
+        self._interval = interval
+        self._should_stop = should_stop
+        self._started = time.monotonic()
+        self._last_report = 0.0
+        self.solutions_found = 0
+        self.best_objective = None
+        self.best_routes = None
+
+    def __call__(self):
+        routing = self._routing_ref()
+        manager = self._manager_ref()
+        self.solutions_found += 1
+
+        if self._should_stop and self._should_stop():
+            routing.solver().FinishCurrentSearch()
+            return
+
+        objective = int(routing.CostVar().Value())
+        if self.best_objective is not None and objective >= self.best_objective:
+            return
+
+        self.best_objective = objective
+        self.best_routes = []
+        for vehicle_id in range(routing.vehicles()):
+            index = routing.Start(vehicle_id)
+            route = []
+            while not routing.IsEnd(index):
+                route.append(manager.IndexToNode(index))
+                index = routing.NextVar(index).Value()
+            route.append(manager.IndexToNode(index))
+            self.best_routes.append(route)
+
+        now = time.monotonic()
+        if self._report and (self.solutions_found == 1 or now - self._last_report >= self._interval):
+            self._last_report = now
+            elapsed = now - self._started
+            self._report(
+                progress=min(10 + int(85 * elapsed / self._time_limit), 95),
+                best_objective=self.best_objective,
+                solutions_found=self.solutions_found,
+                best_routes=self.best_routes,
+            )
+
+
+# ---------------- Solver ----------------
+def solve_vrp(data: dict, params: dict, report: Callable | None = None,
+              should_stop: Callable | None = None, initial_routes: List[List[int]] | None = None) -> dict:
+    """
+    Solve the capacitated VRP with time windows.
+    Orders may be dropped at a priority-weighted penalty, so the search
+    always has a feasible solution. Returns raw per-vehicle routes.
+    should_stop() is polled on every solution to end the search early.
+    initial_routes, one list of order nodes per vehicle, seeds the search
+    instead of building a first solution from scratch.
+    """
+    manager = pywrapcp.RoutingIndexManager(
+        len(data['distance_matrix']),
+        data['num_vehicles'],
+        data['depot_indices'],
+        data['depot_indices']
+    )
+    routing = pywrapcp.RoutingModel(manager)
+
+    distance_rows = data['distance_matrix'].tolist()
+    time_rows = data['time_matrix'].tolist()
+    service_times = data['service_times']
+    demands = data['demands']
+
+    def distance_callback(from_index, to_index):
+        return distance_rows[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+    def time_callback(from_index, to_index):
+        from_node = manager.IndexToNode(from_index)
+        return time_rows[from_node][manager.IndexToNode(to_index)] + service_times[from_node]
+
+    def demand_callback(from_index):
+        return demands[manager.IndexToNode(from_index)]
+
+    distance_index = routing.RegisterTransitCallback(distance_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(distance_index)
+
+    # Distance dimension only to balance route lengths across vehicles
+    max_route_distance = int(max(map(max, distance_rows))) * (len(distance_rows) + 1)
+    routing.AddDimension(distance_index, 0, max_route_distance, True, 'Distance')
+    routing.GetDimensionOrDie('Distance').SetGlobalSpanCostCoefficient(int(params['balance_coefficient']))
+
+    demand_index = routing.RegisterUnaryTransitCallback(demand_callback)
+    routing.AddDimensionWithVehicleCapacity(demand_index, 0, data['capacities'], True, 'Capacity')
+
+    time_index = routing.RegisterTransitCallback(time_callback)
+    horizon = data['horizon']
+    routing.AddDimension(time_index, horizon, horizon, False, 'Time')
+    time_dimension = routing.GetDimensionOrDie('Time')
+
+    num_warehouses = data['num_warehouses']
+    for node in range(num_warehouses, len(distance_rows)):
+        index = manager.NodeToIndex(node)
+        start, end = data['time_windows'][node]
+        time_dimension.CumulVar(index).SetRange(start, end)
+        routing.AddDisjunction([index], int(params['drop_penalty']) * max(data['priorities'][node], 1))
+        if data['allowed_vehicles'][node] >= 0:
+            # -1 keeps the order droppable
+            routing.VehicleVar(index).SetValues([-1, data['allowed_vehicles'][node]])
+
+    for vehicle_id in range(data['num_vehicles']):
+        time_dimension.CumulVar(routing.Start(vehicle_id)).SetRange(0, horizon)
+        routing.AddVariableMinimizedByFinalizer(time_dimension.CumulVar(routing.Start(vehicle_id)))
+        routing.AddVariableMinimizedByFinalizer(time_dimension.CumulVar(routing.End(vehicle_id)))
+
+    time_limit = float(params['time_limit_seconds'])
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, params['first_solution_strategy'])
+    search_parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, params['local_search_metaheuristic'])
+    search_parameters.guided_local_search_lambda_coefficient = float(params['guided_local_search_lambda_coefficient'])
+    search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+
+    callback = SolutionProgressCallback(
+        manager, routing, time_limit, report, float(params['progress_interval_seconds']), should_stop)
+    routing.AddAtSolutionCallback(callback)
+
+    started = time.monotonic()
+    initial_assignment = None
+    if initial_routes is not None:
+        routing.CloseModelWithParameters(search_parameters)
+        initial_assignment = routing.ReadAssignmentFromRoutes(
+            [[manager.NodeToIndex(node) for node in route] for route in initial_routes], True)
+        if initial_assignment is None:
+            print("OR-Tools: initial routes are infeasible for the updated model, solving from scratch")
+
+    if initial_assignment is not None:
+        solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+    else:
+        solution = routing.SolveWithParameters(search_parameters)
+    solve_seconds = round(time.monotonic() - started, 3)
+
+    if solution is None:
+        raise RuntimeError(f"OR-Tools found no solution (status {routing.status()})")
+
+    capacity_dimension = routing.GetDimensionOrDie('Capacity')
+    routes = []
+    for vehicle_id in range(data['num_vehicles']):
+        index = routing.Start(vehicle_id)
+        stops = []
+        distance = 0
+        while True:
+            node = manager.IndexToNode(index)
+            stops.append({
+                'node': node,
+                'load': solution.Value(capacity_dimension.CumulVar(index)),
+                'arrival_minutes': solution.Min(time_dimension.CumulVar(index)),
+            })
+            if routing.IsEnd(index):
+                break
+            next_index = solution.Value(routing.NextVar(index))
+            distance += distance_rows[node][manager.IndexToNode(next_index)]
+            index = next_index
+        routes.append({
+            'vehicle_id': vehicle_id,
+            'stops': stops,
+            'distance': distance,
+            'time_minutes': stops[-1]['arrival_minutes'] - stops[0]['arrival_minutes'],
+        })
+
+    visited = {stop['node'] for route in routes for stop in route['stops']}
+    dropped = [node for node in range(num_warehouses, len(distance_rows)) if node not in visited]
+
+    return {
+        'routes': routes,
+        'dropped_nodes': dropped,
+        'objective': solution.ObjectiveValue(),
+        'solutions_found': callback.solutions_found,
+        'solve_seconds': solve_seconds,
+        'warm_started': initial_assignment is not None,
+    }
+
+
+# ---------------- Multi-Start Search ----------------
+def multi_start_configs(params: dict) -> List[dict]:
+    """Solver params of every parallel start: the request's own first, then MULTI_START_CONFIGS"""
+    configs = [params]
+    seen = {tuple(params[key] for key in SEARCH_KEYS)}
+    for search in MULTI_START_CONFIGS:
+        if len(configs) >= min(int(params['parallel_starts']), len(MULTI_START_CONFIGS)):
+            break
+        if search not in seen:
+            seen.add(search)
+            configs.append({**params, **dict(zip(SEARCH_KEYS, search))})
+    return configs
+
+
+def _start_main(index: int, data: dict, params: dict, initial_routes, updates, stop):
+    reset_sigterm()
+    try:
+        solution = solve_vrp(data, params, lambda **progress: updates.put(('progress', index, progress)),
+                             stop.is_set, initial_routes)
+        updates.put(('done', index, solution))
+    except Exception as e:
+        updates.put(('error', index, str(e)))
+
+
+def solve_vrp_multi_start(data: dict, params: dict, report: Callable | None = None,
+                          should_stop: Callable | None = None,
+                          initial_routes: List[List[int]] | None = None) -> dict:
+    """
+    Run params['parallel_starts'] independent searches in forked processes,
+    each with its own first solution strategy / metaheuristic and the same
+    time limit, and return the solution with the lowest objective.
+    report() sees the best objective across all starts. The result adds
+    'search' (the winning settings) and 'starts' (one summary per search).
+    A single start, or a daemonic pool worker that cannot fork, searches in-process.
+    """
+    configs = multi_start_configs(params)
+    if len(configs) == 1 or multiprocessing.current_process().daemon:
+        solution = solve_vrp(data, params, report, should_stop, initial_routes)
+        search = {key: params[key] for key in SEARCH_KEYS}
+        solution['search'] = search
+        solution['starts'] = [{**search, 'objective': solution['objective'],
+                               'solutions_found': solution['solutions_found']}]
+        return solution
+
+    ctx = multiprocessing.get_context("fork")
+    updates = ctx.Queue()
+    stop = ctx.Event()
+    processes = [
+        ctx.Process(target=_start_main, args=(index, data, config, initial_routes, updates, stop),
+                    name=f"ortools-start-{index}", daemon=True)
+        for index, config in enumerate(configs)
+    ]
+    for process in processes:
+        process.start()
+
+    solutions = {}
+    errors = {}
+    best_objective = None
+    try:
+        while len(solutions) + len(errors) < len(processes):
+            if should_stop and should_stop():
+                # Every search returns its best so far at its next solution
+                stop.set()
+            try:
+                kind, index, value = updates.get(timeout=0.2)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and updates.empty():
+                    break
+                continue
+            if kind == 'done':
+                solutions[index] = value
+            elif kind == 'error':
+                errors[index] = value
+            elif report and (best_objective is None or value['best_objective'] < best_objective):
+                best_objective = value['best_objective']
+                report(**value)
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    starts = []
+    for index, config in enumerate(configs):
+        start = {key: config[key] for key in SEARCH_KEYS}
+        if index in solutions:
+            start['objective'] = solutions[index]['objective']
+            start['solutions_found'] = solutions[index]['solutions_found']
+        else:
+            start['error'] = errors.get(index, f"search exited with code {processes[index].exitcode}")
+        starts.append(start)
+
+    if not solutions:
+        raise RuntimeError(f"OR-Tools found no solution in {len(configs)} parallel searches: "
+                           f"{'; '.join(start['error'] for start in starts)}")
+
+    winner = min(solutions, key=lambda index: (solutions[index]['objective'], index))
+    solution = solutions[winner]
+    solution['search'] = {key: configs[winner][key] for key in SEARCH_KEYS}
+    solution['starts'] = starts
+    return solution
@@ -0,0 +1,100 @@
+import heapq
+import math
+from collections import defaultdict
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from distance_matrix import haversine_row
+
+
+KM_PER_DEGREE_LAT = 111.32
+DEFAULT_CELL_KM = 10.0
+
+# Cells are sized on an equirectangular approximation; shrink the guaranteed
+# search radius a little so candidates are never yielded out of order.
+RADIUS_SAFETY = 0.9
+
+
+class WarehouseGrid:
+    """
+    Uniform lat/lng grid (geohash-style cells) over warehouse coordinates.
+    Cells are roughly cell_km x cell_km and double as zones for zone_based.
+    """
+
+    def __init__(self, coords: np.ndarray, cell_km: float = DEFAULT_CELL_KM):
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.cell_km = float(cell_km)
+        self.cell_lat = self.cell_km / KM_PER_DEGREE_LAT
+
+        # Size longitude cells at the highest latitude so no cell is narrower than cell_km
+        max_abs_lat = float(np.max(np.abs(self.coords[:, 0]))) if len(self.coords) else 0.0
+        self.cell_lng = self.cell_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(min(max_abs_lat, 89.0))))
+
+        self.cells = defaultdict(list)
+        for wh_idx, (lat, lng) in enumerate(self.coords):
+            self.cells[self.cell_of(lat, lng)].append(wh_idx)
+
+        rows = [cell[0] for cell in self.cells] or [0]
+        cols = [cell[1] for cell in self.cells] or [0]
+        self.row_range = (min(rows), max(rows))
+        self.col_range = (min(cols), max(cols))
+
+    def cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_lat), math.floor(lng / self.cell_lng)
+
+    def zone_key(self, lat: float, lng: float) -> str:
+        row, col = self.cell_of(lat, lng)
+        return f"{row}:{col}"
+
+    def warehouses_in_cell(self, lat: float, lng: float) -> list:
+        return self.cells.get(self.cell_of(lat, lng), [])
+
+    def _ring(self, row: int, col: int, radius: int):
+        """Cells at exactly `radius` Chebyshev steps from (row, col)"""
+        if radius == 0:
+            yield row, col
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def nearest(self, lat: float, lng: float, distances: np.ndarray | None = None) -> Iterator[Tuple[int, float]]:
+        """
+        Yield (warehouse_index, distance_m) in increasing distance order.
+        distances, when given, is the precomputed distance from this point
+        to every warehouse (a distance-matrix column); otherwise distances
+        are computed for the visited cells only. Callers stop iterating at
+        the first warehouse that passes their checks.
+        """
+        row, col = self.cell_of(lat, lng)
+        max_radius = max(
+            abs(row - self.row_range[0]), abs(row - self.row_range[1]),
+            abs(col - self.col_range[0]), abs(col - self.col_range[1])
+        )
+
+        heap = []
+        for radius in range(max_radius + 1):
+            for cell in self._ring(row, col, radius):
+                members = self.cells.get(cell)
+                if not members:
+                    continue
+                if distances is None:
+                    cell_distances = haversine_row(lat, lng, self.coords[members])
+                else:
+                    cell_distances = distances[members]
+                for wh_idx, distance in zip(members, cell_distances):
+                    heapq.heappush(heap, (float(distance), wh_idx))
+
+            # Everything outside the searched block is at least `radius` cells away
+            guaranteed = radius * self.cell_km * 1000 * RADIUS_SAFETY
+            while heap and heap[0][0] <= guaranteed:
+                distance, wh_idx = heapq.heappop(heap)
+                yield wh_idx, distance
+
+        while heap:
+            distance, wh_idx = heapq.heappop(heap)
+            yield wh_idx, distance
@@ -1,464 +1,247 @@
 import os
-import uuid
 import json
+import uuid
+import hashlib
+import time
+import threading
 import traceback
+import contextlib
 import math
-from concurrent.futures import ThreadPoolExecutor
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-from typing import List, Dict, Tuple
-from dataclasses import dataclass
+from typing import List, Tuple
 
-from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+from delta import apply_order_delta, previous_routes, previous_unassigned, reinsert_orders
+from distance_matrix import DistanceMatrices, build_distance_matrices, resolve_dtype
+from fulfillment import FULFILLMENT_MODES
+from inventory_index import InventoryIndex
+from traffic_profile import available_profiles
+from job_runner import ProcessJobRunner, QueueFullError, ThreadJobRunner, forward_update
+from job_store import FINISHED_STATUSES, JobStore
+from metrics import (JOB_DURATION_SECONDS, JOB_PHASE_SECONDS, current_timer, job_timer, note_status,
+                     observe_job_timings, phase, profile_summary, profile_to, render_values)
+from planning import (COMPARABLE_STRATEGIES, MATRIX_PROVIDER, ROAD_GRAPH_PATH, TRAFFIC_PROFILES_DIR,
+                      AssignmentStrategy, format_greedy_result, payload_metric, prepare_data, prepare_ortools_data,
+                      solver_traffic_profile)
+from problem_model import NDJSON_CONTENT_TYPES, Problem, parse_ndjson
+from restock import DONOR_POLICY_NOTE, plan_restock_trips
+from response_format import MSGPACK_MIMETYPE, RESPONSE_FORMATS, available_formats, compact_result, pack_msgpack
+from result_cache import ResultCache, payload_fingerprint, problem_fingerprint
+from road_network import available_providers
+from routing_solver import resolve_solver_params
 
 app = Flask(__name__)
 CORS(app)
 
 JOBS = {}
-EXECUTOR = ThreadPoolExecutor(max_workers=8)
 JOBS_DIR = "/tmp/ortools_jobs"
 os.makedirs(JOBS_DIR, exist_ok=True)
+JOB_STORE = JobStore(os.path.join(JOBS_DIR, "jobs.sqlite3"))
+JOB_MEMORY_TTL_SECONDS = float(os.environ.get("ORTOOLS_JOB_MEMORY_TTL", 600))
+JOB_TTL_SECONDS = float(os.environ.get("ORTOOLS_JOB_TTL", 86400))
+JOB_EVICTION_INTERVAL_SECONDS = 60
+RESULT_CACHE = ResultCache(int(os.environ.get("ORTOOLS_RESULT_CACHE_SIZE", 256)))
 
-
-@dataclass
-class AssignmentStrategy:
-    """Available assignment strategies"""
-    ORTOOLS_BALANCED = "ortools_balanced"
-    CLOSEST_WITH_INVENTORY = "closest_with_inventory"
-    CLOSEST_ANY = "closest_any"
-    LEAST_ASSIGNED = "least_assigned_orders"
-    LEAST_TOTAL_LOAD = "least_total_load"
-    ZONE_BASED = "zone_based"
+# "thread" runs jobs inside the Flask process, "process" forks one worker per job
+EXECUTOR_BACKEND = os.environ.get("ORTOOLS_EXECUTOR", "thread")
+MAX_WORKERS = int(os.environ.get("ORTOOLS_MAX_WORKERS", 8))
+MAX_QUEUE_DEPTH = int(os.environ.get("ORTOOLS_MAX_QUEUE_DEPTH", 32))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("ORTOOLS_JOB_TIMEOUT", 300))
+# Share of the job budget the OR-Tools search may use; the rest covers setup and formatting
+SOLVER_BUDGET_SHARE = 0.8
+# Default search time for /delta re-optimization when the delta sets none
+DELTA_TIME_LIMIT_SECONDS = float(os.environ.get("ORTOOLS_DELTA_TIME_LIMIT", 5))
+# Status streams and long polls re-read the job row this often
+STATUS_POLL_SECONDS = 0.5
+STATUS_KEEPALIVE_SECONDS = 15
+STATUS_LONG_POLL_MAX_SECONDS = 30
+# /ortools/batch: problems per request, and how often the feeder checks for a free worker
+BATCH_MAX_PROBLEMS = int(os.environ.get("ORTOOLS_BATCH_MAX_PROBLEMS", 1000))
+BATCH_POLL_SECONDS = 0.5
 
 
 # ---------------- Persistence ----------------
-def job_path(job_id: str) -> str:
-    return os.path.join(JOBS_DIR, f"{job_id}.json")
+# Bulky fields live only in the job store; JOBS caches the small metadata
+HEAVY_JOB_FIELDS = ("payload", "result", "prepared", "best_routes")
+# Per-job array files next to the job store
+JOB_FILE_SUFFIXES = (".matrices.npz", ".problem.npz", ".profile.prof")
 
 
 def save_job(job_id: str, data: dict):
-    with open(job_path(job_id), "w") as f:
-        json.dump(data, f)
+    data = dict(data)
+    JOB_STORE.create(job_id, data.pop("payload", None), **data)
+    JOBS[job_id] = {k: v for k, v in data.items() if k not in HEAVY_JOB_FIELDS}
 
 
 def load_job(job_id: str) -> dict | None:
-    path = job_path(job_id)
-    if os.path.exists(path):
-        with open(path) as f:
-            return json.load(f)
-    return None
+    return JOB_STORE.get(job_id)
 
 
-def update_job(job_id: str, **kwargs):
-    job = JOBS.get(job_id) or load_job(job_id) or {}
-    job.update(kwargs)
-    JOBS[job_id] = job
-    save_job(job_id, job)
-    return job
+def delete_job(job_id: str):
+    JOBS.pop(job_id, None)
+    JOB_STORE.delete(job_id)
+    for suffix in JOB_FILE_SUFFIXES:
+        path = os.path.join(JOBS_DIR, f"{job_id}{suffix}")
+        if os.path.exists(path):
+            os.remove(path)
 
 
-# ---------------- Distance Calculation ----------------
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance in meters using Haversine formula"""
-    R = 6371000  # Earth radius in meters
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
+def matrices_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.matrices.npz")
 
-    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
-    return int(R * c)
+def problem_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.problem.npz")
 
 
-# ---------------- Inventory Checking ----------------
-def check_inventory_availability(warehouse: dict, order: dict) -> Tuple[bool, List[dict]]:
-    """
-    Check if warehouse has sufficient inventory for order
-    Returns (can_fulfill, missing_items)
-    """
-    warehouse_inventory = {item['product_id']: item['quantity'] 
-                          for item in warehouse.get('products', [])}
-    
-    missing_items = []
-    for item in order.get('order_items', []):
-        product_id = item.get('product_id')
-        required_qty = int(item.get('quantity', 0))
-        available_qty = warehouse_inventory.get(product_id, 0)
-        
-        if available_qty < required_qty:
-            missing_items.append({
-                'product_id': product_id,
-                'product_name': item.get('product_name', 'Unknown'),
-                'required': required_qty,
-                'available': available_qty,
-                'shortage': required_qty - available_qty
-            })
-    
-    return len(missing_items) == 0, missing_items
+def profile_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.profile.prof")
 
 
-# ---------------- Assignment Strategies ----------------
-def assign_closest_with_inventory(warehouses: List[dict], orders: List[dict]) -> dict:
-    """Assign orders to closest warehouse that has inventory"""
-    assignments = {}
-    unassigned = []
-    
-    for order_idx, order in enumerate(orders):
-        order_lat = float(order['client_object_latitude'])
-        order_lng = float(order['client_object_longitude'])
-        
-        best_warehouse = None
-        best_distance = float('inf')
-        
-        for wh_idx, wh in enumerate(warehouses):
-            # Check inventory first
-            can_fulfill, missing = check_inventory_availability(wh, order)
-            if not can_fulfill:
-                continue
-            
-            # Check current load vs capacity
-            current_load = wh.get('current_assigned_load', 0)
-            if current_load >= wh.get('capacity', 100):
-                continue
-            
-            distance = haversine_distance(
-                float(wh['latitude']), float(wh['longitude']),
-                order_lat, order_lng
-            )
-            
-            if distance < best_distance:
-                best_distance = distance
-                best_warehouse = wh_idx
-        
-        if best_warehouse is not None:
-            if best_warehouse not in assignments:
-                assignments[best_warehouse] = []
-            
-            assignments[best_warehouse].append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'distance': best_distance,
-                'strategy': 'closest_with_inventory'
-            })
-            
-            # Update warehouse load
-            order_demand = sum(int(item.get('quantity', 0)) 
-                             for item in order.get('order_items', []))
-            warehouses[best_warehouse]['current_assigned_load'] = \
-                warehouses[best_warehouse].get('current_assigned_load', 0) + order_demand
-        else:
-            unassigned.append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'reason': 'no_warehouse_with_inventory'
-            })
-    
-    return {'assignments': assignments, 'unassigned': unassigned}
+def load_job_payload(job_id: str) -> dict | None:
+    """Submitted payload; NDJSON jobs keep only their columnar problem file"""
+    payload = JOB_STORE.get_payload(job_id)
+    if payload is None and os.path.exists(problem_path(job_id)):
+        payload = Problem.load(problem_path(job_id)).to_payload()
+    return payload
 
 
-def assign_closest_any(warehouses: List[dict], orders: List[dict]) -> dict:
-    """Assign orders to closest warehouse regardless of inventory"""
-    assignments = {}
-    unassigned = []
-    
-    for order_idx, order in enumerate(orders):
-        order_lat = float(order['client_object_latitude'])
-        order_lng = float(order['client_object_longitude'])
-        
-        best_warehouse = None
-        best_distance = float('inf')
-        needs_restock = False
-        
-        for wh_idx, wh in enumerate(warehouses):
-            # Check current load vs capacity
-            current_load = wh.get('current_assigned_load', 0)
-            if current_load >= wh.get('capacity', 100):
-                continue
-            
-            distance = haversine_distance(
-                float(wh['latitude']), float(wh['longitude']),
-                order_lat, order_lng
-            )
-            
-            if distance < best_distance:
-                best_distance = distance
-                best_warehouse = wh_idx
-                can_fulfill, missing = check_inventory_availability(wh, order)
-                needs_restock = not can_fulfill
-        
-        if best_warehouse is not None:
-            if best_warehouse not in assignments:
-                assignments[best_warehouse] = []
-            
-            assignments[best_warehouse].append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'distance': best_distance,
-                'needs_restock': needs_restock,
-                'strategy': 'closest_any'
-            })
-            
-            order_demand = sum(int(item.get('quantity', 0)) 
-                             for item in order.get('order_items', []))
-            warehouses[best_warehouse]['current_assigned_load'] = \
-                warehouses[best_warehouse].get('current_assigned_load', 0) + order_demand
-        else:
-            unassigned.append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'reason': 'all_warehouses_at_capacity'
-            })
-    
-    return {'assignments': assignments, 'unassigned': unassigned}
+def save_job_matrices(job_id: str, matrices: DistanceMatrices):
+    """Keep a finished job's distance matrices for later /delta requests"""
+    try:
+        matrices.save(matrices_path(job_id))
+    except Exception as e:
+        print(f"ERROR saving matrices for job {job_id}: {e}")
 
 
-def assign_least_assigned(warehouses: List[dict], orders: List[dict]) -> dict:
-    """Assign orders to warehouse with fewest assigned orders"""
-    assignments = {}
-    unassigned = []
-    
-    for order_idx, order in enumerate(orders):
-        # Find warehouse with least assigned orders
-        best_warehouse = None
-        min_assigned = float('inf')
-        
-        for wh_idx, wh in enumerate(warehouses):
-            # Check capacity
-            current_load = wh.get('current_assigned_load', 0)
-            if current_load >= wh.get('capacity', 100):
-                continue
-            
-            # Count current assignments including pre-assigned
-            current_count = len(assignments.get(wh_idx, [])) + \
-                          wh.get('pre_assigned_count', 0)
-            
-            if current_count < min_assigned:
-                # Check inventory
-                can_fulfill, _ = check_inventory_availability(wh, order)
-                if can_fulfill:
-                    min_assigned = current_count
-                    best_warehouse = wh_idx
-        
-        if best_warehouse is not None:
-            if best_warehouse not in assignments:
-                assignments[best_warehouse] = []
-            
-            assignments[best_warehouse].append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'strategy': 'least_assigned'
-            })
-            
-            order_demand = sum(int(item.get('quantity', 0)) 
-                             for item in order.get('order_items', []))
-            warehouses[best_warehouse]['current_assigned_load'] = \
-                warehouses[best_warehouse].get('current_assigned_load', 0) + order_demand
-        else:
-            unassigned.append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'reason': 'no_warehouse_available'
-            })
-    
-    return {'assignments': assignments, 'unassigned': unassigned}
+def load_job_matrices(job_id: str, metric) -> DistanceMatrices | None:
+    try:
+        return DistanceMatrices.load(matrices_path(job_id), metric)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"ERROR loading matrices for job {job_id}: {e}")
+        return None
 
 
-def assign_least_total_load(warehouses: List[dict], orders: List[dict]) -> dict:
-    """Assign orders to warehouse with lowest total load"""
-    assignments = {}
-    unassigned = []
-    
-    for order_idx, order in enumerate(orders):
-        order_demand = sum(int(item.get('quantity', 0)) 
-                         for item in order.get('order_items', []))
-        
-        best_warehouse = None
-        min_load = float('inf')
-        
-        for wh_idx, wh in enumerate(warehouses):
-            current_load = wh.get('current_assigned_load', 0)
-            capacity = wh.get('capacity', 100)
-            
-            # Check if adding this order would exceed capacity
-            if current_load + order_demand > capacity:
-                continue
-            
-            # Check inventory
-            can_fulfill, _ = check_inventory_availability(wh, order)
-            if not can_fulfill:
-                continue
-            
-            if current_load < min_load:
-                min_load = current_load
-                best_warehouse = wh_idx
-        
-        if best_warehouse is not None:
-            if best_warehouse not in assignments:
-                assignments[best_warehouse] = []
-            
-            assignments[best_warehouse].append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'strategy': 'least_total_load'
-            })
-            
-            warehouses[best_warehouse]['current_assigned_load'] = \
-                warehouses[best_warehouse].get('current_assigned_load', 0) + order_demand
-        else:
-            unassigned.append({
-                'order_index': order_idx,
-                'order_id': order.get('order_id'),
-                'reason': 'insufficient_capacity_or_inventory'
-            })
-    
-    return {'assignments': assignments, 'unassigned': unassigned}
+def update_job(job_id: str, **kwargs):
+    if "status" in kwargs:
+        note_status(kwargs["status"])
+    # Inside a worker process the parent owns the job record
+    if forward_update(job_id, kwargs):
+        return kwargs
+    if "timings" in kwargs:
+        observe_job_timings(kwargs["timings"])
+    JOB_STORE.update(job_id, **kwargs)
+    job = JOBS.get(job_id) or JOB_STORE.get_meta(job_id) or {}
+    job.update({k: v for k, v in kwargs.items() if k not in HEAVY_JOB_FIELDS})
+    if kwargs.get("status") in FINISHED_STATUSES:
+        job["finished_at"] = time.time()
+    JOBS[job_id] = job
+    return job
+
+
+def evict_expired_jobs():
+    """Drop finished jobs from memory after JOB_MEMORY_TTL_SECONDS and from disk after JOB_TTL_SECONDS"""
+    now = time.time()
+    for job_id, job in list(JOBS.items()):
+        finished_at = job.get("finished_at")
+        if finished_at and now - finished_at > JOB_MEMORY_TTL_SECONDS:
+            JOBS.pop(job_id, None)
+    removed = JOB_STORE.evict_finished(now - JOB_TTL_SECONDS)
+    if removed:
+        print(f"Evicted {removed} expired jobs from the job store")
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        if name.endswith(JOB_FILE_SUFFIXES) and now - os.path.getmtime(path) > JOB_TTL_SECONDS:
+            os.remove(path)
+
+
+def run_job_janitor():
+    while True:
+        time.sleep(JOB_EVICTION_INTERVAL_SECONDS)
+        try:
+            evict_expired_jobs()
+        except Exception as e:
+            print(f"ERROR evicting jobs: {e}")
+
+
+def job_status(job_id: str) -> str | None:
+    job = JOBS.get(job_id) or JOB_STORE.get_meta(job_id)
+    return job.get("status") if job else None
+
 
+def cached_job_response(job_id: str, status: str, strategy: str) -> dict:
+    """Response for a submission served by an existing job"""
+    response = {"job_id": job_id, "status": status, "strategy": strategy, "cached": True}
+    if status == "done":
+        job = load_job(job_id) or {}
+        response["result"] = job.get("result")
+        response["prepared"] = job.get("prepared")
+    return response
 
-# ---------------- Data Preparation ----------------
-def prepare_data(payload: dict, strategy: str = AssignmentStrategy.ORTOOLS_BALANCED):
-    """Transform warehouses + orders into routing structures"""
-    warehouses = payload.get("warehouses", [])
-    orders = payload.get("orders", [])
+
+# ---------------- Flask Endpoints ----------------
+def validate_options(options: dict, strategy: str) -> str | None:
+    """Error message for invalid request options, None when they are usable"""
+    valid_strategies = COMPARABLE_STRATEGIES + [AssignmentStrategy.COMPARE]
     
-    if not warehouses:
-        raise ValueError("No warehouses provided")
-    if not orders:
-        raise ValueError("No orders provided")
+    if strategy not in valid_strategies:
+        return f"Invalid strategy. Must be one of: {valid_strategies}"
     
-    print(f"Processing {len(warehouses)} warehouses and {len(orders)} orders")
-    print(f"Using strategy: {strategy}")
+    if strategy == AssignmentStrategy.COMPARE:
+        compared = options.get("compare_strategies", COMPARABLE_STRATEGIES)
+        if not compared or any(name not in COMPARABLE_STRATEGIES for name in compared):
+            return f"Invalid compare_strategies. Must be a non-empty list of: {COMPARABLE_STRATEGIES}"
     
-    # Initialize current load from pre-assigned orders
-    for wh in warehouses:
-        wh['current_assigned_load'] = wh.get('pre_assigned_load', 0)
-        wh['pre_assigned_count'] = wh.get('pre_assigned_count', 0)
+    if not isinstance(options.get("profile", False), bool):
+        return "profile must be true or false"
     
-    # Apply greedy strategy if requested
-    if strategy != AssignmentStrategy.ORTOOLS_BALANCED:
-        result = None
-        
-        if strategy == AssignmentStrategy.CLOSEST_WITH_INVENTORY:
-            result = assign_closest_with_inventory(warehouses, orders)
-        elif strategy == AssignmentStrategy.CLOSEST_ANY:
-            result = assign_closest_any(warehouses, orders)
-        elif strategy == AssignmentStrategy.LEAST_ASSIGNED:
-            result = assign_least_assigned(warehouses, orders)
-        elif strategy == AssignmentStrategy.LEAST_TOTAL_LOAD:
-            result = assign_least_total_load(warehouses, orders)
-        
-        if result:
-            return format_greedy_result(warehouses, orders, result, strategy)
+    if not isinstance(options.get("plan_restock", False), bool):
+        return "plan_restock must be true or false"
+    if options.get("plan_restock") and strategy == AssignmentStrategy.ORTOOLS_BALANCED:
+        return "plan_restock is only supported by the greedy strategies"
+    
+    if options.get("fulfillment", "whole") not in FULFILLMENT_MODES:
+        return f"Invalid fulfillment. Must be one of: {list(FULFILLMENT_MODES)}"
     
-    # Continue with OR-Tools for balanced strategy
-    return prepare_ortools_data(warehouses, orders)
+    try:
+        resolve_dtype(options.get("matrix_dtype"))
+        solver_traffic_profile(resolve_solver_params(options.get("solver_params")))
+        payload_metric(options)
+    except ValueError as e:
+        return str(e)
+    return None
 
 
-def format_greedy_result(warehouses, orders, result, strategy):
-    """Format greedy assignment results"""
-    route_details = []
+def submit_optimization(job_id: str, fingerprint: str | None, strategy: str, target, *args):
+    """Serve from the result cache or queue target on the executor"""
+    # Same snapshot as a finished or running job: reuse it instead of solving again
+    if fingerprint:
+        cached_job_id, cached_status = RESULT_CACHE.claim(fingerprint, job_id, job_status)
+        if cached_job_id:
+            delete_job(job_id)
+            return jsonify(cached_job_response(cached_job_id, cached_status, strategy))
     
-    for wh_idx, wh in enumerate(warehouses):
-        assigned_orders = result['assignments'].get(wh_idx, [])
-        
-        if not assigned_orders:
-            continue
-        
-        route = []
-        total_load = 0
-        total_distance = 0
-        
-        # Add warehouse start
-        route.append({
-            'location_index': wh_idx,
-            'load': 0,
-            'demand': 0,
-            'location_info': {
-                'type': 'warehouse',
-                'id': wh.get('id'),
-                'name': wh.get('name'),
-                'vehicle_name': wh.get('vehicle_name'),
-                'driver_name': wh.get('driver_name')
-            }
-        })
-        
-        # Add assigned orders
-        for assignment in assigned_orders:
-            order_idx = assignment['order_index']
-            order = orders[order_idx]
-            
-            order_demand = sum(int(item.get('quantity', 0)) 
-                             for item in order.get('order_items', []))
-            total_load += order_demand
-            total_distance += assignment.get('distance', 0)
-            
-            route.append({
-                'location_index': len(warehouses) + order_idx,
-                'load': total_load,
-                'demand': order_demand,
-                'needs_restock': assignment.get('needs_restock', False),
-                'location_info': {
-                    'type': 'order',
-                    'order_id': order.get('order_id'),
-                    'order_no': order.get('order_no'),
-                    'client_name': order.get('client_object_name'),
-                    'client_address': order.get('client_object_address'),
-                    'client_phone': order.get('client_phone')
-                }
-            })
-        
-        # Add warehouse end
-        route.append({
-            'location_index': wh_idx,
-            'load': total_load,
-            'demand': 0,
-            'location_info': {
-                'type': 'warehouse',
-                'id': wh.get('id'),
-                'name': wh.get('name')
-            }
-        })
-        
-        route_details.append({
-            'vehicle_id': wh_idx,
-            'route': route,
-            'total_distance': total_distance,
-            'total_distance_km': round(total_distance / 1000, 2),
-            'total_load': total_load,
-            'stops_count': len(assigned_orders),
-            'warehouse_info': {
-                'id': wh.get('id'),
-                'name': wh.get('name'),
-                'vehicle_name': wh.get('vehicle_name'),
-                'driver_name': wh.get('driver_name')
-            },
-            'strategy_used': strategy
-        })
+    try:
+        EXECUTOR.submit(job_id, target, *args)
+    except QueueFullError as e:
+        delete_job(job_id)
+        if fingerprint:
+            RESULT_CACHE.discard(fingerprint, job_id)
+        response = jsonify({"error": f"Optimizer busy: {e}"})
+        response.headers["Retry-After"] = "10"
+        return response, 429
     
-    return {
-        'route_details': route_details,
-        'unassigned_orders': result['unassigned'],
-        'strategy': strategy,
-        'meta': {
-            'warehouses_count': len(warehouses),
-            'orders_count': len(orders),
-            'assigned_count': sum(len(r['route']) - 2 for r in route_details),
-            'unassigned_count': len(result['unassigned'])
-        }
-    }
+    return jsonify({"job_id": job_id, "status": "running", "strategy": strategy, "cached": False})
 
 
-def prepare_ortools_data(warehouses, orders):
-    """Prepare data for OR-Tools optimization"""
-    # ... (Keep existing prepare_data logic for OR-Tools)
-    # This is your existing preparation code
-    pass
-
-
-# ---------------- Flask Endpoints ----------------
 @app.route("/ortools/optimize", methods=["POST"])
 def optimize():
     try:
+        if request.mimetype in NDJSON_CONTENT_TYPES:
+            return optimize_ndjson()
+        
         payload = request.get_json(force=True)
         
         if not payload.get("warehouses"):
@@ -467,39 +250,70 @@ def optimize():
             return jsonify({"error": "Missing 'orders' in payload"}), 400
         
         strategy = payload.get("strategy", AssignmentStrategy.ORTOOLS_BALANCED)
-        
-        # Validate strategy
-        valid_strategies = [
-            AssignmentStrategy.ORTOOLS_BALANCED,
-            AssignmentStrategy.CLOSEST_WITH_INVENTORY,
-            AssignmentStrategy.CLOSEST_ANY,
-            AssignmentStrategy.LEAST_ASSIGNED,
-            AssignmentStrategy.LEAST_TOTAL_LOAD
-        ]
-        
-        if strategy not in valid_strategies:
-            return jsonify({"error": f"Invalid strategy. Must be one of: {valid_strategies}"}), 400
-        
+        error = validate_options(payload, strategy)
+        if error:
+            return jsonify({"error": error}), 400
+
         job_id = str(uuid.uuid4())
-        JOBS[job_id] = {
+        save_job(job_id, {
             "status": "running",
             "progress": 0,
             "result": None,
             "error": None,
             "payload": payload,
             "strategy": strategy
-        }
-        save_job(job_id, JOBS[job_id])
+        })
         
-        EXECUTOR.submit(solve_routing_job, job_id, payload, strategy)
+        fingerprint = None
+        # A cached answer would have nothing to profile
+        if payload.get("use_cache", True) and not payload.get("profile"):
+            fingerprint = payload_fingerprint({**payload, "strategy": strategy})
         
-        return jsonify({"job_id": job_id, "status": "running", "strategy": strategy})
+        return submit_optimization(job_id, fingerprint, strategy, solve_routing_job, payload, strategy)
     
     except Exception as e:
         print(f"ERROR in /optimize: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def optimize_ndjson():
+    """
+    NDJSON submission (see problem_model.parse_ndjson): records are parsed
+    off the request stream into columnar arrays and the body is never held
+    as a whole. The job keeps a .problem.npz file instead of a payload.
+    """
+    try:
+        problem = parse_ndjson(request.stream)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if not problem.num_warehouses:
+        return jsonify({"error": "Missing 'warehouse' records"}), 400
+    if not problem.num_orders:
+        return jsonify({"error": "Missing 'order' records"}), 400
+    
+    strategy = problem.options.get("strategy", AssignmentStrategy.ORTOOLS_BALANCED)
+    problem.options["strategy"] = strategy
+    error = validate_options(problem.options, strategy)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    job_id = str(uuid.uuid4())
+    save_job(job_id, {
+        "status": "running",
+        "progress": 0,
+        "result": None,
+        "error": None,
+        "strategy": strategy
+    })
+    problem.save(problem_path(job_id))
+    
+    use_cache = problem.options.get("use_cache", True) and not problem.options.get("profile")
+    fingerprint = problem_fingerprint(problem) if use_cache else None
+    
+    return submit_optimization(job_id, fingerprint, strategy, solve_problem_job, problem, strategy)
+
+
 @app.route("/ortools/strategies", methods=["GET"])
 def list_strategies():
     """List available assignment strategies"""
@@ -508,7 +322,7 @@ def list_strategies():
             {
                 "id": AssignmentStrategy.ORTOOLS_BALANCED,
                 "name": "OR-Tools Balanced",
-                "description": "Uses Google OR-Tools to optimize routes with balanced load distribution"
+                "description": "Uses Google OR-Tools to optimize routes with balanced load distribution, running parallel_starts searches at once and keeping the best"
             },
             {
                 "id": AssignmentStrategy.CLOSEST_WITH_INVENTORY,
@@ -518,7 +332,7 @@ def list_strategies():
             {
                 "id": AssignmentStrategy.CLOSEST_ANY,
                 "name": "Closest Driver (Any)",
-                "description": "Assigns orders to nearest driver regardless of inventory (may need restocking)"
+                "description": "Assigns orders to nearest driver regardless of inventory (may need restocking; plan_restock adds pickups of missing stock at other depots; not applied to OR-Tools plans)"
             },
             {
                 "id": AssignmentStrategy.LEAST_ASSIGNED,
@@ -529,28 +343,215 @@ def list_strategies():
                 "id": AssignmentStrategy.LEAST_TOTAL_LOAD,
                 "name": "Least Total Load",
                 "description": "Assigns orders to driver with lowest current load"
+            },
+            {
+                "id": AssignmentStrategy.ZONE_BASED,
+                "name": "Zone Based",
+                "description": "Assigns orders to the least loaded driver in the same map zone (zone_size_km), falling back to the nearest driver"
+            },
+            {
+                "id": AssignmentStrategy.COMPARE,
+                "name": "Compare Strategies",
+                "description": "Runs every strategy (or compare_strategies) in parallel on one parsed payload and returns a scorecard with each plan"
             }
         ]
     })
 
 
-def solve_routing_job(job_id: str, payload: dict, strategy: str):
+def budgeted_solver_params(solver_params: dict | None) -> dict:
+    """Resolve solver_params and keep the search inside the job's wall-clock budget"""
+    solver_params = resolve_solver_params(solver_params)
+    solver_params['time_limit_seconds'] = min(
+        float(solver_params['time_limit_seconds']),
+        JOB_TIMEOUT_SECONDS * SOLVER_BUDGET_SHARE
+    )
+    return solver_params
+
+
+def store_job_result(job_id: str, result: dict, matrices: DistanceMatrices):
+    with phase("persist"):
+        prepared = result.pop('prepared', None)
+        save_job_matrices(job_id, matrices)
+        update_job(
+            job_id,
+            status="done",
+            progress=100,
+            result=result,
+            prepared=prepared,
+            best_routes=None,
+            error=None
+        )
+
+
+@contextlib.contextmanager
+def instrumented_job(job_id: str, strategy: str, profile: bool = False):
+    """
+    Time the job's phases and report them as its 'timings' once it ends;
+    with profile=true also dump a cProfile of the job thread for
+    /ortools/jobs/<id>/profile. Nested calls join the outer job.
+    """
+    if current_timer() is not None:
+        yield
+        return
+    with job_timer(strategy) as timer:
+        with profile_to(profile_path(job_id) if profile else None):
+            yield
+    # A job that returns without a final status was cancelled or timed out
+    status = timer.status if timer.status in FINISHED_STATUSES else "cancelled"
+    update_job(job_id, timings=timer.record(status))
+
+
+def solve_routing_job(job_id: str, payload: dict, strategy: str, should_stop=None):
+    with instrumented_job(job_id, strategy, bool(payload.get('profile'))):
+        with phase("parse"):
+            problem = Problem.from_payload(payload)
+        solve_problem_job(job_id, problem, strategy, should_stop)
+
+
+def solve_problem_job(job_id: str, problem: Problem, strategy: str, should_stop=None):
+    with instrumented_job(job_id, strategy, bool(problem.options.get('profile'))):
+        run_problem_job(job_id, problem, strategy, should_stop)
+
+
+def run_problem_job(job_id: str, problem: Problem, strategy: str, should_stop=None):
+    should_stop = should_stop or (lambda: False)
     try:
         update_job(job_id, status="processing", progress=10)
         
-        prepared = prepare_data(payload, strategy)
+        def report_progress(**progress):
+            update_job(job_id, **progress)
+        
+        options = problem.options
+        with phase("matrix"):
+            matrices = build_distance_matrices(
+                problem.warehouse_coords, problem.order_coords,
+                resolve_dtype(options.get('matrix_dtype')), payload_metric(options)
+            )
+        
+        result = prepare_data(problem, strategy, report_progress, should_stop, matrices,
+                              budgeted_solver_params(options.get('solver_params')))
+        
+        # Cancelled or timed out: the job record already says so
+        if should_stop():
+            return
         
+        store_job_result(job_id, result, matrices)
+        
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(f"ERROR in job {job_id}: {e}\n{tb}")
+        if should_stop():
+            return
         update_job(
             job_id,
-            status="done",
+            status="error",
             progress=100,
-            result=prepared,
-            error=None
+            result=None,
+            error=f"{str(e)}\n{tb}"
         )
+
+
+def solve_delta_job(job_id: str, base_job_id: str, payload: dict, strategy: str, kept: List[int],
+                    should_stop=None):
+    with instrumented_job(job_id, strategy, bool(payload.get('profile'))):
+        run_delta_job(job_id, base_job_id, payload, strategy, kept, should_stop)
+
+
+def run_delta_job(job_id: str, base_job_id: str, payload: dict, strategy: str, kept: List[int],
+                  should_stop=None):
+    """
+    Re-optimize a finished job after a delta, starting from its plan.
+    Distances between kept orders come from the base job's saved matrices;
+    greedy plans are repaired by cheapest insertion, OR-Tools searches from
+    the previous routes.
+    """
+    should_stop = should_stop or (lambda: False)
+    try:
+        update_job(job_id, status="processing", progress=10)
+        
+        def report_progress(**progress):
+            update_job(job_id, **progress)
+        
+        with phase("parse"):
+            problem = Problem.from_payload(payload)
+        num_warehouses = problem.num_warehouses
+        num_orders = problem.num_orders
+        base_result = (load_job(base_job_id) or {}).get('result') or {}
+        dtype = resolve_dtype(payload.get('matrix_dtype'))
+        metric = payload_metric(payload)
+        
+        with phase("matrix"):
+            base_matrices = load_job_matrices(base_job_id, metric)
+            if base_matrices is not None and len(base_matrices.warehouse_coords) != num_warehouses:
+                base_matrices = None
+            if base_matrices is not None:
+                matrices = base_matrices.derive(problem.warehouse_coords, kept, problem.order_coords[len(kept):])
+            else:
+                print(f"No saved matrices for job {base_job_id}, computing them")
+                matrices = build_distance_matrices(problem.warehouse_coords, problem.order_coords, dtype, metric)
+        
+        # Previous plan in the new order numbering; removed orders drop out
+        new_index = {old: new for new, old in enumerate(kept)}
+        routes = {
+            vehicle_id: [new_index[idx] for idx in route if idx in new_index]
+            for vehicle_id, route in previous_routes(base_result, num_warehouses).items()
+        }
+        pending = [new_index[idx] for idx in previous_unassigned(base_result) if idx in new_index]
+        pending += list(range(len(kept), num_orders))
+        
+        if strategy == AssignmentStrategy.ORTOOLS_BALANCED:
+            initial_routes = [
+                [num_warehouses + idx for idx in routes.get(vehicle_id, [])]
+                for vehicle_id in range(num_warehouses)
+            ]
+            result = prepare_ortools_data(
+                problem, matrices,
+                budgeted_solver_params(payload.get('solver_params')),
+                report_progress,
+                payload.get('return_distance_matrix', False),
+                should_stop,
+                initial_routes
+            )
+        else:
+            with phase("inventory"):
+                inventory = InventoryIndex(problem)
+            with phase("strategy"):
+                assignment = reinsert_orders(
+                    problem, matrices, inventory, routes, pending, strategy,
+                    check_inventory=strategy != AssignmentStrategy.CLOSEST_ANY
+                )
+            restock = None
+            if payload.get('plan_restock') and not should_stop():
+                # Previous restock visits were dropped with the plan; stock may have changed since
+                with phase("restock"):
+                    restock = plan_restock_trips(problem, matrices, assignment, strategy)
+            with phase("format"):
+                result = format_greedy_result(problem, assignment, strategy)
+            if restock:
+                result['restock'] = restock
+                result['meta']['restock_note'] = DONOR_POLICY_NOTE
+        
+        result['delta'] = {
+            'base_job_id': base_job_id,
+            'kept_orders': len(kept),
+            'added_orders': num_orders - len(kept),
+            # Only the order block is worth reusing; greedy base jobs never build one
+            'reused_matrices': base_matrices is not None and base_matrices.has_order_block
+        }
+        if strategy != AssignmentStrategy.ORTOOLS_BALANCED:
+            # OR-Tools places pending orders in its own search, from the previous routes
+            result['delta']['reinserted_orders'] = len(pending)
+        
+        if should_stop():
+            return
+        
+        store_job_result(job_id, result, matrices)
         
     except Exception as e:
         tb = traceback.format_exc()
-        print(f"ERROR in job {job_id}: {e}\n{tb}")
+        print(f"ERROR in delta job {job_id}: {e}\n{tb}")
+        if should_stop():
+            return
         update_job(
             job_id,
             status="error",
@@ -560,29 +561,540 @@ def solve_routing_job(job_id: str, payload: dict, strategy: str):
         )
 
 
+# ---------------- Job Execution ----------------
+def apply_worker_update(job_id: str, fields: dict):
+    """Apply an update sent by a worker process unless the job already finished"""
+    job = JOBS.get(job_id) or JOB_STORE.get_meta(job_id) or {}
+    # Timings arrive after the final status, once persisting it has been timed
+    if job.get("status") in FINISHED_STATUSES and set(fields) != {"timings"}:
+        return
+    update_job(job_id, **fields)
+
+
+def job_in_flight(job_id: str) -> bool:
+    """Still queued or running: a job that finished or was cancelled keeps its final status"""
+    job = JOB_STORE.get_meta(job_id)
+    return job is not None and job.get("status") not in FINISHED_STATUSES
+
+
+def on_job_timeout(job_id: str):
+    if not job_in_flight(job_id):
+        return
+    print(f"Job {job_id} exceeded its {JOB_TIMEOUT_SECONDS:.0f}s budget")
+    update_job(job_id, status="error", progress=100, result=None,
+               error=f"Job exceeded its {JOB_TIMEOUT_SECONDS:.0f}s budget")
+
+
+def on_worker_crash(job_id: str, exitcode: int):
+    if not job_in_flight(job_id):
+        return
+    print(f"Worker for job {job_id} exited with code {exitcode}")
+    update_job(job_id, status="error", progress=100, result=None,
+               error=f"Worker process exited with code {exitcode}")
+
+
+def create_executor():
+    if EXECUTOR_BACKEND == "process":
+        return ProcessJobRunner(
+            apply_worker_update, on_job_timeout, on_worker_crash,
+            MAX_WORKERS, MAX_QUEUE_DEPTH, JOB_TIMEOUT_SECONDS
+        )
+    if EXECUTOR_BACKEND == "thread":
+        return ThreadJobRunner(on_job_timeout, MAX_WORKERS, MAX_QUEUE_DEPTH, JOB_TIMEOUT_SECONDS)
+    raise ValueError(f"Invalid ORTOOLS_EXECUTOR: {EXECUTOR_BACKEND}")
+
+
+EXECUTOR = create_executor()
+threading.Thread(target=run_job_janitor, daemon=True, name="ortools-job-janitor").start()
+
+
+@app.route("/ortools/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    job = JOBS.get(job_id) or JOB_STORE.get_meta(job_id)
+    if not job:
+        return jsonify({"status": "error", "error": "Job not found"}), 404
+    
+    if job.get("status") in FINISHED_STATUSES:
+        return jsonify({"job_id": job_id, "status": job.get("status"), "error": "Job already finished"}), 409
+    
+    # Mark first so late updates from the worker are ignored
+    update_job(job_id, status="cancelled", progress=100, result=None, error="Cancelled by request")
+    EXECUTOR.cancel(job_id)
+    
+    return jsonify({"job_id": job_id, "status": "cancelled"})
+
+
+@app.route("/ortools/jobs/<job_id>/delta", methods=["POST"])
+def reoptimize_job(job_id):
+    """Apply added/removed/completed orders and stock changes to a finished job"""
+    try:
+        base_job = JOBS.get(job_id) or JOB_STORE.get_meta(job_id)
+        if not base_job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+        if base_job.get("status") != "done":
+            return jsonify({"job_id": job_id, "status": base_job.get("status"),
+                            "error": "Only finished jobs can be re-optimized"}), 409
+        if base_job.get("strategy") == AssignmentStrategy.COMPARE:
+            return jsonify({"error": "Comparison jobs cannot be re-optimized; submit the chosen strategy"}), 400
+        
+        base_payload = load_job_payload(job_id)
+        if base_payload is None:
+            return jsonify({"status": "error", "error": "Job payload no longer available"}), 404
+        # The plan's stops are sub-orders, which a delta on the original orders cannot line up with
+        if base_payload.get("fulfillment") == "split":
+            return jsonify({"error": "Split-delivery jobs cannot be re-optimized; submit the updated orders as a new job"}), 400
+        
+        delta = request.get_json(force=True) or {}
+        payload, kept = apply_order_delta(base_payload, delta)
+        if not payload["orders"]:
+            return jsonify({"error": "No orders left after applying the delta"}), 400
+        
+        strategy = base_job.get("strategy") or AssignmentStrategy.ORTOOLS_BALANCED
+        solver_params = dict(payload.get("solver_params") or {})
+        if "time_limit_seconds" not in (delta.get("solver_params") or {}):
+            solver_params["time_limit_seconds"] = min(
+                float(solver_params.get("time_limit_seconds", DELTA_TIME_LIMIT_SECONDS)),
+                DELTA_TIME_LIMIT_SECONDS
+            )
+        payload["solver_params"] = solver_params
+        
+        try:
+            resolve_solver_params(solver_params)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        delta_job_id = str(uuid.uuid4())
+        save_job(delta_job_id, {
+            "status": "running",
+            "progress": 0,
+            "result": None,
+            "error": None,
+            "payload": payload,
+            "strategy": strategy,
+            "base_job_id": job_id
+        })
+        
+        try:
+            EXECUTOR.submit(delta_job_id, solve_delta_job, job_id, payload, strategy, kept)
+        except QueueFullError as e:
+            delete_job(delta_job_id)
+            response = jsonify({"error": f"Optimizer busy: {e}"})
+            response.headers["Retry-After"] = "10"
+            return response, 429
+        
+        return jsonify({"job_id": delta_job_id, "base_job_id": job_id, "status": "running", "strategy": strategy})
+    
+    except Exception as e:
+        print(f"ERROR in /delta: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/ortools/jobs/<job_id>/profile", methods=["GET"])
+def job_profile(job_id):
+    """cProfile of a job submitted with profile=true: top functions as text, or ?format=pstats for the dump"""
+    path = profile_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({"error": "No profile for this job; submit it with profile=true"}), 404
+    if request.args.get("format") == "pstats":
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True,
+                         download_name=f"{job_id}.prof")
+    sort = request.args.get("sort", "cumulative")
+    try:
+        summary = profile_summary(path, sort)
+    except KeyError:
+        return jsonify({"error": f"Invalid sort key: {sort}"}), 400
+    return Response(summary, mimetype="text/plain")
+
+
+# ---------------- Batches ----------------
+def batch_problem_payloads(batch: dict) -> List[Tuple[str, dict]]:
+    """(key, payload) per problem of a batch request; 'defaults' fill in what a problem leaves out"""
+    defaults = batch.get("defaults") or {}
+    problems = []
+    for idx, problem in enumerate(batch.get("problems") or []):
+        payload = {**defaults, **problem}
+        problems.append((str(payload.pop("key", idx)), payload))
+    return problems
+
+
+def validate_batch_problem(payload: dict) -> str | None:
+    if not payload.get("warehouses"):
+        return "Missing 'warehouses'"
+    if not payload.get("orders"):
+        return "Missing 'orders'"
+    return validate_options(payload, payload.get("strategy", AssignmentStrategy.ORTOOLS_BALANCED))
+
+
+def cancel_batch_problems(entries: List[dict]):
+    """Cancel the unfinished problems a batch queued itself (shared cached jobs are left alone)"""
+    for entry in entries:
+        if entry["cached"] or job_status(entry["job_id"]) in FINISHED_STATUSES:
+            continue
+        update_job(entry["job_id"], status="cancelled", progress=100, result=None, error="Batch cancelled")
+        EXECUTOR.cancel(entry["job_id"])
+
+
+def feed_batch(batch_id: str, entries: List[dict], pending: List[tuple]):
+    """
+    Submit a batch's problems as workers free up, then follow them until
+    all have finished, keeping the batch's progress and status current.
+    Only idle workers are used, so a large batch never fills the queue
+    that interactive requests share. Cancelling the batch
+    (DELETE /ortools/jobs/<batch_id>) cancels its problems.
+    """
+    pending = list(pending)
+    progress = 0
+    try:
+        while True:
+            if job_status(batch_id) != "running":
+                cancel_batch_problems(entries)
+                return
+            
+            while pending and EXECUTOR.active_count() < EXECUTOR.max_workers:
+                job_id, payload, strategy = pending[0]
+                try:
+                    EXECUTOR.submit(job_id, solve_routing_job, payload, strategy)
+                except QueueFullError:
+                    break
+                pending.pop(0)
+            
+            # Evicted problems count as finished
+            finished = sum(1 for entry in entries if job_status(entry["job_id"]) in FINISHED_STATUSES + (None,))
+            if finished == len(entries):
+                update_job(batch_id, status="done", progress=100)
+                return
+            if finished * 100 // len(entries) != progress:
+                progress = finished * 100 // len(entries)
+                update_job(batch_id, progress=progress)
+            time.sleep(BATCH_POLL_SECONDS)
+    
+    except Exception as e:
+        print(f"ERROR in batch {batch_id}: {e}")
+        update_job(batch_id, status="error", progress=100, error=str(e))
+        cancel_batch_problems(entries)
+
+
+@app.route("/ortools/batch", methods=["POST"])
+def optimize_batch():
+    """
+    Many independent problems in one request, e.g. one per base or delivery
+    date: {"problems": [{"key", "warehouses", "orders", ...}], "defaults": {...}}.
+    Each problem becomes its own job on the shared executor (and result
+    cache); GET /ortools/batch/<batch_id> returns the per-problem results.
+    """
+    try:
+        batch = request.get_json(force=True) or {}
+        problems = batch_problem_payloads(batch)
+        
+        if not problems:
+            return jsonify({"error": "Missing 'problems' in payload"}), 400
+        if len(problems) > BATCH_MAX_PROBLEMS:
+            return jsonify({"error": f"Too many problems: {len(problems)} > {BATCH_MAX_PROBLEMS}"}), 400
+        if len({key for key, _ in problems}) < len(problems):
+            return jsonify({"error": "Problem keys must be unique"}), 400
+        for key, payload in problems:
+            error = validate_batch_problem(payload)
+            if error:
+                return jsonify({"error": f"Problem {key}: {error}"}), 400
+        
+        batch_id = str(uuid.uuid4())
+        entries = []
+        pending = []
+        for key, payload in problems:
+            strategy = payload.get("strategy", AssignmentStrategy.ORTOOLS_BALANCED)
+            job_id = str(uuid.uuid4())
+            save_job(job_id, {
+                "status": "running",
+                "progress": 0,
+                "result": None,
+                "error": None,
+                "payload": payload,
+                "strategy": strategy,
+                "batch_id": batch_id
+            })
+            
+            if payload.get("use_cache", True) and not payload.get("profile"):
+                fingerprint = payload_fingerprint({**payload, "strategy": strategy})
+                cached_job_id, _ = RESULT_CACHE.claim(fingerprint, job_id, job_status)
+                if cached_job_id:
+                    delete_job(job_id)
+                    entries.append({"key": key, "job_id": cached_job_id, "strategy": strategy, "cached": True})
+                    continue
+            
+            entries.append({"key": key, "job_id": job_id, "strategy": strategy, "cached": False})
+            pending.append((job_id, payload, strategy))
+        
+        save_job(batch_id, {
+            "status": "running",
+            "progress": 0,
+            "result": None,
+            "error": None,
+            "strategy": "batch",
+            "problems": entries
+        })
+        threading.Thread(target=feed_batch, args=(batch_id, entries, pending), daemon=True,
+                         name=f"ortools-batch-{batch_id}").start()
+        
+        return jsonify({"batch_id": batch_id, "status": "running", "problems": entries})
+    
+    except Exception as e:
+        print(f"ERROR in /batch: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/ortools/batch/<batch_id>", methods=["GET"])
+def batch_status(batch_id):
+    """
+    Status of every problem in a batch, with results of finished ones
+    unless ?results=false; ?format= as for /ortools/status
+    """
+    try:
+        fmt = parse_response_format()
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    batch = JOBS.get(batch_id) or JOB_STORE.get_meta(batch_id)
+    if not batch or "problems" not in batch:
+        return jsonify({"status": "error", "error": "Batch not found"}), 404
+    
+    include_results = request.args.get("results", "true").lower() != "false"
+    problems = []
+    by_status = {}
+    for entry in batch["problems"]:
+        job = JOBS.get(entry["job_id"]) or JOB_STORE.get_meta(entry["job_id"]) or {}
+        status = job.get("status", "expired")
+        by_status[status] = by_status.get(status, 0) + 1
+        problem = {**entry, "status": status, "progress": job.get("progress")}
+        if job.get("error"):
+            problem["error"] = job["error"]
+        if include_results and status == "done":
+            problem["result"] = format_result((load_job(entry["job_id"]) or {}).get("result"), fmt)
+        problems.append(problem)
+    
+    return format_response({
+        "batch_id": batch_id,
+        "status": batch.get("status"),
+        "progress": batch.get("progress"),
+        "problems_count": len(problems),
+        "problems_by_status": by_status,
+        "problems": problems
+    }, fmt)
+
+
+# ---------------- Job Status ----------------
+STATUS_FIELDS = ("status", "progress", "result", "prepared", "best_objective", "best_routes", "error", "strategy",
+                 "timings")
+# Kept in job_results: selecting them costs reading and parsing the whole plan
+RESULT_STATUS_FIELDS = ("result", "prepared")
+PROGRESS_EVENT_FIELDS = ("status", "progress", "best_objective", "solutions_found")
+
+
+def parse_status_fields(value: str | None) -> List[str]:
+    """?fields=status,progress -> ['status', 'progress']; every field when absent"""
+    if not value:
+        return list(STATUS_FIELDS)
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    if not fields or any(field not in STATUS_FIELDS for field in fields):
+        raise ValueError(f"Invalid fields. Must be a comma-separated subset of: {list(STATUS_FIELDS)}")
+    return fields
+
+
+def load_job_fields(job_id: str, fields: List[str]) -> dict | None:
+    """The job row, plus result and prepared, or best_routes, only when selected"""
+    if any(field in RESULT_STATUS_FIELDS for field in fields):
+        return load_job(job_id)
+    return JOB_STORE.get_meta(job_id, best_routes="best_routes" in fields)
+
+
+def parse_wait_seconds(value: str | None) -> float:
+    """?wait=<seconds> for long polls, clamped to STATUS_LONG_POLL_MAX_SECONDS"""
+    try:
+        wait = float(value or 0)
+    except ValueError:
+        raise ValueError("wait must be a number of seconds")
+    if not math.isfinite(wait) or wait < 0:
+        raise ValueError("wait must be a finite, non-negative number of seconds")
+    return min(wait, STATUS_LONG_POLL_MAX_SECONDS)
+
+
+def parse_response_format(streaming: bool = False) -> str:
+    """
+    ?format=json|compact|msgpack; without it, msgpack when the Accept
+    header prefers it and the server has it, else the full JSON
+    """
+    fmt = request.args.get("format")
+    if fmt is None:
+        offered = ["application/json", MSGPACK_MIMETYPE] if "msgpack" in available_formats() else ["application/json"]
+        return "msgpack" if request.accept_mimetypes.best_match(offered) == MSGPACK_MIMETYPE else "json"
+    allowed = [f for f in RESPONSE_FORMATS if not (streaming and f == "msgpack")]
+    if fmt not in allowed:
+        raise ValueError(f"Invalid format. Must be one of: {allowed}")
+    if fmt not in available_formats():
+        raise ValueError("msgpack is not installed on this server; use format=compact")
+    return fmt
+
+
+def format_result(result: dict | None, fmt: str) -> dict | None:
+    """A stored plan in the requested format; compact and msgpack share the compact layout"""
+    if fmt == "json" or not result:
+        return result
+    return compact_result(result)
+
+
+def format_response(body: dict, fmt: str) -> Response:
+    if fmt == "msgpack":
+        return Response(pack_msgpack(body), mimetype=MSGPACK_MIMETYPE)
+    return jsonify(body)
+
+
+def status_etag(job: dict, fields: List[str], fmt: str = "json") -> str:
+    # Every update_job() bumps updated_at, so it versions the whole record
+    version = f"{job['updated_at']!r}:{','.join(fields)}:{fmt}"
+    return hashlib.sha1(version.encode("utf-8")).hexdigest()[:20]
+
+
+def status_body(job: dict, fields: List[str], fmt: str = "json") -> dict:
+    defaults = {"status": "unknown", "progress": 0}
+    body = {field: job.get(field, defaults.get(field)) for field in fields}
+    if "result" in body:
+        body["result"] = format_result(body["result"], fmt)
+    return body
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
 @app.route("/ortools/status/<job_id>", methods=["GET"])
 def status(job_id):
-    job = JOBS.get(job_id) or load_job(job_id)
+    """
+    Job status. ?fields= picks the keys to return, so progress polls skip the
+    plan, and ?format=compact|msgpack sends the plan with each location
+    once (see compact_result). Responses carry an ETag; If-None-Match
+    answers 304 when nothing changed, and with ?wait=<seconds> the request
+    is held (long poll) until the job changes or the wait runs out.
+    """
+    try:
+        fields = parse_status_fields(request.args.get("fields"))
+        fmt = parse_response_format()
+        wait = parse_wait_seconds(request.args.get("wait"))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    
+    # The ETag only needs updated_at; the selected fields are loaded once below
+    job = JOB_STORE.get_meta(job_id, best_routes=False)
     if not job:
         return jsonify({"status": "error", "error": "Job not found"}), 404
     
-    return jsonify({
-        "status": job.get("status", "unknown"),
-        "progress": job.get("progress", 0),
-        "result": job.get("result"),
-        "error": job.get("error"),
-        "strategy": job.get("strategy")
-    })
+    deadline = time.monotonic() + wait
+    while request.if_none_match.contains(status_etag(job, fields, fmt)):
+        if job.get("status") in FINISHED_STATUSES or time.monotonic() >= deadline:
+            response = app.response_class(status=304)
+            response.set_etag(status_etag(job, fields, fmt))
+            return response
+        time.sleep(STATUS_POLL_SECONDS)
+        job = JOB_STORE.get_meta(job_id, best_routes=False)
+        if not job:
+            return jsonify({"status": "error", "error": "Job not found"}), 404
+    
+    job = load_job_fields(job_id, fields) or job
+    response = format_response(status_body(job, fields, fmt), fmt)
+    response.set_etag(status_etag(job, fields, fmt))
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+@app.route("/ortools/status/<job_id>/stream", methods=["GET"])
+def status_stream(job_id):
+    """
+    Server-Sent Events: a "progress" event (status, progress, best
+    objective) whenever the job changes, then one "finished" event with the
+    ?fields= selection (default: everything, as /ortools/status returns),
+    in ?format=json or compact.
+    """
+    try:
+        fields = parse_status_fields(request.args.get("fields"))
+        fmt = parse_response_format(streaming=True)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    if not JOB_STORE.get_meta(job_id, best_routes=False):
+        return jsonify({"status": "error", "error": "Job not found"}), 404
+    
+    def events():
+        last_version = None
+        last_sent = time.monotonic()
+        while True:
+            job = JOB_STORE.get_meta(job_id, best_routes=False)
+            if not job:
+                yield sse_event("finished", {"status": "error", "error": "Job not found"})
+                return
+            if job.get("status") in FINISHED_STATUSES:
+                yield sse_event("finished", status_body(load_job_fields(job_id, fields) or job, fields, fmt))
+                return
+            if job["updated_at"] != last_version:
+                last_version = job["updated_at"]
+                last_sent = time.monotonic()
+                yield sse_event("progress", status_body(job, PROGRESS_EVENT_FIELDS))
+            elif time.monotonic() - last_sent >= STATUS_KEEPALIVE_SECONDS:
+                # Comment line: keeps proxies from closing an idle stream
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(STATUS_POLL_SECONDS)
+    
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/health", methods=["GET"])
 def health():
+    jobs_by_status = JOB_STORE.count_by_status()
     return jsonify({
         "status": "healthy",
-        "jobs_count": len(JOBS),
-        "active_jobs": len([j for j in JOBS.values() if j.get("status") in ["running", "processing"]])
+        "jobs_count": sum(jobs_by_status.values()),
+        "active_jobs": jobs_by_status.get("running", 0) + jobs_by_status.get("processing", 0),
+        "jobs_by_status": jobs_by_status,
+        "cached_jobs": len(JOBS),
+        "result_cache": RESULT_CACHE.stats(),
+        "matrix_providers": {
+            "default": MATRIX_PROVIDER,
+            "available": available_providers(ROAD_GRAPH_PATH)
+        },
+        "traffic_profiles": available_profiles(TRAFFIC_PROFILES_DIR),
+        "executor": {
+            "backend": EXECUTOR.backend,
+            "max_workers": EXECUTOR.max_workers,
+            "max_queue_depth": EXECUTOR.max_queue,
+            "queued_or_running": EXECUTOR.active_count(),
+            "job_timeout_seconds": JOB_TIMEOUT_SECONDS
+        }
     })
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition: job phase histograms, executor and job gauges, cache counters"""
+    jobs_by_status = JOB_STORE.count_by_status()
+    cache = RESULT_CACHE.stats()
+    active = EXECUTOR.active_count()
+    processing = jobs_by_status.get("processing", 0)
+    
+    lines = JOB_PHASE_SECONDS.render() + JOB_DURATION_SECONDS.render()
+    lines += render_values("ortools_executor_active_jobs", "gauge", "Jobs queued or running on the executor",
+                           {(): active})
+    lines += render_values("ortools_executor_queue_depth", "gauge", "Jobs waiting for a free worker",
+                           {(): max(active - processing, 0)})
+    lines += render_values("ortools_executor_max_workers", "gauge", "Jobs that may run at once",
+                           {(): EXECUTOR.max_workers})
+    lines += render_values("ortools_executor_max_queue_depth", "gauge", "Queued plus running jobs accepted",
+                           {(): EXECUTOR.max_queue})
+    lines += render_values("ortools_jobs_running", "gauge", "Jobs currently solving", {(): processing})
+    lines += render_values("ortools_jobs", "gauge", "Stored jobs by status",
+                           {(status,): count for status, count in jobs_by_status.items()}, ("status",))
+    lines += render_values("ortools_result_cache_lookups_total", "counter", "Result cache lookups by outcome",
+                           {(outcome,): cache[outcome] for outcome in ("hits", "coalesced", "misses")}, ("outcome",))
+    lines += render_values("ortools_result_cache_entries", "gauge", "Result cache entries", {(): cache["entries"]})
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+from typing import List
+
+import numpy as np
+
+
+MINUTES_PER_DAY = 1440
+DEFAULT_BUCKET_MINUTES = 15
+
+
+# ---------------- Speed Profiles ----------------
+class TrafficProfile:
+    """
+    Historical travel speed per time-of-day bucket (e.g. 96 x 15 minutes).
+    Speed is constant within a bucket, so the meters a van covers since
+    midnight are a piecewise-linear, strictly increasing function of the
+    clock. Both it and its inverse are precomputed at the bucket
+    boundaries, and a leg leaving at t arrives at
+    clock_at(meters_covered(t) + meters): a vehicle never overtakes one
+    that left earlier, and legs crossing a rush hour slow down only for
+    the part inside it.
+    """
+
+    def __init__(self, speeds_kmh: List[float], bucket_minutes: int = DEFAULT_BUCKET_MINUTES,
+                 day_start_minute: int = 0, name: str | None = None):
+        speeds = np.asarray(speeds_kmh, dtype=np.float64)
+        if bucket_minutes <= 0 or MINUTES_PER_DAY % bucket_minutes:
+            raise ValueError(f"Traffic profile bucket_minutes must divide {MINUTES_PER_DAY}")
+        if speeds.ndim != 1 or len(speeds) * bucket_minutes != MINUTES_PER_DAY:
+            raise ValueError(f"Traffic profile needs {MINUTES_PER_DAY // bucket_minutes} speeds_kmh "
+                             f"for {bucket_minutes}-minute buckets, got {speeds.size}")
+        if not np.all(np.isfinite(speeds)) or np.any(speeds <= 0):
+            raise ValueError("Traffic profile speeds_kmh must be positive")
+        self.name = name
+        self.bucket_minutes = bucket_minutes
+        self.day_start_minute = day_start_minute
+        self.speeds_kmh = speeds
+        self._clock = np.arange(len(speeds) + 1, dtype=np.float64) * bucket_minutes
+        self._covered = np.concatenate([[0.0], np.cumsum(speeds * 1000 / 60 * bucket_minutes)])
+        self._day_meters = self._covered[-1]
+
+    def meters_covered(self, clock):
+        """Meters driven from midnight of day 0 to clock (minutes, may run past midnight)"""
+        days, minute = np.divmod(np.asarray(clock, dtype=np.float64), MINUTES_PER_DAY)
+        return days * self._day_meters + np.interp(minute, self._clock, self._covered)
+
+    def clock_at(self, meters):
+        """Inverse of meters_covered()"""
+        days, rest = np.divmod(np.asarray(meters, dtype=np.float64), self._day_meters)
+        return days * MINUTES_PER_DAY + np.interp(rest, self._covered, self._clock)
+
+    def travel_minutes(self, departures, meters) -> np.ndarray:
+        """
+        Whole minutes (rounded up) to drive meters when leaving at
+        departures, in minutes since the shift started at day_start_minute.
+        Broadcasts like NumPy: (N, 1) departures against an (N, M) matrix
+        times every row at its own departure.
+        """
+        clock = np.asarray(departures, dtype=np.float64) + self.day_start_minute
+        arrival = self.clock_at(self.meters_covered(clock) + np.asarray(meters, dtype=np.float64))
+        # The epsilon keeps exact bucket multiples from rounding up a minute
+        return np.ceil(arrival - clock - 1e-9).astype(np.int64)
+
+    def describe(self) -> dict:
+        return {
+            'name': self.name,
+            'bucket_minutes': self.bucket_minutes,
+            'day_start_minute': self.day_start_minute,
+            'min_speed_kmh': round(float(self.speeds_kmh.min()), 1),
+            'max_speed_kmh': round(float(self.speeds_kmh.max()), 1),
+        }
+
+
+# ---------------- Providers ----------------
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def read_profile_file(path: str) -> dict:
+    """{'speeds_kmh': [...], 'bucket_minutes': 15} as written by an offline speed-history export"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def available_profiles(profiles_dir: str | None) -> List[str]:
+    if not profiles_dir or not os.path.isdir(profiles_dir):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(profiles_dir) if name.endswith(".json"))
+
+
+def resolve_traffic_profile(value, profiles_dir: str | None, day_start_minute: int) -> TrafficProfile | None:
+    """
+    Map a solver_params 'traffic_profile' value to a TrafficProfile: None
+    (static average speed), the name of a <name>.json file in
+    profiles_dir, or an inline {'speeds_kmh': [...], 'bucket_minutes': 15}.
+    Files are read once per process.
+    """
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        spec, name = value, None
+    elif isinstance(value, str):
+        if value not in available_profiles(profiles_dir):
+            raise ValueError(f"Unknown traffic_profile {value!r}. Available: {available_profiles(profiles_dir)}")
+        path = os.path.join(profiles_dir, f"{value}.json")
+        with _profiles_lock:
+            if path not in _profiles:
+                _profiles[path] = read_profile_file(path)
+            spec = _profiles[path]
+        name = value
+    else:
+        raise ValueError("traffic_profile must be a profile name or {'speeds_kmh': [...], 'bucket_minutes': ...}")
+    if not isinstance(spec, dict) or not isinstance(spec.get('speeds_kmh'), list):
+        raise ValueError("traffic_profile needs a speeds_kmh list")
+    return TrafficProfile(spec['speeds_kmh'], int(spec.get('bucket_minutes', DEFAULT_BUCKET_MINUTES)),
+                          day_start_minute, name)